@@ -1,36 +1,155 @@
 '''
 main.py
 This file is the main entry point for the project.
+Every command imports only what it needs; the utility commands can also run on a pre-warmed fork server
+(start it with "python main.py fork-server"). "python main.py --profile-startup" reports the import cost of the package.
+Any command accepts "--set NAME=VALUE" and "--settings FILE" to override the constants (see src/settings.py).
 '''
 
 import sys
 
-from PyQt5.QtWidgets import QApplication
+if __name__ == '__main__' and '--profile-startup' in sys.argv:
+    import importlib.util
+    import os
 
-from src import *
+    # The profiler is loaded without the package and installed before its first import,
+    # so that src/__init__, the constants and the settings layer are measured too
+    spec = importlib.util.spec_from_file_location("src.startup_profile", os.path.join(os.path.dirname(os.path.abspath(__file__)), "src", "startup_profile.py"))
+    startup_profile = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = startup_profile
+    spec.loader.exec_module(startup_profile)
+    # e.g. python main.py --profile-startup [src.ui src.asr ...]
+    startup_profile.profile_startup([arg for arg in sys.argv[1:] if arg != '--profile-startup'])
+    sys.exit(0)
 
+from src.constant import *
+from src.settings import strip_cli, describe
 
-if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        if sys.argv[1] == 'example':
+
+def run_app(scenario: str = DEFAULT_SCENARIO) -> int:
+    '''
+    Runs the Qt application with the given scenario profile.
+    '''
+    from PyQt5.QtWidgets import QApplication
+    from src.ui import AppMainWindow
+
+    app = QApplication(sys.argv)
+    window = AppMainWindow(scenario = scenario)
+    window.show()
+    return app.exec_()
+
+def run_command(argv: list) -> int:
+    '''
+    Runs the command given on the command line.
+
+    Args:
+        argv (list): The command line.
+
+    Returns:
+        int: The exit code.
+    '''
+    if len(argv) > 1:
+        if argv[1] == 'example':
+            from src.example import call_stentts
             call_stentts()
-        elif sys.argv[1] == 'record':
+        elif argv[1] == 'record':
+            from src.voice_change import record
             record()
             # result_url = exec_voice_change()
             # play_mp3_from_url(result_url)
-        elif sys.argv[1] == 'backup':
-            app = QApplication(sys.argv)
-            window = AppMainWindowBackup()
-            window.show()
-            sys.exit(app.exec_())
-        elif sys.argv[1] == 'exec_voice':
+        elif argv[1] == 'backup':
+            return run_app("backup")
+        elif argv[1] == 'scenario':
+            # e.g. python main.py scenario backup
+            return run_app(argv[2] if len(argv) > 2 else DEFAULT_SCENARIO)
+        elif argv[1] == 'exec_voice':
+            from src.voice_change import exec_voice_change2
             # exec_voice_change()
             exec_voice_change2()
+        elif argv[1] == 'build-prompts':
+            from src.prompt_build import build_prompts
+            # e.g. python main.py build-prompts en jp --force, or --adopt to keep the existing clips missing from the manifest
+            languages = [arg for arg in argv[2:] if not arg.startswith('--')]
+            build_prompts(languages, force = '--force' in argv, adopt = '--adopt' in argv)
+        elif argv[1] == 'bench-asr':
+            from src.asr_benchmark import benchmark_asr
+            # e.g. python main.py bench-asr output.wav other.wav
+            benchmark_asr(argv[2:] or [WAVE_OUTPUT_FILENAME])
+        elif argv[1] == 'model-store':
+            from src.model_store import pin_model, verify_model, benchmark_model_store
+            # python main.py model-store pin|pin-tts|verify|bench
+            action = argv[2] if len(argv) > 2 else 'verify'
+            if action == 'pin':
+                pin_model()
+            elif action == 'pin-tts':
+                from src.tts_backend import pin_local_models
+                pin_local_models()
+            elif action == 'verify':
+                verify_model()
+                print("Pinned model is intact.")
+            elif action == 'bench':
+                benchmark_model_store(argv[3] if len(argv) > 3 else WAVE_OUTPUT_FILENAME)
+            else:
+                raise Exception("Invalid model-store action.")
+        elif argv[1] == 'transcode-videos':
+            from src.video_transcode import transcode_videos
+            # e.g. python main.py transcode-videos --force
+            transcode_videos(force = '--force' in argv)
+        elif argv[1] == 'sessions':
+            from src.session_archive import query_sessions, export_session, describe_session
+            # e.g. python main.py sessions --from 2024-10-26 --to 2024-10-27 --language jp --min-latency 2 --max-latency 5
+            # or python main.py sessions export 12 ./exported
+            if len(argv) > 2 and argv[2] == 'export':
+                for path in export_session(int(argv[3]), argv[4] if len(argv) > 4 else "."):
+                    print(path)
+                return 0
+            options = dict(zip(argv[2::2], argv[3::2]))
+            sessions = query_sessions(
+                date_from = options.get('--from'),
+                date_to = options.get('--to'),
+                language = options.get('--language'),
+                min_latency = float(options['--min-latency']) if '--min-latency' in options else None,
+                max_latency = float(options['--max-latency']) if '--max-latency' in options else None,
+            )
+            for row in sessions:
+                print(describe_session(row))
+            print(f"{len(sessions)} sessions.")
+        elif argv[1] == 'settings':
+            import src.constant
+            # e.g. python main.py settings --set RATE=44100
+            print(describe(vars(src.constant)))
+        elif argv[1] == 'mock-sten':
+            from src.mock_sten import run_mock_servers
+            # e.g. python main.py mock-sten 9001:0.2 9002:1.5 (port:delay)
+            run_mock_servers(argv[2:])
+        elif argv[1] == 'sten-stats':
+            from src.tts_endpoints import get_endpoint_pool
+            pool = get_endpoint_pool()
+            pool.check_health()
+            for url, latency in pool.warm_up().items():
+                print(f"{url}: {'failed' if latency is None else f'{latency:.2f} s'}")
+            for stats in pool.stats():
+                print(stats)
+            print(f"Status: {pool.status()}")
         else:
             raise Exception("Invalid command name.")
+        return 0
     else:
-        app = QApplication(sys.argv)
-        window = AppMainWindow()
-        window.show()
-        sys.exit(app.exec_())
+        return run_app()
+
 
+if __name__ == '__main__':
+    # The settings flags have been applied when the constants were imported
+    settings_flags = strip_cli(sys.argv) != sys.argv
+    sys.argv = strip_cli(sys.argv)
+    if len(sys.argv) > 1 and sys.argv[1] == 'fork-server':
+        from src.fork_server import serve
+        serve(run_command)
+    elif len(sys.argv) > 1 and sys.argv[1] in FORK_SERVER_COMMANDS and '--no-fork-server' not in sys.argv and not settings_flags:
+        # The fork server runs with its own settings, so a command with settings flags runs here,
+        # and so does a command whose settings file or environment differs (the server refuses it)
+        from src.fork_server import run_remote
+        exit_code = run_remote(sys.argv)
+        sys.exit(exit_code if exit_code is not None else run_command(sys.argv))
+    else:
+        sys.exit(run_command([arg for arg in sys.argv if arg != '--no-fork-server']))
@@ -1,6 +1,40 @@
-from .asr import recognize_speech
+'''
+src
+
+The public names of the package are imported on first access only, so that a command pays
+only for the modules it uses (PyQt5, torch and ESPnet take seconds to import).
+'''
+
+import importlib
+
 from .constant import *
-from .example import call_stentts
-from .ui import AppMainWindow
-from .ui_backup import AppMainWindow as AppMainWindowBackup
-from .voice_change import record, exec_voice_change, play_mp3_from_url, exec_voice_change2
\ No newline at end of file
+
+# Public name -> (module, attribute)
+LAZY_EXPORTS = {
+    'recognize_speech': ('asr', 'recognize_speech'),
+    'DecodingPolicy': ('asr', 'DecodingPolicy'),
+    'benchmark_asr': ('asr_benchmark', 'benchmark_asr'),
+    'pin_model': ('model_store', 'pin_model'),
+    'verify_model': ('model_store', 'verify_model'),
+    'benchmark_model_store': ('model_store', 'benchmark_model_store'),
+    'call_stentts': ('example', 'call_stentts'),
+    'AppMainWindow': ('ui', 'AppMainWindow'),
+    'record': ('voice_change', 'record'),
+    'exec_voice_change': ('voice_change', 'exec_voice_change'),
+    'play_mp3_from_url': ('voice_change', 'play_mp3_from_url'),
+    'exec_voice_change2': ('voice_change', 'exec_voice_change2'),
+    'build_prompts': ('prompt_build', 'build_prompts'),
+    'get_endpoint_pool': ('tts_endpoints', 'get_endpoint_pool'),
+    'get_tts_router': ('tts_backend', 'get_tts_router'),
+}
+
+def __getattr__(name: str):
+    '''
+    Imports the module of a public name on first access.
+    '''
+    if name not in LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attribute = LAZY_EXPORTS[name]
+    value = getattr(importlib.import_module(f".{module_name}", __name__), attribute)
+    globals()[name] = value
+    return value
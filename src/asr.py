@@ -2,21 +2,266 @@
 asr.py
 
 This file contains the functionalities to recognize speech from audio files.
+The model runs on the CPU; in the "int8" mode the linear layers of the encoder and decoder are
+dynamically quantized, and the number of torch threads is set explicitly.
+Decoding follows a DecodingPolicy: when the beam search does not finish within the latency budget,
+the greedy CTC output of the same encoder pass is returned instead, and the beam search is stopped
+at its next step so that it frees the worker for the next transcription. The budget counts from the
+request, so the wait for the model and the encoder pass take from it; the encoder pass itself cannot
+be interrupted, so a budget spent by then returns the greedy output right after it.
 '''
 
-from reazonspeech.espnet.asr import load_model, transcribe, audio_from_path
-import os
+from .model_store import is_pinned, load_pinned_model, enforce_offline
+# Before huggingface-hub is imported by reazonspeech, which reads its offline flag once
+enforce_offline()
 
-model = load_model()
+from reazonspeech.espnet.asr import load_model, transcribe, audio_from_numpy
+import copy
+import numpy as np
+import threading
+import time
+import torch
 
-def recognize_speech() -> str:
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from scipy.signal import resample_poly
+from .constant import *
+from .audio_file import open_wav
+from .metrics import get_metrics
+
+model = None
+model_lock = threading.Lock()
+last_rtf = 0.0
+transcription_count = 0
+
+# A single worker, so that a beam search that ran out of time never runs concurrently with the next one
+beam_search_executor = ThreadPoolExecutor(max_workers = 1)
+
+ASR_SAMPLE_RATE = 16000
+ASR_PAD_SECONDS = 0.5
+PRE_BEAM_RATIO = 1.5 # The ratio of the pre-beam to the beam, as set up by Speech2Text
+
+
+class DecodingPolicy:
+    '''
+    DecodingPolicy
+    The decoding settings of a transcription.
+
+    Attributes:
+        beam_size (int): The number of hypotheses kept by the beam search.
+        ctc_weight (float): The weight of the CTC score in the beam search (the decoder gets 1 - ctc_weight).
+        maxlenratio (float): The maximum output length as a ratio of the encoder length. 0 means the encoder length.
+        latency_budget (float): The time in seconds from the request after which the greedy CTC output is returned. 0 means no limit.
+    '''
+    def __init__(self, beam_size: int = ASR_BEAM_SIZE, ctc_weight: float = ASR_CTC_WEIGHT, maxlenratio: float = ASR_MAXLENRATIO, latency_budget: float = ASR_LATENCY_BUDGET):
+        '''
+        Constructor
+
+        Args:
+            beam_size (int): The number of hypotheses kept by the beam search.
+            ctc_weight (float): The weight of the CTC score in the beam search.
+            maxlenratio (float): The maximum output length as a ratio of the encoder length.
+            latency_budget (float): The time in seconds after which the greedy CTC output is returned.
+        '''
+        self.beam_size = beam_size
+        self.ctc_weight = ctc_weight
+        self.maxlenratio = maxlenratio
+        self.latency_budget = latency_budget
+
+def load_asr_model(mode: str = ASR_MODE, num_threads: int = ASR_NUM_THREADS):
+    '''
+    Loads the ReazonSpeech model for the given inference mode.
+
+    Args:
+        mode (str): "fp32" for the original weights, or "int8" for dynamically quantized linear layers.
+        num_threads (int): The number of intra-op threads used by torch. 0 keeps the torch default.
+
+    Returns:
+        Speech2Text
+    '''
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+
+    start_time = time.perf_counter()
+    if is_pinned():
+        # Fully offline, from the local model store
+        asr_model = load_pinned_model()
+    else:
+        asr_model = load_model(device = ASR_DEVICE)
+    if mode == "int8":
+        # Quantize in place, so that the beam search scorers keep pointing at the same decoder and CTC modules
+        torch.quantization.quantize_dynamic(asr_model.asr_model, {torch.nn.Linear}, dtype = torch.qint8, inplace = True)
+    elif mode != "fp32":
+        raise Exception(f"Invalid ASR mode: {mode}")
+    print(f"ASR model loaded ({mode}, {torch.get_num_threads()} threads) in {time.perf_counter() - start_time:.1f} s")
+
+    return asr_model
+
+def get_model():
+    '''
+    Returns the shared ASR model, loading it on first use.
+
+    Returns:
+        Speech2Text
+    '''
+    global model
+    with model_lock:
+        if model is None:
+            model = load_asr_model()
+    return model
+
+def preload_model():
+    '''
+    Loads the shared ASR model in a background thread, so that the first transcription does not wait for it.
+    '''
+    threading.Thread(target = get_model, daemon = True).start()
+
+def transcribe_with_rtf(asr_model, audio) -> tuple:
+    '''
+    Transcribes audio and measures the real-time factor (processing time / audio duration).
+
+    Args:
+        asr_model (Speech2Text): The model to use.
+        audio (AudioData): The audio to transcribe.
+
+    Returns:
+        tuple: The transcription text, the processing time in seconds and the real-time factor.
+    '''
+    start_time = time.perf_counter()
+    ret = transcribe(asr_model, audio)
+    elapsed = time.perf_counter() - start_time
+    duration = len(audio.waveform) / audio.samplerate
+    return ret.text, elapsed, elapsed / duration if duration > 0 else 0.0
+
+def tokens_to_text(asr_model, token_ids: list) -> str:
+    '''
+    Converts token ids into text, dropping the blank token.
+
+    Args:
+        asr_model (Speech2Text): The model that produced the tokens.
+        token_ids (list): The token ids.
+
+    Returns:
+        string
+    '''
+    token_ids = [token_id for token_id in token_ids if token_id != 0]
+    return asr_model.tokenizer.tokens2text(asr_model.converter.ids2tokens(token_ids))
+
+def greedy_ctc(asr_model, encoded: torch.Tensor) -> str:
+    '''
+    Decodes the encoder output by taking the best CTC token of every frame.
+
+    Args:
+        asr_model (Speech2Text): The model.
+        encoded (torch.Tensor): The encoder output of one utterance.
+
+    Returns:
+        string
+    '''
+    token_ids = torch.unique_consecutive(asr_model.asr_model.ctc.argmax(encoded)[0]).tolist()
+    return tokens_to_text(asr_model, token_ids)
+
+def beam_search(asr_model, encoded: torch.Tensor, policy: DecodingPolicy, stop: threading.Event = None) -> str:
+    '''
+    Decodes the encoder output with the beam search configured by the policy.
+    The policy is applied to a copy of the search of the model, so that nothing shared with the other
+    transcriptions (transcribe, the benchmark) is changed.
+
+    Args:
+        asr_model (Speech2Text): The model.
+        encoded (torch.Tensor): The encoder output of one utterance.
+        policy (DecodingPolicy): The decoding settings.
+        stop (threading.Event): When set, the search ends at its next step with the hypotheses it has.
+
+    Returns:
+        string
+    '''
+    # A shallow copy shares the scorers and their modules, and owns the settings set below
+    search = copy.copy(asr_model.beam_search)
+    search.beam_size = policy.beam_size
+    search.pre_beam_size = int(PRE_BEAM_RATIO * policy.beam_size)
+    search.do_pre_beam = search.pre_beam_score_key is not None and search.pre_beam_size < search.n_vocab and len(search.part_scorers) > 0
+    search.weights = dict(search.weights, ctc = policy.ctc_weight, decoder = 1.0 - policy.ctc_weight)
+
+    if stop is not None:
+        post_process = type(search).post_process
+        def stoppable_post_process(i, maxlen, *args):
+            # Processing a step as the last one closes every running hypothesis, which ends the search
+            return post_process(search, maxlen - 1 if stop.is_set() else i, maxlen, *args)
+        search.post_process = stoppable_post_process
+    with torch.no_grad():
+        hyps = search(x = encoded[0], maxlenratio = policy.maxlenratio, minlenratio = 0.0)
+    if not hyps:
+        return ""
+    return tokens_to_text(asr_model, hyps[0].yseq[1:-1].tolist())
+
+def decode(asr_model, audio, policy: DecodingPolicy = None, start_time: float = None) -> tuple:
+    '''
+    Transcribes audio within the latency budget of the policy.
+    The encoder runs once; if the beam search is not done when the budget runs out, the greedy CTC output is returned.
+
+    Args:
+        asr_model (Speech2Text): The model.
+        audio (AudioData): The audio to transcribe.
+        policy (DecodingPolicy): The decoding settings. Defaults to the ASR constants.
+        start_time (float): The time.perf_counter() of the request, from which the budget counts. Defaults to now.
+
+    Returns:
+        tuple: The transcription text and whether the greedy fallback was used.
+    '''
+    if policy is None:
+        policy = DecodingPolicy()
+    if start_time is None:
+        start_time = time.perf_counter()
+
+    waveform = np.asarray(audio.waveform, dtype = 'float32')
+    if waveform.ndim > 1:
+        waveform = waveform.mean(axis = 1)
+    if audio.samplerate != ASR_SAMPLE_RATE:
+        waveform = resample_poly(waveform, ASR_SAMPLE_RATE, audio.samplerate).astype('float32')
+    padding = np.zeros(int(ASR_PAD_SECONDS * ASR_SAMPLE_RATE), dtype = 'float32')
+    speech = torch.from_numpy(np.concatenate((padding, waveform, padding))).unsqueeze(0)
+    lengths = torch.tensor([speech.size(1)], dtype = torch.long)
+
+    with torch.no_grad():
+        encoded, _ = asr_model.asr_model.encode(speech, lengths)
+
+    stop = threading.Event()
+    future = beam_search_executor.submit(beam_search, asr_model, encoded, policy, stop)
+    timeout = None
+    if policy.latency_budget > 0:
+        timeout = max(0.0, policy.latency_budget - (time.perf_counter() - start_time))
+    try:
+        return future.result(timeout = timeout), False
+    except TimeoutError:
+        # A running search cannot be cancelled: stop it at its next step
+        stop.set()
+        future.cancel()
+        print("ASR: latency budget exceeded, using greedy CTC output")
+        with torch.no_grad():
+            return greedy_ctc(asr_model, encoded), True
+
+def recognize_speech(policy: DecodingPolicy = None) -> str:
     '''
     Recognizes speech from an audio file using the ReazonSpeech model.
 
+    Args:
+        policy (DecodingPolicy): The decoding settings. Defaults to the ASR constants.
+
     Returns:
         string
     '''
-    audio = audio_from_path(os.path.abspath('output.wav'))
+    global last_rtf, transcription_count
+    # The latency budget counts from here, the wait for the model included
+    start_time = time.perf_counter()
 
-    ret = transcribe(model, audio)
-    return ret.text
\ No newline at end of file
+    # Decode from the mapped recording; a float recording is passed without any copy
+    wav = open_wav(WAVE_OUTPUT_FILENAME)
+    audio = audio_from_numpy(wav.as_float(), wav.samplerate)
+    text, fallback = decode(get_model(), audio, policy, start_time)
+    elapsed = time.perf_counter() - start_time
+    duration = len(audio.waveform) / audio.samplerate
+    last_rtf = elapsed / duration if duration > 0 else 0.0
+    transcription_count += 1
+    get_metrics().record("asr", elapsed)
+    print(f"ASR: {elapsed:.2f} s, RTF {last_rtf:.2f}{' (greedy fallback)' if fallback else ''}{' (first transcription)' if transcription_count == 1 else ''}")
+    return text
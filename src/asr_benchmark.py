@@ -0,0 +1,62 @@
+'''
+asr_benchmark.py
+
+This file compares the accuracy and the latency of the ASR inference modes.
+The original full-precision model is the reference: the other modes are scored by their
+character error rate (CER) against its transcriptions.
+'''
+
+import editdistance
+import os
+
+from reazonspeech.espnet.asr import audio_from_path
+
+from .asr import load_asr_model, transcribe_with_rtf
+from .constant import ASR_NUM_THREADS
+
+
+def benchmark_asr(filenames: list, modes: tuple = ("fp32", "int8"), num_threads: int = ASR_NUM_THREADS, repeat: int = 3):
+    '''
+    Transcribes every file with every mode and prints the latency, the real-time factor and the CER.
+
+    Args:
+        filenames (list): The WAV files to transcribe.
+        modes (tuple): The inference modes to compare. The first one is the reference.
+        num_threads (int): The number of intra-op threads used by torch.
+        repeat (int): The number of timed runs per file, after one warm-up run.
+
+    Returns:
+        dict: The mean latency, real-time factor and CER of each mode.
+    '''
+    audios = [audio_from_path(os.path.abspath(filename)) for filename in filenames]
+    references = None
+    results = {}
+
+    for mode in modes:
+        asr_model = load_asr_model(mode, num_threads)
+        texts, latencies, rtfs = [], [], []
+        for audio in audios:
+            text, _, _ = transcribe_with_rtf(asr_model, audio) # Warm-up
+            for _ in range(repeat):
+                _, elapsed, rtf = transcribe_with_rtf(asr_model, audio)
+                latencies.append(elapsed)
+                rtfs.append(rtf)
+            texts.append(text)
+
+        if references is None:
+            references = texts
+        errors = sum(editdistance.eval(reference, text) for reference, text in zip(references, texts))
+        characters = sum(len(reference) for reference in references)
+
+        results[mode] = {
+            'latency': sum(latencies) / len(latencies),
+            'rtf': sum(rtfs) / len(rtfs),
+            'cer': errors / characters if characters > 0 else 0.0,
+            'texts': texts,
+        }
+        del asr_model
+
+    print(f"{'mode':<6}  {'latency[s]':>10}  {'RTF':>6}  {'CER':>6}")
+    for mode, result in results.items():
+        print(f"{mode:<6}  {result['latency']:>10.3f}  {result['rtf']:>6.3f}  {result['cer']:>6.3f}")
+    return results
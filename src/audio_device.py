@@ -0,0 +1,433 @@
+'''
+audio_device.py
+
+This file manages the audio device of the application.
+A single duplex stream is opened once at startup and kept open: the audio callback writes the
+captured samples into a ring buffer and pulls the samples to be played from a playback queue,
+so recording and playback never pay the device-open latency again.
+Because the callback knows what is being played, the echo of the playback is removed from the capture.
+The capture then goes through the noise suppressor and the automatic gain control.
+'''
+
+import functools
+import queue
+import threading
+import time
+
+import numpy as np
+import sounddevice as sd
+
+from pydub import AudioSegment
+from scipy.signal import resample_poly
+from .constant import RATE, CHANNELS, CHUNK, AUDIO_BUFFER_SECONDS, PRE_ROLL_SECONDS, ECHO_CANCELLATION, NOISE_SUPPRESSION, AUTO_GAIN_CONTROL
+from .echo_cancel import EchoCanceller
+from .noise_suppress import NoiseSuppressor, AutomaticGainControl
+
+
+class RingBuffer:
+    '''
+    RingBuffer
+    A fixed-size circular buffer of audio frames with a single writer (the audio callback).
+    The writer publishes the frames by advancing the frame counter after copying them, so readers never need a lock.
+    Every frame is stored twice (at its position and one capacity further), so any window of up to
+    capacity frames is contiguous in memory and can be returned as a view without copying.
+
+    Attributes:
+        data (np.ndarray): The mirrored storage of the buffer, with shape (2 * capacity, channels).
+        capacity (int): The number of frames kept in the buffer.
+        written (int): The total number of frames written since the buffer was created.
+    '''
+    def __init__(self, capacity: int, channels: int = CHANNELS, dtype: str = 'float32'):
+        '''
+        Constructor
+
+        Args:
+            capacity (int): The number of frames kept in the buffer.
+            channels (int): The number of channels of each frame.
+            dtype (str): The sample format.
+        '''
+        self.data = np.zeros((2 * capacity, channels), dtype = dtype)
+        self.capacity = capacity
+        self.written = 0
+
+    def write(self, block: np.ndarray):
+        '''
+        Appends a block of frames, overwriting the oldest frames when the buffer is full.
+
+        Args:
+            block (np.ndarray): The frames to append, with shape (frames, channels).
+
+        Returns:
+            None
+        '''
+        frames = len(block)
+        if frames > self.capacity:
+            block = block[-self.capacity:]
+        # The kept frames start where the frames dropped from a too large block end
+        start = (self.written + frames - len(block)) % self.capacity
+        end = start + len(block)
+
+        # Write the primary copy, then its mirror
+        self.data[start:end] = block
+        if end <= self.capacity:
+            self.data[start + self.capacity:end + self.capacity] = block
+        else:
+            split = self.capacity - start
+            self.data[start + self.capacity:] = block[:split]
+            self.data[:end - self.capacity] = block[split:]
+        self.written += frames
+
+    def view(self, start_frame: int, frames: int) -> np.ndarray:
+        '''
+        Returns the frames [start_frame, start_frame + frames) as a view into the buffer.
+        The view stays valid until the writer wraps around onto it, so copy it if it must be kept.
+
+        Args:
+            start_frame (int): The absolute index of the first frame.
+            frames (int): The number of frames to return.
+
+        Returns:
+            np.ndarray
+        '''
+        if start_frame < self.written - self.capacity or start_frame + frames > self.written:
+            raise ValueError("The requested frames are not in the ring buffer.")
+        start = start_frame % self.capacity
+        return self.data[start:start + frames]
+
+    def latest(self, frames: int) -> np.ndarray:
+        '''
+        Returns the most recent frames as a view into the buffer.
+
+        Args:
+            frames (int): The number of frames to return.
+
+        Returns:
+            np.ndarray
+        '''
+        frames = min(frames, self.capacity, self.written)
+        return self.view(self.written - frames, frames)
+
+
+class AudioDevice:
+    '''
+    AudioDevice
+    Keeps one callback-driven duplex stream open for capture and playback.
+
+    Attributes:
+        samplerate (int): The sample rate of the stream.
+        channels (int): The number of channels of the stream.
+        blocksize (int): The number of frames processed by each callback.
+        capture (RingBuffer): The captured audio.
+        playback (queue.Queue): The pending playback clips.
+        armed (bool): Whether the captured audio is kept in the ring buffer.
+        echo_cancellers (list): One echo canceller per channel, or None when echo cancellation is disabled.
+        noise_suppressors (list): One noise suppressor per channel, or None when noise suppression is disabled.
+        gain_controls (list): One automatic gain control per channel, or None when it is disabled.
+        capture_delay (int): The number of frames by which the preprocessing delays the capture.
+    '''
+    def __init__(self, samplerate: int = RATE, channels: int = CHANNELS, blocksize: int = CHUNK, buffer_seconds: float = AUDIO_BUFFER_SECONDS):
+        '''
+        Constructor
+
+        Args:
+            samplerate (int): The sample rate of the stream.
+            channels (int): The number of channels of the stream.
+            blocksize (int): The number of frames processed by each callback.
+            buffer_seconds (float): The length of the capture ring buffer in seconds.
+        '''
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize
+        self.capture = RingBuffer(int(buffer_seconds * samplerate), channels)
+        self.playback = queue.Queue()
+
+        self.stream = None
+        self.current_clip = None
+        self.current_position = 0
+        self.current_done = None
+        self.waiters = []
+
+        self.armed = False
+        self.armed_frame = 0
+        self.clock = (time.monotonic(), 0)
+
+        self.echo_cancellers = None
+        if ECHO_CANCELLATION:
+            self.echo_cancellers = [EchoCanceller(blocksize) for _ in range(channels)]
+
+        self.noise_suppressors = None
+        if NOISE_SUPPRESSION:
+            self.noise_suppressors = [NoiseSuppressor(blocksize, samplerate) for _ in range(channels)]
+        self.gain_controls = None
+        if AUTO_GAIN_CONTROL:
+            self.gain_controls = [AutomaticGainControl() for _ in range(channels)]
+        self.capture_delay = blocksize if NOISE_SUPPRESSION else 0
+
+    def start(self):
+        '''
+        Opens the duplex stream. Does nothing if the stream is already open.
+        '''
+        if self.stream is not None:
+            return
+        self.stream = sd.Stream(samplerate = self.samplerate,
+                                blocksize = self.blocksize,
+                                channels = self.channels,
+                                dtype = 'float32',
+                                callback = self.callback)
+        self.stream.start()
+
+    def stop(self):
+        '''
+        Closes the duplex stream.
+        '''
+        if self.stream is None:
+            return
+        self.stream.stop()
+        self.stream.close()
+        self.stream = None
+
+    def callback(self, indata: np.ndarray, outdata: np.ndarray, frames: int, time_info, status):
+        '''
+        The audio callback. Runs on the audio thread and must not block.
+        '''
+        if status:
+            print(status)
+        self.fill_output(outdata)
+        if self.armed:
+            self.capture.write(self.preprocess(self.cancel_echo(indata, outdata)))
+            self.clock = (time.monotonic(), self.capture.written)
+
+        for target, event in list(self.waiters):
+            if self.capture.written >= target:
+                event.set()
+
+    def cancel_echo(self, indata: np.ndarray, outdata: np.ndarray) -> np.ndarray:
+        '''
+        Removes the echo of the output block from the input block.
+
+        Args:
+            indata (np.ndarray): The captured block.
+            outdata (np.ndarray): The block sent to the speaker.
+
+        Returns:
+            np.ndarray
+        '''
+        if self.echo_cancellers is None or len(indata) != self.blocksize:
+            return indata
+        reference = outdata.mean(axis = 1)
+        cleaned = np.empty_like(indata)
+        for channel, echo_canceller in enumerate(self.echo_cancellers):
+            cleaned[:, channel] = echo_canceller.process(indata[:, channel], reference)
+        return cleaned
+
+    def preprocess(self, indata: np.ndarray) -> np.ndarray:
+        '''
+        Suppresses the noise of the input block and applies the automatic gain control.
+
+        Args:
+            indata (np.ndarray): The captured block, after echo cancellation.
+
+        Returns:
+            np.ndarray
+        '''
+        if (self.noise_suppressors is None and self.gain_controls is None) or len(indata) != self.blocksize:
+            return indata
+        cleaned = np.empty_like(indata)
+        for channel in range(self.channels):
+            block = indata[:, channel]
+            if self.noise_suppressors is not None:
+                block = self.noise_suppressors[channel].process(block)
+            if self.gain_controls is not None:
+                block = self.gain_controls[channel].process(block)
+            cleaned[:, channel] = block
+        return cleaned
+
+    def fill_output(self, outdata: np.ndarray):
+        '''
+        Fills the output block from the playback queue, padding with silence.
+
+        Args:
+            outdata (np.ndarray): The output block to fill.
+
+        Returns:
+            None
+        '''
+        filled = 0
+        frames = len(outdata)
+        while filled < frames:
+            if self.current_clip is None:
+                try:
+                    self.current_clip, done = self.playback.get_nowait()
+                except queue.Empty:
+                    break
+                self.current_position = 0
+                self.current_done = done
+
+            count = min(frames - filled, len(self.current_clip) - self.current_position)
+            outdata[filled:filled + count] = self.current_clip[self.current_position:self.current_position + count]
+            filled += count
+            self.current_position += count
+
+            if self.current_position >= len(self.current_clip):
+                self.current_clip = None
+                self.current_done.set()
+        outdata[filled:] = 0
+
+    '''
+    Public functions
+    '''
+    def arm(self):
+        '''
+        Starts keeping the captured audio. The frames captured before arming are never returned.
+        '''
+        self.start()
+        if not self.armed:
+            self.armed_frame = self.capture.written
+            self.clock = (time.monotonic(), self.capture.written)
+            self.armed = True
+
+    def disarm(self):
+        '''
+        Stops keeping the captured audio. Playback continues.
+        '''
+        self.armed = False
+
+    def mark(self, timestamp: float = None) -> int:
+        '''
+        Converts a time.monotonic() timestamp into the absolute index of the frame captured at that time,
+        taking the delay of the preprocessing into account.
+
+        Args:
+            timestamp (float): The timestamp to convert. Defaults to now.
+
+        Returns:
+            int
+        '''
+        if timestamp is None:
+            timestamp = time.monotonic()
+        clock_time, clock_frame = self.clock
+        return max(self.armed_frame, clock_frame + int((timestamp - clock_time) * self.samplerate) + self.capture_delay)
+
+    def recording(self, mark: int, seconds: float, pre_roll: float = PRE_ROLL_SECONDS) -> np.ndarray:
+        '''
+        Waits until the given number of seconds have been captured after the mark, and returns
+        them together with up to pre_roll seconds captured before the mark, as a view into the ring buffer.
+
+        Args:
+            mark (int): The frame index returned by mark().
+            seconds (float): The duration of the recording after the mark.
+            pre_roll (float): The duration kept before the mark. Defaults to PRE_ROLL_SECONDS.
+
+        Returns:
+            np.ndarray
+        '''
+        self.arm()
+        start_frame = max(mark - int(pre_roll * self.samplerate), self.armed_frame, self.capture.written - self.capture.capacity)
+        end_frame = mark + int(seconds * self.samplerate)
+        self.wait_for_frame(end_frame)
+        return self.capture.view(start_frame, end_frame - start_frame)
+
+    def record(self, seconds: float) -> np.ndarray:
+        '''
+        Returns the audio captured during the next given number of seconds, without pre-roll.
+        Only the calling thread waits; the stream keeps running.
+
+        Args:
+            seconds (float): The duration of the recording.
+
+        Returns:
+            np.ndarray
+        '''
+        self.arm()
+        return self.recording(self.mark(), seconds, pre_roll = 0)
+
+    def wait_for_frame(self, target: int, timeout: float = None) -> bool:
+        '''
+        Waits until the given absolute frame has been captured.
+
+        Args:
+            target (int): The absolute index of the frame to wait for.
+            timeout (float): The maximum time to wait in seconds. Defaults to no limit.
+
+        Returns:
+            bool
+        '''
+        if self.capture.written >= target:
+            return True
+        waiter = (target, threading.Event())
+        self.waiters.append(waiter)
+        try:
+            return waiter[1].wait(timeout)
+        finally:
+            self.waiters.remove(waiter)
+
+    def play(self, audio: np.ndarray, samplerate: int = RATE) -> threading.Event:
+        '''
+        Queues audio for playback and returns immediately.
+
+        Args:
+            audio (np.ndarray): The samples to play, as floats in [-1, 1] or as 16-bit integers.
+            samplerate (int): The sample rate of the samples.
+
+        Returns:
+            threading.Event: Set when the clip has been played completely.
+        '''
+        self.start()
+        clip = self.prepare(audio, samplerate)
+        done = threading.Event()
+        self.playback.put((clip, done))
+        return done
+
+    def prepare(self, audio: np.ndarray, samplerate: int) -> np.ndarray:
+        '''
+        Converts audio to the format of the stream.
+
+        Args:
+            audio (np.ndarray): The samples to convert.
+            samplerate (int): The sample rate of the samples.
+
+        Returns:
+            np.ndarray
+        '''
+        if np.issubdtype(audio.dtype, np.integer):
+            audio = audio.astype('float32') / np.iinfo(audio.dtype).max
+        audio = audio.astype('float32', copy = False)
+        if audio.ndim == 1:
+            audio = audio[:, np.newaxis]
+        if audio.shape[1] != self.channels:
+            audio = np.repeat(audio.mean(axis = 1, keepdims = True), self.channels, axis = 1)
+        if samplerate != self.samplerate:
+            audio = resample_poly(audio, self.samplerate, samplerate, axis = 0).astype('float32')
+        return audio
+
+
+@functools.lru_cache(maxsize = None)
+def load_clip(filename: str) -> tuple:
+    '''
+    Decodes an audio file into samples once, so that it can be queued on the audio device.
+
+    Args:
+        filename (str): The path to the audio file.
+
+    Returns:
+        tuple: The samples and the sample rate.
+    '''
+    segment = AudioSegment.from_file(filename)
+    samples = np.array(segment.get_array_of_samples()).reshape(-1, segment.channels)
+    return samples, segment.frame_rate
+
+
+audio_device = None
+
+def get_audio_device() -> AudioDevice:
+    '''
+    Returns the shared audio device, opening its stream on first use.
+
+    Returns:
+        AudioDevice
+    '''
+    global audio_device
+    if audio_device is None:
+        audio_device = AudioDevice()
+        audio_device.start()
+    return audio_device
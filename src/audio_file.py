@@ -0,0 +1,150 @@
+'''
+audio_file.py
+
+This file gives access to WAV files through a memory map, without copying them.
+A MappedWav exposes the whole file as a memoryview (for base64 encoding) and the sample data as a
+read-only numpy view (for playback and ASR), so one recording is read from the page cache once per cycle
+instead of being copied into new bytes objects by every consumer.
+'''
+
+import mmap
+import os
+import struct
+import threading
+import numpy as np
+
+# WAVE format tag -> numpy dtype of each sample size in bytes
+WAV_DTYPES = {
+    1: {1: 'uint8', 2: '<i2', 4: '<i4'}, # PCM
+    3: {4: '<f4', 8: '<f8'}, # IEEE float
+}
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class MappedWav:
+    '''
+    MappedWav
+    A WAV file mapped in memory.
+
+    Attributes:
+        filename (str): The path to the file.
+        samplerate (int): The sample rate.
+        channels (int): The number of channels.
+        raw (memoryview): The whole file.
+        samples (np.ndarray): The samples, one row per frame, as a read-only view into the map.
+    '''
+    def __init__(self, filename: str):
+        '''
+        Constructor
+
+        Args:
+            filename (str): The path to the WAV file.
+        '''
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self.map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        self.raw = memoryview(self.map)
+        self.parse()
+
+    def parse(self):
+        '''
+        Reads the fmt chunk and builds the view of the data chunk.
+        '''
+        if self.raw[:4] != b'RIFF' or self.raw[8:12] != b'WAVE':
+            raise ValueError(f"{self.filename} is not a WAV file.")
+
+        format_tag = None
+        offset = 12
+        while offset + 8 <= len(self.raw):
+            chunk_id = bytes(self.raw[offset:offset + 4])
+            chunk_size, = struct.unpack_from('<I', self.raw, offset + 4)
+            body = offset + 8
+            if chunk_id == b'fmt ':
+                format_tag, self.channels, self.samplerate, _, block_align, bits = struct.unpack_from('<HHIIHH', self.raw, body)
+                if format_tag == WAVE_FORMAT_EXTENSIBLE:
+                    # The real format tag is the start of the sub-format GUID
+                    format_tag, = struct.unpack_from('<H', self.raw, body + 24)
+            elif chunk_id == b'data':
+                if format_tag is None:
+                    raise ValueError(f"{self.filename} has no fmt chunk before its data.")
+                dtype = WAV_DTYPES.get(format_tag, {}).get(block_align // self.channels)
+                if dtype is None:
+                    raise ValueError(f"{self.filename} has an unsupported sample format ({format_tag}, {bits} bits).")
+                # A recording interrupted before the header was updated may declare more data than there is
+                chunk_size = min(chunk_size, len(self.raw) - body)
+                frames = chunk_size // block_align
+                self.data = self.raw[body:body + frames * block_align]
+                self.samples = np.frombuffer(self.data, dtype = dtype).reshape(frames, self.channels)
+                return
+            offset = body + chunk_size + (chunk_size & 1)
+        raise ValueError(f"{self.filename} has no data chunk.")
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.samplerate
+
+    def as_float(self) -> np.ndarray:
+        '''
+        Returns the samples as float32 in [-1, 1]. Float files are returned as the view itself; integer files are converted.
+
+        Returns:
+            np.ndarray
+        '''
+        if self.samples.dtype == np.float32:
+            return self.samples
+        if np.issubdtype(self.samples.dtype, np.floating):
+            return self.samples.astype('float32')
+        if self.samples.dtype == np.uint8:
+            return (self.samples.astype('float32') - 128) / 128
+        return self.samples.astype('float32') / np.iinfo(self.samples.dtype).max
+
+    def is_current(self) -> bool:
+        '''
+        Whether the file on disk is still the mapped one.
+        '''
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size) == self.identity
+
+
+mapped_files = {}
+mapped_files_lock = threading.Lock()
+
+def open_wav(filename: str) -> MappedWav:
+    '''
+    Returns the memory map of a WAV file, reusing the existing map while the file is unchanged.
+    Writers must replace the file (see write_wav) rather than overwrite it in place, so that the
+    maps handed out before keep pointing at the old, still valid contents.
+
+    Args:
+        filename (str): The path to the WAV file.
+
+    Returns:
+        MappedWav
+    '''
+    path = os.path.abspath(filename)
+    with mapped_files_lock:
+        wav = mapped_files.get(path)
+        if wav is None or not wav.is_current():
+            # The previous map is released by the garbage collector once no view of it is left
+            wav = mapped_files[path] = MappedWav(path)
+        return wav
+
+def write_wav(filename: str, samplerate: int, audio: np.ndarray):
+    '''
+    Writes a WAV file through a temporary file and an atomic rename.
+
+    Args:
+        filename (str): The path to the WAV file.
+        samplerate (int): The sample rate.
+        audio (np.ndarray): The samples.
+    '''
+    from scipy.io.wavfile import write
+
+    temporary = f"{filename}.tmp"
+    write(temporary, samplerate, audio)
+    os.replace(temporary, filename)
@@ -0,0 +1,96 @@
+'''
+audio_quality.py
+
+This file contains the quality gate run on every recording before it is sent to the ASR and TTS backends.
+The recording is cut into short frames and checked with a few vectorized numpy operations (well under a
+millisecond for a 5 second take): the level, the peak, the ratio of clipped samples and the fraction of
+frames with speech. A silent or clipped take is recorded again after the "Go ahead" prompt; long silences
+at both ends are trimmed.
+'''
+
+import numpy as np
+
+from .constant import *
+
+
+class QualityReport:
+    '''
+    QualityReport
+    The measurements of a recording and the decision of the gate.
+
+    Attributes:
+        rms_dbfs (float): The level of the recording in dBFS.
+        peak (float): The highest absolute sample, 1.0 being full scale.
+        clipping_ratio (float): The fraction of samples at full scale.
+        speech_fraction (float): The fraction of frames with speech.
+        decision (str): "proceed", "trim" or "retry".
+        reason (str): Why the recording has to be retried, if it does.
+        start (int): The first frame to keep.
+        end (int): The frame after the last one to keep.
+    '''
+    def __init__(self, rms_dbfs: float, peak: float, clipping_ratio: float, speech_fraction: float, start: int, end: int):
+        self.rms_dbfs = rms_dbfs
+        self.peak = peak
+        self.clipping_ratio = clipping_ratio
+        self.speech_fraction = speech_fraction
+        self.start = start
+        self.end = end
+        self.decision = "proceed"
+        self.reason = ""
+
+    def __str__(self) -> str:
+        return (f"QUALITY: {self.decision}{f' ({self.reason})' if self.reason else ''}, "
+                f"{self.rms_dbfs:.1f} dBFS, peak {self.peak:.2f}, clipped {self.clipping_ratio:.2%}, speech {self.speech_fraction:.0%}")
+
+
+def assess_recording(audio: np.ndarray, samplerate: int = RATE) -> QualityReport:
+    '''
+    Measures a recording and decides whether to proceed with it, trim it or record again.
+
+    Args:
+        audio (np.ndarray): The samples, as floats in [-1, 1] or as integers, one row per frame.
+        samplerate (int): The sample rate. Defaults to RATE.
+
+    Returns:
+        QualityReport
+    '''
+    if np.issubdtype(audio.dtype, np.integer):
+        audio = audio.astype('float32') / np.iinfo(audio.dtype).max
+    mono = audio.reshape(len(audio), -1)[:, 0] if audio.ndim > 1 else audio
+
+    frame_length = max(1, int(QUALITY_FRAME_SECONDS * samplerate))
+    frame_count = len(mono) // frame_length
+    if frame_count == 0:
+        report = QualityReport(-np.inf, 0.0, 0.0, 0.0, 0, len(audio))
+        report.decision, report.reason = "retry", "empty"
+        return report
+
+    frames = mono[:frame_count * frame_length].reshape(frame_count, frame_length)
+    energy = np.einsum('ij,ij->i', frames, frames) / frame_length
+    frame_dbfs = 10 * np.log10(energy + 1e-12)
+    peak = float(np.abs(mono).max())
+    clipping_ratio = float(np.count_nonzero(np.abs(mono) >= QUALITY_CLIPPING_LEVEL)) / len(mono)
+    rms_dbfs = float(10 * np.log10(energy.mean() + 1e-12))
+
+    # A frame has speech when it is well above the noise floor of the take and above an absolute level.
+    # The floor is capped, so that a take with speech from start to end is not its own floor
+    noise_floor = min(np.percentile(frame_dbfs, 10), QUALITY_MAX_NOISE_FLOOR_DBFS)
+    speech = (frame_dbfs > noise_floor + QUALITY_SPEECH_MARGIN_DB) & (frame_dbfs > QUALITY_MIN_SPEECH_DBFS)
+    speech_fraction = float(speech.mean())
+
+    speech_frames = np.flatnonzero(speech)
+    margin = int(QUALITY_TRIM_MARGIN_SECONDS * samplerate)
+    if len(speech_frames) > 0:
+        start = max(0, speech_frames[0] * frame_length - margin)
+        end = min(len(audio), (speech_frames[-1] + 1) * frame_length + margin)
+    else:
+        start, end = 0, len(audio)
+
+    report = QualityReport(rms_dbfs, peak, clipping_ratio, speech_fraction, int(start), int(end))
+    if speech_fraction < QUALITY_MIN_SPEECH_FRACTION:
+        report.decision, report.reason = "retry", "no speech"
+    elif clipping_ratio > QUALITY_MAX_CLIPPING_RATIO:
+        report.decision, report.reason = "retry", "clipped"
+    elif len(audio) - (end - start) >= QUALITY_MIN_TRIM_SECONDS * samplerate:
+        report.decision = "trim"
+    return report
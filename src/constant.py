@@ -3,28 +3,214 @@ constant.py
 This file contains all the constants used in the project.
 '''
 
-import pyaudio
-
 '''
 AUDIO FORMAT
 '''
-FORMAT = pyaudio.paInt16
+FORMAT = 'int16'
 CHANNELS = 1
 RATE = 22050
 CHUNK = 1024
 RECORD_SECONDS = 5
 BLINK_MS = 200
+AUDIO_BUFFER_SECONDS = 30
+PRE_ROLL_SECONDS = 1.0
 
 AUDIO_FOLDER = "./data/audio/"
 WAVE_OUTPUT_FILENAME = "output.wav"
+SYNTHESIZED_OUTPUT_FILENAME = "synthesized.mp3"
+
+'''
+ASR
+'''
+ASR_MODE = "fp32" # "fp32" or "int8"; switch to int8 once "python main.py bench-asr" shows its CER matches fp32
+ASR_NUM_THREADS = 4
+ASR_DEVICE = "cpu"
+ASR_MODEL_TAG = "reazon-research/reazonspeech-espnet-v2"
+ASR_MODEL_STORE = "./data/models/reazonspeech"
+ASR_MODEL_VERIFY = "size" # "size" or "sha256", checked at every startup
+ASR_BEAM_SIZE = 10
+ASR_CTC_WEIGHT = 0.3
+ASR_MAXLENRATIO = 0.0
+ASR_LATENCY_BUDGET = 3.0 # seconds, 0 for no limit
 
 '''
 VIDEO
 '''
 IDLE_VIDEO_PATH = "./data/video/idle_vid.mov"
 TALK_VIDEO_PATH = "./data/video/talk_vid.mov"
+VIDEO_DECODE = "software" # "software": the transcoded assets on the CPU decoders, "platform": the original assets on the decoder chosen by Qt
+VIDEO_TRANSCODED_FOLDER = "./data/video/transcoded"
+VIDEO_TRANSCODE_WIDTH = 540
+VIDEO_TRANSCODE_CRF = 26
+VIDEO_HARDWARE_DECODERS = ["vaapidecodebin", "vaapih264dec", "vah264dec", "nvh264dec", "nvh264sldec", "v4l2h264dec", "d3d11h264dec", "vtdec_hw"]
+VIDEO_STATS_MS = 1000
 
 '''
 STEN-TTS API
 '''
 STEN_URL = "http://163.221.132.21:9874/rest/tts_api_multilingual/v1"
+STEN_URLS = [
+    STEN_URL,
+    "http://163.221.176.238:9874/rest/tts_api_multilingual/v1",
+]
+STEN_POOL_SIZE = 4
+STEN_TIMEOUT = 30.0
+STEN_LATENCY_WINDOW = 50
+STEN_EWMA_ALPHA = 0.3
+STEN_HEDGE_MIN_SAMPLES = 5
+STEN_HEDGE_DEFAULT_DELAY = 3.0
+STEN_HEALTH_TIMEOUT = 2.0
+STEN_HEALTH_INTERVAL = 30.0
+STEN_KEEPALIVE_IDLE = 120.0 # seconds without request before the endpoints are warmed up again
+STEN_WARMUP_TEXT = "Hello."
+STEN_WARMUP_REFERENCE = "./reference_audio/439.wav"
+STEN_DEGRADED_LATENCY = 6.0 # seconds, above which the UI shows the degraded mode
+STEN_STATUS_MS = 1000
+STEN_STREAM_BODY = True # stream the reference audio with chunked transfer encoding
+STEN_STREAM_CHUNK = 48 * 1024 # bytes of audio per base64 chunk
+STEN_MOCK_AUDIO = "./audio.mp3"
+STEN_LANGUAGES = {
+    "en": "english",
+    "jp": "japanese",
+    "zh": "chinese",
+    "id": "indonesian",
+    "vi": "vietnamese",
+}
+SYNTHESIS_TEXTS = {
+    "english": "This speech was generated using STEN T.T.S. from H.A.I. Lab.",
+    "japanese": "このデモはHAI研究室の音声合成技術を使用しています。",
+}
+
+'''
+TTS BACKENDS
+'''
+TTS_BACKEND_ORDER = ["sten", "local"] # The first backend that answers in time is played
+TTS_DEADLINE = 8.0 # seconds given to every backend before the next one is started
+TTS_LOCAL_MODELS = {
+    "english": "kan-bayashi/ljspeech_vits",
+    "japanese": "kan-bayashi/jsut_full_band_vits_prosody", # pyopenjtalk frontend
+}
+TTS_LOCAL_MODEL_STORE = "./data/models/tts" # one pinned store per language, see "python main.py model-store pin-tts"
+TTS_LOCAL_MODEL_VERIFY = "size" # "size" or "sha256", checked when a model is loaded
+TTS_LOCAL_PRELOAD = True
+
+'''
+PROMPT BUILD
+'''
+PROMPT_TEXT_FOLDER = "./data/prompt_text/"
+PROMPT_MANIFEST = "./data/audio/manifest.json"
+PROMPT_REFERENCE_AUDIO = "./reference_audio/439.wav"
+PROMPT_BUILD_WORKERS = 4
+PROMPT_TARGET_DBFS = -16.0
+PROMPT_SAMPLE_RATE = RATE
+PROMPT_BITRATE = "64k"
+
+'''
+DIAGNOSTICS
+'''
+LEAK_TRACKING = False # tracemalloc slows every allocation: enable it to see where the heap grows (RSS and object counts are always tracked)
+TRACEMALLOC_FRAMES = 1
+DIAGNOSTICS_TOP_STATS = 10
+DIAGNOSTICS_FILE = "diagnostics.txt"
+HUD_INTERVAL_MS = 500
+WATCHDOG = True
+WATCHDOG_HEARTBEAT_MS = 20
+WATCHDOG_THRESHOLD = 0.2 # seconds without heartbeat that count as a stall
+WATCHDOG_LOG = "stalls.log"
+
+'''
+ECHO CANCELLATION
+'''
+ECHO_CANCELLATION = True
+COUNTDOWN_OVERLAP = ECHO_CANCELLATION
+AEC_PARTITIONS = 8
+AEC_STEP_SIZE = 0.5
+AEC_DOUBLE_TALK_RATIO = 0.5
+
+'''
+MICROPHONE PREPROCESSING
+'''
+NOISE_SUPPRESSION = True # delays the capture by one CHUNK, which the recording marks account for
+NS_MAX_ATTENUATION_DB = 15.0
+NS_NOISE_RISE_DB = 3.0 # per second
+NS_SMOOTHING = 0.9
+NS_OVERESTIMATION = 3.0
+AUTO_GAIN_CONTROL = True
+AGC_TARGET_DBFS = -20.0
+AGC_MAX_GAIN_DB = 20.0
+AGC_GATE_DBFS = -40.0 # blocks below this level do not change the gain
+AGC_PEAK = 0.9
+AGC_RELEASE = 0.05 # fraction of the way to a higher gain per block
+
+'''
+RECORDING QUALITY GATE
+'''
+QUALITY_GATE = True
+QUALITY_MAX_RETRIES = 1 # times "Go ahead" is replayed before a bad take is used anyway
+QUALITY_FRAME_SECONDS = 0.02
+QUALITY_CLIPPING_LEVEL = 0.99
+QUALITY_MAX_CLIPPING_RATIO = 0.01
+QUALITY_SPEECH_MARGIN_DB = 12.0 # above the noise floor of the take
+QUALITY_MIN_SPEECH_DBFS = -50.0
+QUALITY_MAX_NOISE_FLOOR_DBFS = -45.0
+QUALITY_MIN_SPEECH_FRACTION = 0.05
+QUALITY_MIN_TRIM_SECONDS = 0.5 # trim only when it removes at least this much
+QUALITY_TRIM_MARGIN_SECONDS = 0.25
+
+'''
+FORK SERVER
+'''
+FORK_SERVER_SOCKET = "/tmp/opencampus2024.sock"
+FORK_SERVER_COMMANDS = ["example", "record", "exec_voice", "build-prompts", "bench-asr", "model-store"]
+FORK_SERVER_PRELOAD = [
+    "numpy",
+    "scipy.io.wavfile",
+    "scipy.signal",
+    "requests",
+    "pydub",
+    "src.voice_change",
+    "src.prompt_build",
+    "src.asr_benchmark",
+    "src.model_store",
+]
+
+'''
+STARTUP PROFILE
+'''
+STARTUP_PROFILE_TOP = 30
+
+'''
+SCENARIO
+'''
+SCENARIO_FILE = "./data/scenarios.json"
+DEFAULT_SCENARIO = "default"
+
+'''
+TRANSCRIPT
+'''
+TRANSCRIPT_MAX_FONT_PX = 32
+TRANSCRIPT_MIN_FONT_PX = 14
+TRANSCRIPT_HEIGHT_RATIO = 0.15 # of the height of the window
+TRANSCRIPT_MIN_HEIGHT = 50
+TRANSCRIPT_PADDING = 8
+TRANSCRIPT_REVEAL_MS = 60 # per word, 0 shows the whole text at once
+TRANSCRIPT_REVEAL_MAX_MS = 1500 # for the whole text: longer texts are revealed faster
+TRANSCRIPT_DISPLAY_MS = 3000 # from the start of the reveal to the hiding of the overlay
+
+'''
+SESSION ARCHIVE
+'''
+SESSION_ARCHIVE = True
+SESSION_ARCHIVE_FOLDER = "./sessions"
+SESSION_SEGMENT_BYTES = 64 << 20
+SESSION_ARCHIVE_CODEC = "opus" # "opus" (lossy, several times smaller) or "flac" (lossless)
+SESSION_OPUS_RATE = 24000 # Opus only encodes at 8, 12, 16, 24 or 48 kHz: the other rates are resampled to this one
+
+'''
+SETTINGS
+Every constant above is a default, overridden by the settings file, the environment and the command line (see settings.py).
+'''
+SETTINGS_FILE = "./settings.json"
+
+from . import settings as _settings
+_settings.apply_settings(globals())
@@ -0,0 +1,102 @@
+'''
+echo_cancel.py
+
+This file contains the acoustic echo canceller used on the microphone stream.
+The audio sent to the speaker is used as the reference signal, and its echo is estimated with a
+partitioned-block frequency-domain adaptive filter and subtracted from the captured audio.
+'''
+
+import numpy as np
+
+from .constant import CHUNK, AEC_PARTITIONS, AEC_STEP_SIZE, AEC_DOUBLE_TALK_RATIO
+
+
+class EchoCanceller:
+    '''
+    EchoCanceller
+    Removes the echo of the reference signal from the microphone signal, one block at a time.
+    The filter covers blocksize * partitions samples of echo path.
+
+    Attributes:
+        blocksize (int): The number of samples in each block.
+        partitions (int): The number of filter partitions.
+        step_size (float): The normalized adaptation step size.
+        weights (np.ndarray): The frequency-domain filter partitions.
+        history (np.ndarray): The spectra of the most recent reference blocks.
+        power (np.ndarray): The smoothed power of the reference in every bin, or None before the first reference.
+    '''
+    def __init__(self, blocksize: int = CHUNK, partitions: int = AEC_PARTITIONS, step_size: float = AEC_STEP_SIZE):
+        '''
+        Constructor
+
+        Args:
+            blocksize (int): The number of samples in each block.
+            partitions (int): The number of filter partitions.
+            step_size (float): The normalized adaptation step size.
+        '''
+        self.blocksize = blocksize
+        self.partitions = partitions
+        self.step_size = step_size
+
+        bins = blocksize + 1
+        self.weights = np.zeros((partitions, bins), dtype = 'complex64')
+        self.history = np.zeros((partitions, bins), dtype = 'complex64')
+        self.power = None
+        self.previous_reference = np.zeros(blocksize, dtype = 'float32')
+        self.reference_peaks = np.zeros(partitions, dtype = 'float32')
+        self.padding = np.zeros(blocksize, dtype = 'float32')
+
+    def reset(self):
+        '''
+        Forgets the learned echo path.
+        '''
+        self.weights[:] = 0
+        self.history[:] = 0
+        self.power = None
+        self.previous_reference[:] = 0
+        self.reference_peaks[:] = 0
+
+    def process(self, microphone: np.ndarray, reference: np.ndarray) -> np.ndarray:
+        '''
+        Removes the echo of the reference from one block of the microphone signal.
+
+        Args:
+            microphone (np.ndarray): The captured block, with blocksize samples.
+            reference (np.ndarray): The block sent to the speaker at the same time, with blocksize samples.
+
+        Returns:
+            np.ndarray: The captured block without the echo.
+        '''
+        B = self.blocksize
+
+        # Spectrum of the last two reference blocks (overlap-save)
+        spectrum = np.fft.rfft(np.concatenate((self.previous_reference, reference)))
+        self.previous_reference = reference.astype('float32')
+        self.history = np.roll(self.history, 1, axis = 0)
+        self.history[0] = spectrum
+        self.reference_peaks = np.roll(self.reference_peaks, 1)
+        self.reference_peaks[0] = np.max(np.abs(reference))
+
+        # Track the reference power over the blocks with a reference only, starting from the first one, so that
+        # the first adaptation steps, and the first ones after a silence, are normalized by the actual power
+        if self.reference_peaks[0] > 1e-4:
+            block_power = (np.abs(spectrum) ** 2).astype('float32')
+            self.power = block_power if self.power is None else 0.9 * self.power + 0.1 * block_power
+
+        # Estimate the echo and subtract it
+        echo = np.fft.irfft((self.weights * self.history).sum(axis = 0))[B:]
+        error = (microphone - echo).astype('float32')
+
+        # Nothing to learn without reference, and the filter must not adapt to the visitor's voice (double talk)
+        reference_peak = self.reference_peaks.max()
+        if self.power is None or reference_peak <= 1e-4 or np.max(np.abs(microphone)) > AEC_DOUBLE_TALK_RATIO * reference_peak:
+            return error
+
+        # Normalized update, constrained so that every partition stays a causal block of B taps
+        error_spectrum = np.fft.rfft(np.concatenate((self.padding, error)))
+        gradient = np.conj(self.history) * error_spectrum / (self.partitions * self.power + 1e-6)
+        gradient = np.fft.irfft(gradient, axis = 1)
+        gradient[:, B:] = 0
+        self.weights += self.step_size * np.fft.rfft(gradient, axis = 1).astype('complex64')
+
+        return error
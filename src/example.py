@@ -17,8 +17,6 @@ import base64
 url = "http://163.221.176.238:9874/rest/tts_api_multilingual/v1"
 
 filename = "./reference_audio/439.wav"
-audio_binary = open(filename, 'rb') #open binary file in read mode
-audio_binary_base64 = base64.b64encode(audio_binary.read())
 
 language = ["chinese", "english", "indonesian", "japanese", "vietnamese"]
 texts = [
@@ -36,6 +34,9 @@ def call_stentts():
     Returns:
         None
     """
+    with open(filename, 'rb') as audio_binary: #open binary file in read mode
+        audio_binary_base64 = base64.b64encode(audio_binary.read())
+
     for index, (text, lang) in enumerate(zip(texts, language)):
         data = {
             'text': text,
@@ -0,0 +1,144 @@
+'''
+fork_server.py
+
+This file contains a pre-warmed fork server for the utility commands of main.py.
+The server imports the heavy modules once and waits on a UNIX socket. For every command it forks,
+and the child runs the command with the stdin, stdout and stderr of the client, so the command starts
+without paying the imports again. The settings are loaded once by the server: a client whose settings
+file or OPENCAMPUS_ environment differs is refused, and runs the command itself.
+'''
+
+import importlib
+import json
+import os
+import signal
+import socket
+import sys
+
+from . import settings
+from .constant import FORK_SERVER_SOCKET, FORK_SERVER_PRELOAD
+
+MAX_REQUEST_SIZE = 1 << 20
+REFUSED = b"refused"
+
+
+def serve(run_command, socket_path: str = FORK_SERVER_SOCKET):
+    '''
+    Preloads the modules and serves commands until interrupted.
+
+    Args:
+        run_command (function): The function running a command from its argv list and returning its exit code.
+        socket_path (str): The path of the UNIX socket. Defaults to FORK_SERVER_SOCKET.
+
+    Returns:
+        None
+    '''
+    for module_name in FORK_SERVER_PRELOAD:
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            print(f"Failed to preload {module_name}: {e}")
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+
+    # Let the kernel reap the children
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    print(f"Fork server ready on {socket_path}.")
+
+    try:
+        while True:
+            connection, _ = server.accept()
+            if os.fork() == 0:
+                server.close()
+                run_child(connection, run_command)
+            connection.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+def run_child(connection: socket.socket, run_command):
+    '''
+    Runs one command in the forked child with the standard streams of the client, then exits.
+
+    Args:
+        connection (socket.socket): The connection to the client.
+        run_command (function): The function running a command from its argv list and returning its exit code.
+    '''
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    exit_code = 1
+    try:
+        message, fds, _, _ = socket.recv_fds(connection, MAX_REQUEST_SIZE, 3)
+        request = json.loads(message.decode('utf-8'))
+        if request.get('settings') != settings.loaded_fingerprint:
+            # The constants of the server were loaded with other settings
+            connection.sendall(REFUSED)
+            os._exit(0)
+        for fd, target in zip(fds, (0, 1, 2)):
+            os.dup2(fd, target)
+            os.close(fd)
+        os.chdir(request['cwd'])
+        os.environ.update(request['env'])
+        sys.argv = request['argv']
+
+        # PortAudio must not be shared with the parent process
+        if 'sounddevice' in sys.modules:
+            sounddevice = sys.modules['sounddevice']
+            sounddevice._terminate()
+            sounddevice._initialize()
+
+        exit_code = run_command(sys.argv) or 0
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 1
+    except BaseException as e:
+        print(f"Command failed: {e!r}", file = sys.stderr)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            connection.sendall(str(exit_code).encode('utf-8'))
+        finally:
+            os._exit(exit_code)
+
+def run_remote(argv: list, socket_path: str = FORK_SERVER_SOCKET):
+    '''
+    Runs a command on the fork server.
+
+    Args:
+        argv (list): The command line of the command.
+        socket_path (str): The path of the UNIX socket. Defaults to FORK_SERVER_SOCKET.
+
+    Returns:
+        int: The exit code of the command, or None when no fork server is running or its settings differ.
+    '''
+    if not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError:
+        return None
+
+    request = {
+        'argv': argv,
+        'cwd': os.getcwd(),
+        'env': dict(os.environ),
+        'settings': settings.loaded_fingerprint,
+    }
+    with client:
+        socket.send_fds(client, [json.dumps(request).encode('utf-8')], [0, 1, 2])
+        response = b''
+        while True:
+            data = client.recv(16)
+            if not data:
+                break
+            response += data
+    if response == REFUSED:
+        return None
+    return int(response) if response else 1
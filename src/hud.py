@@ -0,0 +1,108 @@
+'''
+hud.py
+
+This file contains the debug HUD of the window: a translucent text overlay, toggled with the H key,
+showing the current pipeline stage, the stage timings of the current and previous cycles, the event loop lag,
+the CPU and memory of the process and the state of the STEN connection pool.
+It is refreshed every HUD_INTERVAL_MS from the metrics registry, and not at all while hidden.
+'''
+
+import time
+
+from PyQt5.QtWidgets import QLabel
+from PyQt5.QtCore import Qt
+
+from . import tts_endpoints
+from .constant import HUD_INTERVAL_MS
+from .metrics import get_metrics
+
+# The stages of a cycle, in the order they are shown
+HUD_STAGES = ["record", "asr", "tts_post", "tts_download", "tts_decode", "tts_local", "playback_start"]
+
+
+class DebugHud(QLabel):
+    '''
+    DebugHud
+    The debug overlay of the main window.
+
+    Attributes:
+        resources (ResourceManager): The resource manager of the window, which owns the refresh timer.
+    '''
+    def __init__(self, parent, resources):
+        '''
+        Constructor
+
+        Args:
+            parent (QWidget): The window.
+            resources (ResourceManager): The resource manager of the window.
+        '''
+        super().__init__(parent)
+        self.resources = resources
+        self.setStyleSheet("color: #0f0; background-color: rgba(0, 0, 0, 160); font-family: monospace; font-size: 11px; padding: 6px;")
+        self.setAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.move(0, 0)
+        self.hide()
+        self.last_refresh = 0.0
+
+    def toggle(self):
+        '''
+        Shows or hides the HUD, starting or stopping its refresh timer.
+        '''
+        if self.isVisible():
+            self.resources.timer("hud", self.refresh).stop()
+            self.hide()
+            return
+        self.last_refresh = 0.0
+        self.refresh()
+        self.show()
+        self.raise_()
+        self.resources.timer("hud", self.refresh).start(HUD_INTERVAL_MS)
+
+    def refresh(self):
+        '''
+        Rebuilds the text of the HUD from the metrics registry.
+        '''
+        metrics = get_metrics()
+        now = time.perf_counter()
+        if self.last_refresh > 0:
+            # The timer fires late by as much as the event loop was busy
+            metrics.gauge("event_loop_lag", max(0.0, now - self.last_refresh - HUD_INTERVAL_MS / 1000))
+        self.last_refresh = now
+
+        snapshot = metrics.snapshot()
+        cpu_percent, rss = metrics.process_usage()
+        lines = [
+            f"stage     {snapshot['stage']} ({snapshot['stage_seconds']:.1f} s)",
+            f"{'':<15}{'now':>8}{'last':>8}",
+        ]
+        for stage in HUD_STAGES:
+            current = snapshot['current'].get(stage)
+            last = snapshot['last_cycle'].get(stage)
+            if current is None and last is None:
+                continue
+            lines.append(f"{stage:<15}{self.seconds(current):>8}{self.seconds(last):>8}")
+
+        gauges = snapshot['gauges']
+        lines += [
+            f"loop lag  {gauges.get('event_loop_lag', 0.0) * 1000:.0f} ms",
+            f"cpu       {cpu_percent:.0f} %",
+            f"rss       {rss / (1 << 20):.0f} MiB",
+        ]
+        for name, value in sorted(gauges.items()):
+            if name != 'event_loop_lag':
+                lines.append(f"{name:<10}{value}")
+
+        if tts_endpoints.endpoint_pool is not None:
+            pool = tts_endpoints.endpoint_pool
+            connections = pool.connection_stats()
+            lines.append(f"sten      {pool.status()}, {connections['opened']} opened, {connections['idle']} idle, {connections['in_flight']} in flight")
+            for stats in pool.stats():
+                ewma = "-" if stats['ewma'] is None else f"{stats['ewma']:.2f} s"
+                lines.append(f"  {stats['url'].split('//')[-1].split('/')[0]:<22}{ewma:>8} {'up' if stats['healthy'] else 'DOWN'}")
+
+        self.setText("\n".join(lines))
+        self.adjustSize()
+
+    def seconds(self, value: float) -> str:
+        return "-" if value is None else f"{value:.2f}"
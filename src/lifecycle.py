@@ -0,0 +1,271 @@
+'''
+lifecycle.py
+
+This file manages the lifetime of the Qt resources (timers, threads and workers) used by the UI.
+Timers and threads are created once and reused on every visitor cycle. The resident memory, the live Qt
+objects and the objects tracked by the garbage collector are measured at the end of each cycle, on a
+background thread, so that leaks can be spotted during a long event. LEAK_TRACKING adds the growth of the
+Python heap by allocation site (tracemalloc), which slows every allocation.
+'''
+
+import gc
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, QThread, QTimer, QMetaObject, Qt
+
+from .constant import LEAK_TRACKING, TRACEMALLOC_FRAMES, DIAGNOSTICS_TOP_STATS, DIAGNOSTICS_FILE
+
+
+def resident_memory() -> int:
+    '''
+    Returns the resident memory of the process.
+
+    Returns:
+        int: The resident memory in bytes, or None without /proc (macOS).
+    '''
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class ResourceManager:
+    '''
+    ResourceManager
+    Owns the reusable timers and worker threads of a window and keeps per-cycle memory statistics.
+
+    Attributes:
+        parent (QObject): The object that owns the timers and threads.
+        timers (dict): The reusable timers, keyed by name.
+        threads (dict): The persistent worker threads, keyed by name.
+        workers (dict): The worker currently attached to each thread.
+        history (list): The statistics recorded at the end of every cycle.
+        retired (set): The replaced workers, kept alive until Qt has deleted them.
+    '''
+    def __init__(self, parent: QObject):
+        '''
+        Constructor
+
+        Args:
+            parent (QObject): The object that owns the timers and threads.
+        '''
+        self.parent = parent
+        self.timers = {}
+        self.threads = {}
+        self.workers = {}
+        self.retired = set()
+
+        self.cycle = 0
+        self.cycle_active = False
+        self.cycle_started_at = 0.0
+        self.history = []
+        self.history_lock = threading.Lock()
+
+        self.baseline_snapshot = None
+        self.last_snapshot = None
+        self.stats_executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "cycle-stats")
+        if LEAK_TRACKING:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.baseline_snapshot = tracemalloc.take_snapshot()
+            self.last_snapshot = self.baseline_snapshot
+
+    '''
+    Timers and threads
+    '''
+    def timer(self, name: str, slot, single_shot: bool = False) -> QTimer:
+        '''
+        Returns the timer registered under the given name, connected to the given slot only.
+        Any previous connection is removed, so handlers never pile up across cycles.
+
+        Args:
+            name (str): The name of the timer.
+            slot (function): The function called on timeout.
+            single_shot (bool): Whether the timer fires only once.
+
+        Returns:
+            QTimer
+        '''
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = QTimer(self.parent)
+            self.timers[name] = timer
+
+        timer.stop()
+        try:
+            timer.timeout.disconnect()
+        except TypeError:
+            pass # Nothing was connected yet
+        timer.setSingleShot(single_shot)
+        timer.timeout.connect(slot)
+        return timer
+
+    def run_worker(self, name: str, worker: QObject, *slots):
+        '''
+        Runs the worker on the persistent thread registered under the given name.
+        The thread is started the first time it is needed and kept alive afterwards.
+
+        Args:
+            name (str): The name of the thread.
+            worker (BackgroundWorker): The worker to run. Its run method must be a slot.
+            slots (function): The functions connected to the worker signal.
+
+        Returns:
+            None
+        '''
+        thread = self.threads.get(name)
+        if thread is None:
+            thread = QThread(self.parent)
+            thread.start()
+            self.threads[name] = thread
+
+        previous = self.workers.pop(name, None)
+        if previous is not None:
+            # The worker has no parent: without a reference, Python would delete it before deleteLater runs
+            self.retired.add(previous)
+            previous.destroyed.connect(lambda: self.retired.discard(previous))
+            previous.deleteLater()
+
+        worker.moveToThread(thread)
+        for slot in slots:
+            worker.signal.connect(slot)
+        self.workers[name] = worker
+        QMetaObject.invokeMethod(worker, "run", Qt.QueuedConnection)
+
+    def shutdown(self):
+        '''
+        Stops every timer and waits for every worker thread to finish.
+        '''
+        for timer in self.timers.values():
+            timer.stop()
+        self.stats_executor.shutdown(wait = False)
+        for thread in self.threads.values():
+            thread.quit()
+            thread.wait()
+
+    '''
+    Cycle tracking
+    '''
+    def begin_cycle(self):
+        '''
+        Marks the start of a visitor cycle.
+        '''
+        self.cycle += 1
+        self.cycle_active = True
+        self.cycle_started_at = time.perf_counter()
+
+    def end_cycle(self):
+        '''
+        Marks the end of a visitor cycle and records its statistics. The memory statistics are measured
+        on the statistics thread, off the UI thread. Calling it when no cycle is running does nothing.
+        '''
+        if not self.cycle_active:
+            return
+        self.cycle_active = False
+
+        stats = {
+            'cycle': self.cycle,
+            'duration': time.perf_counter() - self.cycle_started_at,
+            'qt_children': len(self.parent.findChildren(QObject)),
+            'qt_objects': 0,
+            'gc_objects': 0,
+            'rss': None,
+            'max_rss': 0,
+            'heap_current': 0,
+            'heap_peak': 0,
+            'heap_growth': 0,
+            'top_growth': [],
+        }
+        self.stats_executor.submit(self.measure_memory, stats)
+
+    def measure_memory(self, stats: dict):
+        '''
+        Measures the resident memory, counts the live Qt objects and the objects tracked by the garbage collector,
+        and with LEAK_TRACKING compares the heap with the previous cycle, on the statistics thread.
+        '''
+        objects = gc.get_objects()
+        stats['gc_objects'] = len(objects)
+        stats['qt_objects'] = sum(1 for obj in objects if isinstance(obj, QObject))
+        del objects
+        stats['rss'] = resident_memory()
+        # ru_maxrss is in bytes on macOS and in KiB on Linux
+        stats['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            diff = snapshot.compare_to(self.last_snapshot, 'lineno')
+            stats['heap_current'], stats['heap_peak'] = tracemalloc.get_traced_memory()
+            stats['heap_growth'] = sum(stat.size_diff for stat in diff)
+            stats['top_growth'] = [str(stat) for stat in diff[:DIAGNOSTICS_TOP_STATS]]
+            self.last_snapshot = snapshot
+            tracemalloc.reset_peak()
+        self.record_cycle(stats)
+
+    def record_cycle(self, stats: dict):
+        '''
+        Adds the statistics of a cycle to the history.
+        '''
+        with self.history_lock:
+            self.history.append(stats)
+        rss = stats['max_rss'] if stats['rss'] is None else stats['rss']
+        heap = f", heap growth {stats['heap_growth'] / 1024:.1f} KiB" if LEAK_TRACKING else ""
+        print(f"CYCLE {stats['cycle']} FINISHED: {stats['duration']:.1f} s, RSS {rss / 1048576:.0f} MiB, {stats['qt_objects']} Qt objects, {stats['gc_objects']} gc objects{heap}")
+
+    '''
+    Diagnostics
+    '''
+    def diagnostics(self) -> str:
+        '''
+        Builds a human readable report of the resources and of the per-cycle statistics.
+
+        Returns:
+            string
+        '''
+        lines = [
+            f"Cycles: {self.cycle}",
+            f"Timers: {len(self.timers)} ({', '.join(self.timers)})",
+            f"Threads: {len(self.threads)} ({', '.join(name for name, thread in self.threads.items() if thread.isRunning())} running)",
+            "",
+            "cycle  duration[s]  rss[MiB]  max_rss[MiB]  qt_children  qt_objects  gc_objects  heap[KiB]  growth[KiB]",
+        ]
+        with self.history_lock:
+            history = list(self.history)
+        for stats in history:
+            rss = "-" if stats['rss'] is None else f"{stats['rss'] / 1048576:.1f}"
+            lines.append(f"{stats['cycle']:>5}  {stats['duration']:>11.1f}  {rss:>8}  {stats['max_rss'] / 1048576:>12.1f}  {stats['qt_children']:>11}  {stats['qt_objects']:>10}  {stats['gc_objects']:>10}  {stats['heap_current'] / 1024:>9.1f}  {stats['heap_growth'] / 1024:>11.1f}")
+
+        if history and history[-1]['top_growth']:
+            lines += ["", "Top allocations since previous cycle:"] + history[-1]['top_growth']
+
+        return "\n".join(lines)
+
+    def dump_diagnostics(self, filename: str = DIAGNOSTICS_FILE):
+        '''
+        Writes the diagnostics report to a file. The heap snapshot of LEAK_TRACKING is taken and the file
+        written on the statistics thread, off the UI thread.
+
+        Args:
+            filename (str): The path of the report file. Defaults to DIAGNOSTICS_FILE.
+
+        Returns:
+            None
+        '''
+        self.stats_executor.submit(self.write_diagnostics, self.diagnostics(), filename)
+
+    def write_diagnostics(self, report: str, filename: str):
+        '''
+        Adds the heap growth since startup to the report and writes it, on the statistics thread.
+        '''
+        if LEAK_TRACKING and tracemalloc.is_tracing() and self.baseline_snapshot is not None:
+            diff = tracemalloc.take_snapshot().compare_to(self.baseline_snapshot, 'lineno')
+            report = "\n".join([report, "", "Top allocations since startup:"] + [str(stat) for stat in diff[:DIAGNOSTICS_TOP_STATS]])
+        with open(filename, "w") as f:
+            f.write(report + "\n")
+        print(f"Diagnostics saved as {filename}.")
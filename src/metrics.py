@@ -0,0 +1,130 @@
+'''
+metrics.py
+
+This file contains the metrics registry of the application.
+The UI and the background stages report the current pipeline stage, the duration of every stage of the
+visitor cycle and a few gauges (event loop lag, ...) to one shared registry; the debug HUD reads it
+at low frequency. Reporting is a dict update under a lock, cheap enough for every stage of every cycle.
+'''
+
+import os
+import resource
+import threading
+import time
+
+
+class MetricsRegistry:
+    '''
+    MetricsRegistry
+    The shared, thread-safe store of the runtime metrics.
+
+    Attributes:
+        stage (str): The current stage of the pipeline.
+        current (dict): The stage durations of the running cycle, in seconds.
+        last_cycle (dict): The stage durations of the previous cycle, in seconds.
+        gauges (dict): The latest value of every gauge.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stage = "idle"
+        self.stage_started_at = time.perf_counter()
+        self.current = {}
+        self.last_cycle = {}
+        self.gauges = {}
+        self.started = {}
+        self.last_usage = (time.perf_counter(), time.process_time())
+
+    def set_stage(self, stage: str):
+        '''
+        Sets the current stage of the pipeline.
+        '''
+        with self.lock:
+            self.stage = stage
+            self.stage_started_at = time.perf_counter()
+
+    def start(self, name: str):
+        '''
+        Starts timing a stage of the cycle.
+        '''
+        with self.lock:
+            self.started[name] = time.perf_counter()
+
+    def stop(self, name: str):
+        '''
+        Stops timing a stage of the cycle and records its duration. Does nothing if it was not started.
+        '''
+        with self.lock:
+            started_at = self.started.pop(name, None)
+            if started_at is not None:
+                self.current[name] = time.perf_counter() - started_at
+
+    def record(self, name: str, seconds: float):
+        '''
+        Records the duration of a stage of the cycle measured elsewhere.
+        '''
+        with self.lock:
+            self.current[name] = seconds
+
+    def gauge(self, name: str, value):
+        '''
+        Sets the value of a gauge.
+        '''
+        with self.lock:
+            self.gauges[name] = value
+
+    def begin_cycle(self):
+        '''
+        Starts a new visitor cycle: the timings of the previous one become the last cycle.
+        '''
+        with self.lock:
+            if self.current:
+                self.last_cycle = self.current
+            self.current = {}
+            self.started = {}
+
+    def snapshot(self) -> dict:
+        '''
+        Returns a copy of the metrics.
+
+        Returns:
+            dict
+        '''
+        with self.lock:
+            return {
+                'stage': self.stage,
+                'stage_seconds': time.perf_counter() - self.stage_started_at,
+                'current': dict(self.current),
+                'last_cycle': dict(self.last_cycle),
+                'gauges': dict(self.gauges),
+            }
+
+    def process_usage(self) -> tuple:
+        '''
+        Returns the CPU usage of the process since the previous call (100% being one core busy) and its resident memory.
+
+        Returns:
+            tuple: The CPU usage in percent and the RSS in bytes.
+        '''
+        wall, cpu = time.perf_counter(), time.process_time()
+        last_wall, last_cpu = self.last_usage
+        self.last_usage = (wall, cpu)
+        cpu_percent = 100 * (cpu - last_cpu) / (wall - last_wall) if wall > last_wall else 0.0
+        try:
+            with open('/proc/self/statm') as f:
+                rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            # Without /proc (macOS), the peak RSS in bytes is the closest value available
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return cpu_percent, rss
+
+
+metrics = MetricsRegistry()
+
+def get_metrics() -> MetricsRegistry:
+    '''
+    Returns the shared metrics registry.
+
+    Returns:
+        MetricsRegistry
+    '''
+    return metrics
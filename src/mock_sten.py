@@ -0,0 +1,106 @@
+'''
+mock_sten.py
+
+This file contains a local mock of the STEN TTS API, used to test the endpoint pool without the real servers.
+Every server answers the synthesis POST after an injectable delay with an audio_path pointing back at itself,
+and serves STEN_MOCK_AUDIO for that path.
+'''
+
+import json
+import threading
+import time
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .constant import STEN_MOCK_AUDIO
+
+
+class MockStenHandler(BaseHTTPRequestHandler):
+    '''
+    MockStenHandler
+    Handles the requests of one mock server. The delay and the failure mode are attributes of the server.
+    '''
+    def read_body(self) -> bytes:
+        '''
+        Reads the request body, sent with a Content-Length or with chunked transfer encoding.
+        '''
+        if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+            return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = b''
+        while True:
+            size = int(self.rfile.readline().split(b';')[0], 16)
+            if size == 0:
+                self.rfile.readline()
+                return body
+            body += self.rfile.read(size)
+            self.rfile.readline()
+
+    def do_POST(self):
+        self.server.last_body = self.read_body()
+        time.sleep(self.server.delay)
+        if self.server.fail:
+            self.send_error(503)
+            return
+        self.server.posts += 1
+        body = json.dumps({'body': {'audio_path': f"http://127.0.0.1:{self.server.server_port}/audio.mp3"}})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode('utf-8'))
+
+    def do_GET(self):
+        if self.path != '/audio.mp3':
+            self.send_error(404)
+            return
+        with open(STEN_MOCK_AUDIO, 'rb') as f:
+            content = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(port: int = 0, delay: float = 0.0, fail: bool = False) -> ThreadingHTTPServer:
+    '''
+    Starts a mock STEN server in a background thread.
+
+    Args:
+        port (int): The port to listen on. 0 picks a free port.
+        delay (float): The time in seconds before each synthesis answer. Can be changed on the returned server.
+        fail (bool): Whether the synthesis answers with an error. Can be changed on the returned server.
+
+    Returns:
+        ThreadingHTTPServer: The server; its API URL is http://127.0.0.1:<server_port>/rest/tts_api_multilingual/v1.
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockStenHandler)
+    server.delay = delay
+    server.fail = fail
+    server.posts = 0
+    server.url = f"http://127.0.0.1:{server.server_port}/rest/tts_api_multilingual/v1"
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+def run_mock_servers(specs: list):
+    '''
+    Runs mock servers until interrupted.
+
+    Args:
+        specs (list): One "port:delay" string per server, e.g. ["9001:0.2", "9002:1.5"].
+    '''
+    servers = []
+    for spec in specs or ["9001:0.2", "9002:1.0"]:
+        port, _, delay = spec.partition(':')
+        server = start_mock_server(int(port), float(delay or 0))
+        servers.append(server)
+        print(f"Mock STEN server on {server.url} (delay {server.delay} s)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
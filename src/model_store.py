@@ -0,0 +1,239 @@
+'''
+model_store.py
+
+This file manages the local copies of the models, so that the kiosk can start without network.
+The model files are pinned once into a store (ASR_MODEL_STORE for the ASR model, TTS_LOCAL_MODEL_STORE
+for the local TTS models) together with a manifest of their checksums, which covers the files the
+configurations refer to (statistics, BPE model, token list) as well.
+At startup the model is built from the pinned files only, and its weights are memory-mapped
+instead of being read into memory first.
+'''
+
+import hashlib
+import json
+import os
+import sys
+import time
+
+from .constant import ASR_MODEL_TAG, ASR_MODEL_STORE, ASR_MODEL_VERIFY, ASR_DEVICE
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def file_sha256(filename: str) -> str:
+    '''
+    Computes the SHA-256 checksum of a file.
+
+    Args:
+        filename (str): The path to the file.
+
+    Returns:
+        string
+    '''
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_entry(path: str, store_dir: str) -> dict:
+    '''
+    Describes a pinned file for the manifest.
+    '''
+    return {
+        'path': os.path.relpath(path, store_dir),
+        'size': os.path.getsize(path),
+        'sha256': file_sha256(path),
+    }
+
+def check_entry(entry: dict, store_dir: str, mode: str) -> str:
+    '''
+    Checks a pinned file against its manifest entry.
+
+    Returns:
+        string: The absolute path of the file.
+    '''
+    path = os.path.join(store_dir, entry['path'])
+    if not os.path.isfile(path) or os.path.getsize(path) != entry['size']:
+        raise Exception(f"Pinned model file is missing or truncated: {path}")
+    if mode == "sha256" and file_sha256(path) != entry['sha256']:
+        raise Exception(f"Pinned model file is corrupted: {path}")
+    return os.path.abspath(path)
+
+def referenced_files(config_path: str, store_dir: str) -> list:
+    '''
+    Lists the files of the store a configuration refers to, and the files their own configurations refer to.
+
+    Args:
+        config_path (str): The path to the YAML configuration.
+        store_dir (str): The directory of the store.
+
+    Returns:
+        list: The absolute paths of the files.
+    '''
+    import yaml
+
+    store_dir = os.path.abspath(store_dir)
+    found = []
+    pending = [os.path.abspath(config_path)]
+    while pending:
+        with open(pending.pop(), "r", encoding = "utf-8") as f:
+            values = [yaml.safe_load(f)]
+        while values:
+            value = values.pop()
+            if isinstance(value, dict):
+                values.extend(value.values())
+            elif isinstance(value, list):
+                values.extend(value)
+            elif isinstance(value, str) and os.path.isfile(value):
+                path = os.path.abspath(value)
+                if path.startswith(store_dir + os.sep) and path not in found:
+                    found.append(path)
+                    if path.endswith((".yaml", ".yml")):
+                        pending.append(path)
+    return found
+
+def manifest_path(store_dir: str = ASR_MODEL_STORE) -> str:
+    '''
+    Returns the path of the manifest of a model store.
+    '''
+    return os.path.join(store_dir, MANIFEST_FILENAME)
+
+def is_pinned(store_dir: str = ASR_MODEL_STORE) -> bool:
+    '''
+    Returns whether a model has been pinned into the store.
+    '''
+    return os.path.exists(manifest_path(store_dir))
+
+def enforce_offline(store_dir: str = ASR_MODEL_STORE):
+    '''
+    Forbids huggingface-hub and espnet-model-zoo to look anything up when a model is pinned.
+    huggingface-hub reads HF_HUB_OFFLINE when it is imported, so this must run before the first import
+    of espnet or reazonspeech; the flag of an already imported huggingface-hub is set as well.
+    '''
+    if is_pinned(store_dir):
+        set_offline(True)
+
+def set_offline(offline: bool):
+    '''
+    Sets the offline mode of huggingface-hub, in the environment and in the flag of an already imported huggingface-hub.
+    '''
+    if offline:
+        os.environ['HF_HUB_OFFLINE'] = '1'
+    else:
+        os.environ.pop('HF_HUB_OFFLINE', None)
+    if 'huggingface_hub.constants' in sys.modules:
+        sys.modules['huggingface_hub.constants'].HF_HUB_OFFLINE = offline
+
+def pin_model(tag: str = ASR_MODEL_TAG, store_dir: str = ASR_MODEL_STORE):
+    '''
+    Downloads the model into the store and records the checksums of its files. Needs network.
+
+    Args:
+        tag (str): The model name on the Hugging Face hub.
+        store_dir (str): The directory of the store. Defaults to ASR_MODEL_STORE.
+
+    Returns:
+        None
+    '''
+    from espnet_model_zoo.downloader import ModelDownloader
+
+    # The fork server enforces the offline mode once the ASR model is pinned
+    set_offline(False)
+    os.makedirs(store_dir, exist_ok = True)
+    print(f"PINNING {tag} INTO {store_dir}...")
+    paths = ModelDownloader(cachedir = store_dir).download_and_unpack(tag)
+
+    files = {}
+    for key, path in paths.items():
+        if not isinstance(path, str) or not os.path.isfile(path):
+            continue
+        files[key] = file_entry(path, store_dir)
+
+    # The configurations name the other files the model needs (the paths are rewritten into the store on unpacking)
+    references = []
+    for key, path in paths.items():
+        if key in files and path.endswith((".yaml", ".yml")):
+            references += [reference for reference in referenced_files(path, store_dir) if reference not in references]
+    pinned = {os.path.abspath(path) for key, path in paths.items() if key in files}
+    references = [file_entry(path, store_dir) for path in references if path not in pinned]
+
+    with open(manifest_path(store_dir), "w") as f:
+        json.dump({'tag': tag, 'files': files, 'references': references}, f, indent = 2)
+    print(f"Pinned {len(files)} files and {len(references)} files they refer to.")
+
+def verify_model(store_dir: str = ASR_MODEL_STORE, mode: str = "sha256") -> dict:
+    '''
+    Checks the pinned files, and the files their configurations refer to, against the manifest.
+
+    Args:
+        store_dir (str): The directory of the store. Defaults to ASR_MODEL_STORE.
+        mode (str): "sha256" to compare the checksums, or "size" for a fast check of the sizes only.
+
+    Returns:
+        dict: The absolute path of every pinned file, keyed by its Speech2Text (or Text2Speech) argument name.
+    '''
+    if not is_pinned(store_dir):
+        raise Exception(f"No model is pinned in {store_dir}. Run 'python main.py model-store pin' (or 'pin-tts') with network first.")
+    with open(manifest_path(store_dir), "r") as f:
+        manifest = json.load(f)
+
+    paths = {key: check_entry(entry, store_dir, mode) for key, entry in manifest['files'].items()}
+    if 'references' not in manifest:
+        raise Exception(f"The manifest of {store_dir} predates the checks of the referenced files. Pin the model again.")
+    for entry in manifest['references']:
+        check_entry(entry, store_dir, mode)
+    return paths
+
+def load_pinned_model(store_dir: str = ASR_MODEL_STORE, device: str = ASR_DEVICE):
+    '''
+    Builds the ASR model from the store without any network access. The weights are memory-mapped.
+
+    Args:
+        store_dir (str): The directory of the store. Defaults to ASR_MODEL_STORE.
+        device (str): The device to run the model on. Defaults to ASR_DEVICE.
+
+    Returns:
+        Speech2Text
+    '''
+    # Never let huggingface-hub or espnet-model-zoo look anything up
+    enforce_offline(store_dir)
+
+    import torch
+    from espnet2.bin.asr_inference import Speech2Text
+
+    paths = verify_model(store_dir, ASR_MODEL_VERIFY)
+    model_file = paths.pop('asr_model_file')
+
+    # Build the network without weights, then map the weights file into it
+    asr_model = Speech2Text(**paths, asr_model_file = None, lm_weight = 0, nbest = 10, device = device)
+    state_dict = torch.load(model_file, map_location = 'cpu', mmap = True, weights_only = True)
+    asr_model.asr_model.load_state_dict(state_dict, assign = True)
+    asr_model.asr_model.to(device).eval()
+    return asr_model
+
+def benchmark_model_store(filename: str, store_dir: str = ASR_MODEL_STORE):
+    '''
+    Measures the startup time from the store and the latency of the first transcription.
+
+    Args:
+        filename (str): The WAV file to transcribe.
+        store_dir (str): The directory of the store. Defaults to ASR_MODEL_STORE.
+
+    Returns:
+        dict: The startup time and the first-transcription latency in seconds.
+    '''
+    from reazonspeech.espnet.asr import audio_from_path
+    from .asr import decode
+
+    start_time = time.perf_counter()
+    asr_model = load_pinned_model(store_dir)
+    startup = time.perf_counter() - start_time
+
+    audio = audio_from_path(os.path.abspath(filename))
+    start_time = time.perf_counter()
+    decode(asr_model, audio)
+    first_transcription = time.perf_counter() - start_time
+
+    print(f"Startup from store: {startup:.2f} s, first transcription: {first_transcription:.2f} s")
+    return {'startup': startup, 'first_transcription': first_transcription}
@@ -0,0 +1,133 @@
+'''
+noise_suppress.py
+
+This file contains the noise suppression and the automatic gain control applied to the microphone stream.
+Both run block by block in the audio callback, after the echo canceller. The noise suppressor tracks the
+spectrum of the background noise (crowd, fans) and attenuates it with a Wiener gain in the frequency
+domain; the gain control brings quiet voices up to a steady level before they are recorded.
+'''
+
+import numpy as np
+
+from .constant import CHUNK, RATE, NS_MAX_ATTENUATION_DB, NS_NOISE_RISE_DB, NS_SMOOTHING, NS_OVERESTIMATION, AGC_TARGET_DBFS, AGC_MAX_GAIN_DB, AGC_GATE_DBFS, AGC_PEAK, AGC_RELEASE
+
+
+class NoiseSuppressor:
+    '''
+    NoiseSuppressor
+    Suppresses stationary noise with a short-time Fourier transform (sqrt-Hann windows, 50% overlap).
+    Every block is the hop of the transform, so the output is delayed by exactly one block.
+
+    Attributes:
+        blocksize (int): The number of samples in each block.
+        noise (np.ndarray): The estimated noise power of every frequency bin, or None before the first block.
+        previous (np.ndarray): The previous input block.
+        overlap (np.ndarray): The second half of the previous synthesis frame.
+    '''
+    def __init__(self, blocksize: int = CHUNK, samplerate: int = RATE):
+        '''
+        Constructor
+
+        Args:
+            blocksize (int): The number of samples in each block.
+            samplerate (int): The sample rate, which sets how fast the noise estimate may rise.
+        '''
+        self.blocksize = blocksize
+        self.window = np.sqrt(np.hanning(2 * blocksize + 1)[:-1]).astype('float32')
+        self.min_gain = 10 ** (-NS_MAX_ATTENUATION_DB / 20)
+        self.noise_rise = 10 ** (NS_NOISE_RISE_DB * blocksize / samplerate / 10)
+        self.reset()
+
+    def reset(self):
+        '''
+        Forgets the noise estimate and the signal history.
+        '''
+        bins = self.blocksize + 1
+        self.noise = None
+        self.previous_gain = np.ones(bins, dtype = 'float32')
+        self.previous_snr = np.ones(bins, dtype = 'float32')
+        self.previous = np.zeros(self.blocksize, dtype = 'float32')
+        self.overlap = np.zeros(self.blocksize, dtype = 'float32')
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        '''
+        Suppresses the noise of one block.
+
+        Args:
+            block (np.ndarray): The microphone block, blocksize samples.
+
+        Returns:
+            np.ndarray: The cleaned block, one block behind the input.
+        '''
+        frame = np.concatenate((self.previous, block)) * self.window
+        self.previous = block.astype('float32', copy = True)
+        spectrum = np.fft.rfft(frame)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+
+        # Follow the noise down at once and up slowly, so that speech does not raise it
+        if self.noise is None:
+            self.noise = power + 1e-12
+        else:
+            self.noise = np.where(power < self.noise, NS_SMOOTHING * self.noise + (1 - NS_SMOOTHING) * power, self.noise * self.noise_rise)
+
+        # Decision-directed a priori SNR and Wiener gain. Tracking the minima underestimates the noise, hence the factor
+        snr_post = power / (NS_OVERESTIMATION * self.noise)
+        snr_prio = NS_SMOOTHING * self.previous_gain ** 2 * self.previous_snr + (1 - NS_SMOOTHING) * np.maximum(snr_post - 1, 0)
+        gain = np.maximum(snr_prio / (1 + snr_prio), self.min_gain)
+        self.previous_gain = gain
+        self.previous_snr = snr_post
+
+        synthesis = np.fft.irfft(spectrum * gain, 2 * self.blocksize).astype('float32') * self.window
+        out = self.overlap + synthesis[:self.blocksize]
+        self.overlap = synthesis[self.blocksize:]
+        return out
+
+
+class AutomaticGainControl:
+    '''
+    AutomaticGainControl
+    Raises the level of quiet speech towards AGC_TARGET_DBFS. The gain never goes below 1,
+    so clipping in the input stays visible to the quality gate, and never pushes peaks above AGC_PEAK.
+    Blocks below AGC_GATE_DBFS (the pauses) are left at unity gain, so the remaining noise is not raised.
+
+    Attributes:
+        speech_gain (float): The gain learned on the speech blocks, kept across pauses.
+        gain (float): The gain applied at the end of the last block.
+    '''
+    def __init__(self):
+        self.max_gain = 10 ** (AGC_MAX_GAIN_DB / 20)
+        self.target = 10 ** (AGC_TARGET_DBFS / 20)
+        self.gate = 10 ** (AGC_GATE_DBFS / 20)
+        self.reset()
+
+    def reset(self):
+        '''
+        Goes back to unity gain.
+        '''
+        self.speech_gain = 1.0
+        self.gain = 1.0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        '''
+        Applies the gain to one block, ramping from the previous gain to avoid clicks.
+
+        Args:
+            block (np.ndarray): The block.
+
+        Returns:
+            np.ndarray
+        '''
+        rms = float(np.sqrt(np.dot(block, block) / len(block)))
+        peak = float(np.abs(block).max())
+        target_gain = 1.0
+        if rms > self.gate:
+            # Learn the level only while someone speaks, quickly down and slowly up
+            desired = min(self.max_gain, max(1.0, self.target / rms))
+            self.speech_gain = desired if desired < self.speech_gain else self.speech_gain + AGC_RELEASE * (desired - self.speech_gain)
+            target_gain = self.speech_gain
+        if peak > 0:
+            target_gain = max(1.0, min(target_gain, AGC_PEAK / peak))
+
+        ramp = np.linspace(self.gain, target_gain, len(block), dtype = 'float32')
+        self.gain = target_gain
+        return block * ramp
@@ -0,0 +1,182 @@
+'''
+prompt_build.py
+
+This file builds the prompt audio clips (data/audio/<lang>/*.mp3) from the prompt texts (data/prompt_text/<lang>/*.txt).
+A manifest keeps the hash of the text and synthesis settings used for every clip, so only the missing
+or stale clips are synthesized again. The clips are synthesized in parallel through the STEN TTS API,
+then transcoded and normalized to the same loudness.
+'''
+
+import glob
+import hashlib
+import json
+import os
+import requests
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+from pydub import AudioSegment
+
+from .constant import *
+from .voice_change import call_sten_api
+from .audio_file import open_wav
+
+
+def prompt_hash(text: str, code_lang: str, reference_digest: str) -> str:
+    '''
+    Computes the hash identifying a clip: its text and every setting that changes the result.
+
+    Args:
+        text (str): The prompt text.
+        code_lang (str): The STEN language name.
+        reference_digest (str): The SHA-256 of the content of the reference audio.
+
+    Returns:
+        string
+    '''
+    settings = [text, code_lang, reference_digest, str(PROMPT_TARGET_DBFS), str(PROMPT_SAMPLE_RATE), PROMPT_BITRATE]
+    return hashlib.sha256("\n".join(settings).encode('utf-8')).hexdigest()
+
+def load_manifest(filename: str = PROMPT_MANIFEST) -> dict:
+    '''
+    Loads the prompt manifest, or returns an empty one.
+
+    Args:
+        filename (str): The path to the manifest. Defaults to PROMPT_MANIFEST.
+
+    Returns:
+        dict: The clip hashes, keyed by "<lang>/<name>".
+    '''
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, "r") as f:
+        return json.load(f)
+
+def save_manifest(manifest: dict, filename: str = PROMPT_MANIFEST):
+    '''
+    Saves the prompt manifest atomically.
+
+    Args:
+        manifest (dict): The clip hashes, keyed by "<lang>/<name>".
+        filename (str): The path to the manifest. Defaults to PROMPT_MANIFEST.
+
+    Returns:
+        None
+    '''
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, "w") as f:
+        json.dump(manifest, f, indent = 2, sort_keys = True, ensure_ascii = False)
+    os.replace(temp_filename, filename)
+
+def find_prompts(languages: list = None) -> list:
+    '''
+    Lists every prompt text.
+
+    Args:
+        languages (list): The languages to list. Defaults to every folder in PROMPT_TEXT_FOLDER.
+
+    Returns:
+        list: (key, language, text path, clip path) tuples.
+    '''
+    if not languages:
+        languages = sorted(os.path.basename(os.path.dirname(path)) for path in glob.glob(os.path.join(PROMPT_TEXT_FOLDER, "*", "")))
+
+    prompts = []
+    for language in languages:
+        for text_path in sorted(glob.glob(os.path.join(PROMPT_TEXT_FOLDER, language, "*.txt"))):
+            name = os.path.splitext(os.path.basename(text_path))[0]
+            clip_path = os.path.join(AUDIO_FOLDER, language, f"{name}.mp3")
+            prompts.append((f"{language}/{name}", language, text_path, clip_path))
+    return prompts
+
+def synthesize_prompt(text: str, code_lang: str, reference, clip_path: str):
+    '''
+    Synthesizes one prompt, then transcodes and normalizes it into the clip file.
+
+    Args:
+        text (str): The prompt text.
+        code_lang (str): The STEN language name.
+        reference (bytes-like): The reference WAV file, streamed with every request.
+        clip_path (str): The path of the MP3 file to write.
+
+    Returns:
+        None
+    '''
+    url = call_sten_api(text, code_lang, reference)
+    response = requests.get(url)
+    if response.status_code != 200:
+        raise Exception(f"Failed to fetch synthesized audio ({response.status_code}).")
+
+    audio = AudioSegment.from_file(BytesIO(response.content), format = 'mp3')
+    audio = audio.set_channels(1).set_frame_rate(PROMPT_SAMPLE_RATE)
+    if audio.dBFS == float('-inf'):
+        # No gain brings silence to the target loudness
+        raise Exception("Synthesized audio is silent.")
+    audio = audio.apply_gain(PROMPT_TARGET_DBFS - audio.dBFS)
+
+    os.makedirs(os.path.dirname(clip_path), exist_ok = True)
+    temp_path = f"{clip_path}.tmp"
+    audio.export(temp_path, format = 'mp3', bitrate = PROMPT_BITRATE)
+    os.replace(temp_path, clip_path)
+
+def build_prompts(languages: list = None, force: bool = False, adopt: bool = False):
+    '''
+    Synthesizes the missing and stale prompt clips in parallel.
+
+    Args:
+        languages (list): The languages to build. Defaults to every language with prompt texts.
+        force (bool): Whether to rebuild every clip.
+        adopt (bool): Whether existing clips missing from the manifest are kept as they are (and recorded) instead of being rebuilt.
+            Nothing checks that an adopted clip matches its text: adopt only clips known to be current.
+
+    Returns:
+        None
+    '''
+    manifest = load_manifest()
+    jobs = []
+
+    # The content of the reference, not its path, so that a new recording at the same path rebuilds the clips
+    reference = open_wav(PROMPT_REFERENCE_AUDIO).raw
+    reference_digest = hashlib.sha256(reference).hexdigest()
+
+    for key, language, text_path, clip_path in find_prompts(languages):
+        if language not in STEN_LANGUAGES:
+            print(f"SKIPPED {key}: unknown language {language}")
+            continue
+        with open(text_path, "r", encoding = "utf-8") as f:
+            text = f.read().strip()
+        code_lang = STEN_LANGUAGES[language]
+        digest = prompt_hash(text, code_lang, reference_digest)
+
+        if not force and os.path.exists(clip_path):
+            if manifest.get(key) == digest:
+                continue
+            if key not in manifest and adopt:
+                print(f"ADOPTED {key}")
+                manifest[key] = digest
+                continue
+        jobs.append((key, text, code_lang, clip_path, digest))
+
+    save_manifest(manifest)
+    if len(jobs) == 0:
+        print("All prompt clips are up to date.")
+        return
+
+    print(f"BUILDING {len(jobs)} PROMPT CLIPS...")
+    failures = 0
+    with ThreadPoolExecutor(max_workers = PROMPT_BUILD_WORKERS) as executor:
+        futures = {executor.submit(synthesize_prompt, text, code_lang, reference, clip_path): (key, digest) for key, text, code_lang, clip_path, digest in jobs}
+        for future in as_completed(futures):
+            key, digest = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failures += 1
+                print(f"FAILED {key}: {e}")
+                continue
+            # Record every finished clip at once, so an interrupted build keeps its progress
+            manifest[key] = digest
+            save_manifest(manifest)
+            print(f"BUILT {key}")
+
+    print(f"Prompt clips built: {len(jobs) - failures}, failed: {failures}.")
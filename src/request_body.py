@@ -0,0 +1,52 @@
+'''
+request_body.py
+
+This file streams JSON request bodies that carry binary data as base64.
+Instead of building the base64 string, the dict and the JSON string in memory (three copies of the audio),
+the body is generated piece by piece: the JSON before the binary field, the base64 of the data in small
+chunks, then the JSON after it. Given to requests as a generator, it is sent with chunked transfer encoding.
+'''
+
+import base64
+import json
+
+from .constant import STEN_STREAM_CHUNK
+
+PLACEHOLDER = "\x00binary\x00"
+
+
+def base64_chunks(data, chunk_size: int = STEN_STREAM_CHUNK):
+    '''
+    Encodes data in base64, one chunk at a time.
+
+    Args:
+        data (bytes-like): The data to encode, e.g. the memoryview of a mapped file.
+        chunk_size (int): The number of input bytes per chunk, rounded down to a multiple of 3
+            so that the chunks concatenate into valid base64. Defaults to STEN_STREAM_CHUNK.
+
+    Yields:
+        bytes
+    '''
+    view = memoryview(data).cast('B')
+    chunk_size = max(3, chunk_size - chunk_size % 3)
+    for offset in range(0, len(view), chunk_size):
+        yield base64.b64encode(view[offset:offset + chunk_size])
+
+def stream_json_body(fields: dict, binary_field: str, data, chunk_size: int = STEN_STREAM_CHUNK):
+    '''
+    Generates a JSON object whose binary field holds the base64 of the data.
+
+    Args:
+        fields (dict): The other fields of the object. The binary field keeps its position in the dict if it is present.
+        binary_field (str): The name of the field holding the data.
+        data (bytes-like): The data to encode.
+        chunk_size (int): The number of input bytes per chunk. Defaults to STEN_STREAM_CHUNK.
+
+    Yields:
+        bytes
+    '''
+    body = json.dumps({**fields, binary_field: PLACEHOLDER})
+    prefix, suffix = body.split(json.dumps(PLACEHOLDER))
+    yield (prefix + '"').encode('utf-8')
+    yield from base64_chunks(data, chunk_size)
+    yield ('"' + suffix).encode('utf-8')
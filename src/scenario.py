@@ -0,0 +1,61 @@
+'''
+scenario.py
+
+This file loads the scenario profiles of the demo from SCENARIO_FILE.
+A scenario decides which steps each key runs, which clips are played and whether the voice is synthesized,
+so that one window class serves every variant of the demo.
+'''
+
+import json
+
+from .constant import SCENARIO_FILE, DEFAULT_SCENARIO
+
+
+class Scenario:
+    '''
+    Scenario
+    The profile of one variant of the demo.
+
+    Attributes:
+        name (str): The name of the scenario.
+        language (str): The language of the prompt clips ("en" or "jp").
+        key_sequences (dict): The action queue started by each key, keyed by the key text.
+        initial_talk (list): The clips played before the recording.
+        second_talk (list): The clips played after the synthesized voice.
+        final_talk (list): The clips played at the end.
+        processing_clip (str): The clip played while the recording is processed.
+        synthesis (bool): Whether the voice of the visitor is synthesized and played.
+    '''
+    def __init__(self, name: str, profile: dict):
+        '''
+        Constructor
+
+        Args:
+            name (str): The name of the scenario.
+            profile (dict): The settings of the scenario.
+        '''
+        self.name = name
+        self.language = profile.get('language', "en")
+        self.key_sequences = profile.get('key_sequences', {"1": [1, 2, 3, 4, 5], "2": [3, 5], "3": [6]})
+        self.initial_talk = profile.get('initial_talk', ["1", "2", "3"])
+        self.second_talk = profile.get('second_talk', ["6", "7"])
+        self.final_talk = profile.get('final_talk', ["9", "10"])
+        self.processing_clip = profile.get('processing_clip', "4")
+        self.synthesis = profile.get('synthesis', True)
+
+def load_scenario(name: str = DEFAULT_SCENARIO, filename: str = SCENARIO_FILE) -> Scenario:
+    '''
+    Loads a scenario from the scenario file.
+
+    Args:
+        name (str): The name of the scenario. Defaults to DEFAULT_SCENARIO.
+        filename (str): The path to the scenario file. Defaults to SCENARIO_FILE.
+
+    Returns:
+        Scenario
+    '''
+    with open(filename, "r", encoding = "utf-8") as f:
+        profiles = json.load(f)
+    if name not in profiles:
+        raise Exception(f"Invalid scenario name: {name}")
+    return Scenario(name, profiles[name])
@@ -0,0 +1,340 @@
+'''
+session_archive.py
+
+This file contains the archive of the visitor sessions.
+Every cycle adds one session: the recording and the synthesized voice, encoded in Opus (resampled to
+SESSION_OPUS_RATE when needed) or FLAC as set by SESSION_ARCHIVE_CODEC, are appended to
+segment files (a new segment is started after SESSION_SEGMENT_BYTES), and a SQLite index records where they
+are together with the date, language, transcript, STEN audio_path, backend and stage timings of the session.
+Nothing is ever rewritten: a blob is indexed only once it is on disk, so a crash loses at most the
+session being written. The writes run on their own thread, off the critical path of the visitor.
+'''
+
+import glob
+import io
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+import soundfile as sf
+
+from concurrent.futures import ThreadPoolExecutor
+from math import gcd
+from scipy.signal import resample_poly
+
+from .constant import *
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    language TEXT NOT NULL,
+    scenario TEXT NOT NULL,
+    transcript TEXT NOT NULL,
+    audio_path TEXT,
+    backend TEXT,
+    quality TEXT,
+    latency REAL,
+    timings TEXT NOT NULL,
+    recording_segment INTEGER,
+    recording_offset INTEGER,
+    recording_length INTEGER,
+    recording_seconds REAL,
+    synthesis_segment INTEGER,
+    synthesis_offset INTEGER,
+    synthesis_length INTEGER,
+    synthesis_seconds REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_started_at ON sessions (started_at);
+CREATE INDEX IF NOT EXISTS sessions_language ON sessions (language, started_at);
+CREATE INDEX IF NOT EXISTS sessions_latency ON sessions (latency);
+'''
+
+# The sample rates Opus encodes at
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+def encode_flac(samples: np.ndarray, sample_rate: int) -> bytes:
+    '''
+    Encodes samples in FLAC.
+
+    Args:
+        samples (np.ndarray): The samples, integer or float in [-1, 1].
+        sample_rate (int): The sample rate.
+
+    Returns:
+        bytes
+    '''
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sample_rate, format = 'FLAC', subtype = 'PCM_16')
+    return buffer.getvalue()
+
+def encode_opus(samples: np.ndarray, sample_rate: int) -> bytes:
+    '''
+    Encodes samples in Opus (in an Ogg file), resampling them to SESSION_OPUS_RATE when Opus does not support their rate.
+
+    Args:
+        samples (np.ndarray): The samples, integer or float in [-1, 1].
+        sample_rate (int): The sample rate.
+
+    Returns:
+        bytes
+    '''
+    if np.issubdtype(samples.dtype, np.integer):
+        samples = samples.astype('float32') / -np.iinfo(samples.dtype).min
+    if sample_rate not in OPUS_RATES:
+        divisor = gcd(SESSION_OPUS_RATE, sample_rate)
+        samples = resample_poly(samples, SESSION_OPUS_RATE // divisor, sample_rate // divisor, axis = 0).astype('float32')
+        sample_rate = SESSION_OPUS_RATE
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sample_rate, format = 'OGG', subtype = 'OPUS')
+    return buffer.getvalue()
+
+def encode_audio(samples: np.ndarray, sample_rate: int, codec: str = SESSION_ARCHIVE_CODEC) -> bytes:
+    '''
+    Encodes samples with the codec of the archive.
+
+    Args:
+        samples (np.ndarray): The samples, integer or float in [-1, 1].
+        sample_rate (int): The sample rate.
+        codec (str): "opus" or "flac". Defaults to SESSION_ARCHIVE_CODEC.
+
+    Returns:
+        bytes
+    '''
+    if codec == "opus":
+        return encode_opus(samples, sample_rate)
+    if codec == "flac":
+        return encode_flac(samples, sample_rate)
+    raise ValueError(f"Invalid SESSION_ARCHIVE_CODEC {codec!r}, expected \"opus\" or \"flac\"")
+
+def blob_extension(blob: bytes) -> str:
+    '''
+    Returns the file extension of an encoded blob, from its signature.
+    '''
+    return ".opus" if blob.startswith(b"OggS") else ".flac"
+
+def segment_path(number: int, folder: str = SESSION_ARCHIVE_FOLDER) -> str:
+    return os.path.join(folder, f"segment-{number:06d}.dat")
+
+def connect(folder: str = SESSION_ARCHIVE_FOLDER) -> sqlite3.Connection:
+    '''
+    Opens the index of an archive, creating it if needed.
+
+    Args:
+        folder (str): The folder of the archive. Defaults to SESSION_ARCHIVE_FOLDER.
+
+    Returns:
+        sqlite3.Connection
+    '''
+    os.makedirs(folder, exist_ok = True)
+    connection = sqlite3.connect(os.path.join(folder, "index.sqlite"))
+    connection.row_factory = sqlite3.Row
+    # WAL lets the queries read while the archive writes
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class SessionArchive:
+    '''
+    SessionArchive
+    Appends the sessions to the archive on a background thread.
+
+    Attributes:
+        folder (str): The folder of the segments and the index.
+        segment (int): The number of the segment being appended to.
+    '''
+    def __init__(self, folder: str = SESSION_ARCHIVE_FOLDER, segment_bytes: int = SESSION_SEGMENT_BYTES, codec: str = SESSION_ARCHIVE_CODEC):
+        '''
+        Constructor
+
+        Args:
+            folder (str): The folder of the archive. Defaults to SESSION_ARCHIVE_FOLDER.
+            segment_bytes (int): The size after which a new segment is started. Defaults to SESSION_SEGMENT_BYTES.
+            codec (str): The codec of the audio, "opus" or "flac". Defaults to SESSION_ARCHIVE_CODEC.
+        '''
+        self.folder = folder
+        self.segment_bytes = segment_bytes
+        self.codec = codec
+        self.connection = None
+        self.segment = None
+        self.executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "session-archive")
+
+    def submit(self, recording: tuple, synthesis: tuple, details: dict):
+        '''
+        Queues a session to be archived. Returns at once: the encoding and the writes run on the archive thread.
+        The caller must not modify the samples afterwards.
+
+        Args:
+            recording (tuple): The samples and the sample rate of the recording, or None.
+            synthesis (tuple): The samples and the sample rate of the synthesized voice, or None.
+            details (dict): The columns of the session: language, scenario, transcript, audio_path, backend, quality, latency and timings.
+
+        Returns:
+            Future: The id of the session.
+        '''
+        details = dict(details, started_at = details.get('started_at') or time.strftime("%Y-%m-%dT%H:%M:%S"))
+        return self.executor.submit(self.write, recording, synthesis, details)
+
+    def write(self, recording: tuple, synthesis: tuple, details: dict) -> int:
+        '''
+        Encodes and appends the audio of a session, then indexes it.
+
+        Returns:
+            int: The id of the session.
+        '''
+        try:
+            if self.connection is None:
+                # The connection belongs to the archive thread
+                self.connection = connect(self.folder)
+            columns = dict(details)
+            columns['timings'] = json.dumps(details.get('timings', {}))
+            for name, audio in (("recording", recording), ("synthesis", synthesis)):
+                if audio is None:
+                    continue
+                samples, sample_rate = audio
+                columns[f"{name}_segment"], columns[f"{name}_offset"], columns[f"{name}_length"] = self.append(encode_audio(samples, sample_rate, self.codec))
+                columns[f"{name}_seconds"] = len(samples) / sample_rate
+
+            names = ", ".join(columns)
+            cursor = self.connection.execute(f"INSERT INTO sessions ({names}) VALUES ({', '.join('?' * len(columns))})", list(columns.values()))
+            self.connection.commit()
+            print(f"SESSION {cursor.lastrowid} ARCHIVED")
+            return cursor.lastrowid
+        except Exception as e:
+            # The archive must never stop the demo
+            print(f"SESSION ARCHIVE FAILED: {e!r}")
+            return None
+
+    def append(self, blob: bytes) -> tuple:
+        '''
+        Appends a blob to the current segment, starting a new one when it is full.
+
+        Returns:
+            tuple: The segment, the offset and the length of the blob.
+        '''
+        if self.segment is None:
+            segments = sorted(glob.glob(os.path.join(self.folder, "segment-*.dat")))
+            self.segment = int(os.path.basename(segments[-1])[8:14]) if segments else 1
+        path = segment_path(self.segment, self.folder)
+        if os.path.exists(path) and os.path.getsize(path) > 0 and os.path.getsize(path) + len(blob) > self.segment_bytes:
+            self.segment += 1
+            path = segment_path(self.segment, self.folder)
+
+        with open(path, "ab") as f:
+            offset = f.tell()
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        return self.segment, offset, len(blob)
+
+
+def read_blob(segment: int, offset: int, length: int, folder: str = SESSION_ARCHIVE_FOLDER) -> bytes:
+    '''
+    Reads a blob of the archive.
+
+    Args:
+        segment (int): The number of the segment.
+        offset (int): The offset of the blob in the segment.
+        length (int): The length of the blob.
+        folder (str): The folder of the archive. Defaults to SESSION_ARCHIVE_FOLDER.
+
+    Returns:
+        bytes: The Opus or FLAC file.
+    '''
+    with open(segment_path(segment, folder), "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+def query_sessions(date_from: str = None, date_to: str = None, language: str = None, min_latency: float = None, max_latency: float = None, folder: str = SESSION_ARCHIVE_FOLDER) -> list:
+    '''
+    Finds the sessions matching every given criterion.
+
+    Args:
+        date_from (str): The first day, "YYYY-MM-DD".
+        date_to (str): The last day, "YYYY-MM-DD", included.
+        language (str): The language of the session ("en" or "jp").
+        min_latency (float): The minimum latency from the end of the recording to the playback, in seconds.
+        max_latency (float): The maximum latency in seconds.
+        folder (str): The folder of the archive. Defaults to SESSION_ARCHIVE_FOLDER.
+
+    Returns:
+        list: The sessions, as sqlite3.Row, oldest first.
+    '''
+    conditions, parameters = [], []
+    if date_from:
+        conditions.append("started_at >= ?")
+        parameters.append(date_from)
+    if date_to:
+        conditions.append("started_at < date(?, '+1 day')")
+        parameters.append(date_to)
+    if language:
+        conditions.append("language = ?")
+        parameters.append(language)
+    if min_latency is not None:
+        conditions.append("latency >= ?")
+        parameters.append(min_latency)
+    if max_latency is not None:
+        conditions.append("latency <= ?")
+        parameters.append(max_latency)
+
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    connection = connect(folder)
+    try:
+        return connection.execute(f"SELECT * FROM sessions{where} ORDER BY started_at, id", parameters).fetchall()
+    finally:
+        connection.close()
+
+def export_session(session_id: int, destination: str, folder: str = SESSION_ARCHIVE_FOLDER) -> list:
+    '''
+    Writes the audio of a session to Opus or FLAC files, as it was archived.
+
+    Args:
+        session_id (int): The id of the session.
+        destination (str): The folder to write to.
+        folder (str): The folder of the archive. Defaults to SESSION_ARCHIVE_FOLDER.
+
+    Returns:
+        list: The paths of the files written.
+    '''
+    connection = connect(folder)
+    try:
+        row = connection.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    finally:
+        connection.close()
+    if row is None:
+        raise KeyError(f"No session {session_id} in {folder}")
+
+    os.makedirs(destination, exist_ok = True)
+    paths = []
+    for name in ("recording", "synthesis"):
+        if row[f"{name}_segment"] is None:
+            continue
+        blob = read_blob(row[f"{name}_segment"], row[f"{name}_offset"], row[f"{name}_length"], folder)
+        path = os.path.join(destination, f"session-{session_id}-{name}{blob_extension(blob)}")
+        with open(path, "wb") as f:
+            f.write(blob)
+        paths.append(path)
+    return paths
+
+def describe_session(row: sqlite3.Row) -> str:
+    latency = "-" if row['latency'] is None else f"{row['latency']:.2f} s"
+    return f"{row['id']:>5}  {row['started_at']}  {row['language']:<3}{latency:>8}  {row['backend'] or '-':<6} {row['transcript']}"
+
+
+session_archive = None
+
+def get_session_archive() -> SessionArchive:
+    '''
+    Returns the shared session archive.
+
+    Returns:
+        SessionArchive
+    '''
+    global session_archive
+    if session_archive is None:
+        session_archive = SessionArchive()
+    return session_archive
@@ -0,0 +1,199 @@
+'''
+settings.py
+
+This file contains the layered settings of the project. The constants of constant.py are the defaults;
+each of them can be overridden, in order of precedence:
+  1. on the command line: --set NAME=VALUE (repeatable), and --settings FILE to use another settings file
+  2. by an environment variable: OPENCAMPUS_<NAME>=VALUE
+  3. in the settings file (SETTINGS_FILE, a JSON object of NAME: value)
+The type of every setting is the type of its default; overrides are parsed and checked against it
+(lists and dicts are given as JSON on the command line and in environment variables).
+'''
+
+import hashlib
+import json
+import os
+import sys
+
+ENV_PREFIX = "OPENCAMPUS_"
+SETTINGS_FILE_ENV = f"{ENV_PREFIX}SETTINGS_FILE"
+SETTINGS_TYPES = (bool, int, float, str, list, dict)
+
+# Settings whose default is computed from another one: name -> (base setting, function of the settings)
+DERIVED_SETTINGS = {
+    'PROMPT_SAMPLE_RATE': ('RATE', lambda settings: settings['RATE']),
+    'COUNTDOWN_OVERLAP': ('ECHO_CANCELLATION', lambda settings: settings['ECHO_CANCELLATION']),
+    'STEN_URLS': ('STEN_URL', lambda settings: [settings['STEN_URL']] + settings['STEN_URLS'][1:]),
+}
+
+# The layer each setting comes from: "default", "file", "env", "cli" or "derived"
+sources = {}
+
+# The digest of the settings file and the environment layers applied, see fingerprint()
+loaded_fingerprint = None
+
+
+def schema(namespace: dict) -> dict:
+    '''
+    Returns the settings of a namespace: every upper-case name with a value of a supported type.
+
+    Args:
+        namespace (dict): The globals of constant.py.
+
+    Returns:
+        dict: The type of every setting.
+    '''
+    return {name: type(value) for name, value in namespace.items() if name.isupper() and isinstance(value, SETTINGS_TYPES)}
+
+def check_type(name: str, value, expected: type):
+    '''
+    Checks a parsed value against the type of its default.
+
+    Returns:
+        The value, with ints converted for float settings.
+    '''
+    if expected is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if type(value) is not expected:
+        raise ValueError(f"Setting {name} must be of type {expected.__name__}, got {type(value).__name__}: {value!r}")
+    return value
+
+def parse_value(name: str, text: str, expected: type):
+    '''
+    Parses the text of an environment variable or a command line flag.
+
+    Args:
+        name (str): The name of the setting.
+        text (str): The text to parse.
+        expected (type): The type of the default.
+
+    Returns:
+        The value.
+    '''
+    if expected is str:
+        return text
+    if expected is bool:
+        if text.lower() in ("1", "true", "yes", "on"):
+            return True
+        if text.lower() in ("0", "false", "no", "off"):
+            return False
+        raise ValueError(f"Setting {name} must be a boolean, got {text!r}")
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        raise ValueError(f"Setting {name} must be a {expected.__name__}, got {text!r}")
+    return check_type(name, value, expected)
+
+def parse_cli(argv: list) -> tuple:
+    '''
+    Collects the settings flags of a command line.
+
+    Args:
+        argv (list): The command line.
+
+    Returns:
+        tuple: The settings file given with --settings (or None) and the NAME=VALUE pairs given with --set.
+    '''
+    settings_file = None
+    pairs = []
+    index = 1
+    while index < len(argv):
+        if argv[index] in ("--set", "--settings") and index + 1 < len(argv):
+            if argv[index] == "--settings":
+                settings_file = argv[index + 1]
+            else:
+                pairs.append(argv[index + 1])
+            index += 2
+        else:
+            index += 1
+    return settings_file, pairs
+
+def strip_cli(argv: list) -> list:
+    '''
+    Returns a command line without its settings flags.
+    '''
+    stripped = []
+    skip = False
+    for index, arg in enumerate(argv):
+        if skip:
+            skip = False
+        elif arg in ("--set", "--settings") and index > 0 and index + 1 < len(argv):
+            skip = True
+        else:
+            stripped.append(arg)
+    return stripped
+
+def fingerprint(settings_file: str, environ: dict) -> str:
+    '''
+    Returns the digest of the settings file and environment layers: two processes with the same
+    fingerprint (and no settings flags) have the same settings.
+
+    Args:
+        settings_file (str): The path of the settings file used.
+        environ (dict): The environment.
+
+    Returns:
+        string
+    '''
+    digest = hashlib.sha256()
+    if settings_file and os.path.exists(settings_file):
+        with open(settings_file, 'rb') as f:
+            digest.update(f.read())
+    digest.update(b"\0")
+    digest.update(json.dumps(sorted((key, value) for key, value in environ.items() if key.startswith(ENV_PREFIX))).encode('utf-8'))
+    return digest.hexdigest()
+
+def apply_settings(namespace: dict, argv: list = None, environ: dict = None):
+    '''
+    Overrides the defaults of a namespace with the settings file, the environment and the command line.
+
+    Args:
+        namespace (dict): The globals of constant.py, updated in place.
+        argv (list): The command line. Defaults to sys.argv.
+        environ (dict): The environment. Defaults to os.environ.
+    '''
+    global loaded_fingerprint
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+    types = schema(namespace)
+    sources.update({name: "default" for name in types})
+
+    cli_file, cli_pairs = parse_cli(argv)
+    settings_file = cli_file or environ.get(SETTINGS_FILE_ENV) or namespace.get('SETTINGS_FILE')
+    overrides = []
+    if settings_file and os.path.exists(settings_file):
+        with open(settings_file, 'r', encoding = 'utf-8') as f:
+            overrides += [(name, value, "file") for name, value in json.load(f).items()]
+    elif cli_file or environ.get(SETTINGS_FILE_ENV):
+        raise FileNotFoundError(f"Settings file {settings_file} not found.")
+    loaded_fingerprint = fingerprint(settings_file, environ)
+    overrides += [(key[len(ENV_PREFIX):], value, "env") for key, value in environ.items() if key.startswith(ENV_PREFIX) and key != SETTINGS_FILE_ENV]
+    for pair in cli_pairs:
+        name, separator, value = pair.partition("=")
+        if not separator:
+            raise ValueError(f"Invalid --set {pair!r}, expected NAME=VALUE")
+        overrides.append((name, value, "cli"))
+
+    for name, value, layer in overrides:
+        if name not in types:
+            raise KeyError(f"Unknown setting {name} (from {layer})")
+        namespace[name] = check_type(name, value, types[name]) if layer == "file" else parse_value(name, value, types[name])
+        sources[name] = layer
+
+    # Derived defaults follow their base setting unless they were overridden themselves
+    for name, (base, function) in DERIVED_SETTINGS.items():
+        if name in types and sources.get(name) == "default" and sources.get(base) != "default":
+            namespace[name] = function(namespace)
+            sources[name] = "derived"
+
+def describe(namespace: dict) -> str:
+    '''
+    Lists the effective settings and where each one comes from.
+
+    Args:
+        namespace (dict): The globals of constant.py.
+
+    Returns:
+        string
+    '''
+    return "\n".join(f"{name} = {namespace[name]!r}  [{sources.get(name, 'default')}]" for name in sorted(schema(namespace)))
@@ -0,0 +1,143 @@
+'''
+stall_watchdog.py
+
+This file contains the watchdog of the Qt main thread.
+A QTimer on the main thread beats every WATCHDOG_HEARTBEAT_MS; a Python thread checks the beats, and when
+none came for WATCHDOG_THRESHOLD seconds the event loop is stalled (a blocking call on the UI thread).
+The stack of the main thread is captured while it is stuck, and when the loop comes back the stall is
+written to WATCHDOG_LOG together with the duration histogram of every stall so far.
+'''
+
+import queue
+import sys
+import threading
+import time
+import traceback
+
+from .constant import WATCHDOG_HEARTBEAT_MS, WATCHDOG_THRESHOLD, WATCHDOG_LOG
+from .metrics import get_metrics
+
+# Upper bounds of the histogram buckets, in seconds
+STALL_BUCKETS = [0.25, 0.5, 1.0, 2.0, 5.0, float('inf')]
+
+
+class StallWatchdog:
+    '''
+    StallWatchdog
+    Detects the stalls of the Qt event loop and records where the main thread was stuck.
+
+    Attributes:
+        resources (ResourceManager): The resource manager of the window, which owns the heartbeat timer.
+        histogram (list): The number of stalls in each bucket of STALL_BUCKETS.
+        stalls (int): The number of stalls detected.
+    '''
+    def __init__(self, resources, threshold: float = WATCHDOG_THRESHOLD, log_filename: str = WATCHDOG_LOG):
+        '''
+        Constructor
+
+        Args:
+            resources (ResourceManager): The resource manager of the window.
+            threshold (float): The time without heartbeat, in seconds, that counts as a stall. Defaults to WATCHDOG_THRESHOLD.
+            log_filename (str): The path of the stall log. Defaults to WATCHDOG_LOG.
+        '''
+        self.resources = resources
+        self.threshold = threshold
+        self.log_filename = log_filename
+        self.main_thread_id = threading.main_thread().ident
+        self.histogram = [0] * len(STALL_BUCKETS)
+        self.stalls = 0
+        self.longest = 0.0
+
+        self.last_beat = time.monotonic()
+        self.stall_stack = None
+        self.finished_stalls = queue.SimpleQueue()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        '''
+        Starts the heartbeat on the main thread and the watching thread.
+        '''
+        if self.running:
+            return
+        self.running = True
+        self.last_beat = time.monotonic()
+        self.resources.timer("watchdog", self.beat).start(WATCHDOG_HEARTBEAT_MS)
+        self.thread = threading.Thread(target = self.watch, name = "stall-watchdog", daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        '''
+        Stops watching.
+        '''
+        self.running = False
+        self.resources.timer("watchdog", self.beat).stop()
+
+    def beat(self):
+        '''
+        The heartbeat, on the main thread. Hands the stall that just ended, if any, to the watching thread.
+        '''
+        now = time.monotonic()
+        previous, self.last_beat = self.last_beat, now
+        stall, self.stall_stack = self.stall_stack, None
+        # A stack captured after an earlier beat belongs to no stall that is ending now
+        if stall is not None and stall[0] == previous:
+            self.finished_stalls.put((now - previous, stall[1]))
+
+    def watch(self):
+        '''
+        The watching loop, on its own thread. Captures the stack of the main thread once per stall,
+        and records the stalls that ended, so that the log is never written on the main thread.
+        '''
+        interval = self.threshold / 4
+        while self.running:
+            time.sleep(interval)
+            while not self.finished_stalls.empty():
+                self.record(*self.finished_stalls.get())
+            last_beat = self.last_beat
+            if self.stall_stack is None and time.monotonic() - last_beat > self.threshold:
+                frame = sys._current_frames().get(self.main_thread_id)
+                if frame is None:
+                    continue
+                stack = "".join(traceback.format_stack(frame))
+                # A beat during the capture ended the stall: the stack is no longer where the loop was stuck
+                if self.last_beat == last_beat:
+                    # Tagged with the beat before the stall, so that a beat racing with this assignment ignores it
+                    self.stall_stack = (last_beat, stack)
+
+    def record(self, duration: float, stack: str):
+        '''
+        Adds a stall to the histogram and appends it to the log.
+
+        Args:
+            duration (float): The time without heartbeat in seconds.
+            stack (str): The stack of the main thread during the stall.
+        '''
+        self.stalls += 1
+        self.longest = max(self.longest, duration)
+        for index, bound in enumerate(STALL_BUCKETS):
+            if duration <= bound:
+                self.histogram[index] += 1
+                break
+        get_metrics().gauge("stalls", f"{self.stalls} (longest {self.longest * 1000:.0f} ms)")
+        print(f"EVENT LOOP STALLED FOR {duration * 1000:.0f} ms")
+
+        with open(self.log_filename, "a") as f:
+            f.write(f"=== Stall {self.stalls} at {time.strftime('%Y-%m-%d %H:%M:%S')}: {duration * 1000:.0f} ms\n")
+            f.write(stack)
+            f.write(self.report() + "\n\n")
+
+    def report(self) -> str:
+        '''
+        Builds the duration histogram of the stalls.
+
+        Returns:
+            string
+        '''
+        lines = [f"Stalls: {self.stalls}, longest {self.longest * 1000:.0f} ms"]
+        lower = self.threshold
+        for bound, count in zip(STALL_BUCKETS, self.histogram):
+            label = f"> {lower:.2f} s" if bound == float('inf') else f"{lower:.2f}-{bound:.2f} s"
+            lines.append(f"  {label:<14}{count:>5} {'#' * min(count, 50)}")
+            lower = bound
+        return "\n".join(lines)
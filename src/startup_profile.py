@@ -0,0 +1,230 @@
+'''
+startup_profile.py
+
+This file contains the startup profiler used by "python main.py --profile-startup".
+It measures the import time of every module (self and cumulative) and records the work done at
+module level while importing: file opens, model loads, audio device probes and network requests.
+It imports nothing of the package at module level, so that main.py can install it before the package
+itself, its constants and the settings layer are imported.
+'''
+
+import builtins
+import importlib
+import io
+import pkgutil
+import sys
+import time
+
+# Module -> (attribute path, kind) of the functions whose calls are side effects when made during an import
+SIDE_EFFECT_HOOKS = {
+    'torch': [('load', 'model load')],
+    'reazonspeech.espnet.asr': [('load_model', 'model load')],
+    'espnet2.bin.asr_inference': [('Speech2Text.from_pretrained', 'model load')],
+    'sounddevice': [('query_devices', 'device probe'), ('Stream', 'device open'), ('rec', 'device open')],
+    'requests.sessions': [('Session.request', 'network')],
+}
+
+# Modules whose import itself touches a device
+IMPORT_SIDE_EFFECTS = {
+    'sounddevice': ('device probe', 'PortAudio initialized at import'),
+}
+
+
+class ImportRecord:
+    '''
+    ImportRecord
+    The measurements of one module import.
+    '''
+    def __init__(self, name: str):
+        self.name = name
+        self.cumulative = 0.0
+        self.children = 0.0
+
+    @property
+    def self_time(self) -> float:
+        return self.cumulative - self.children
+
+
+class StartupProfiler:
+    '''
+    StartupProfiler
+    Measures the imports made while it is installed.
+
+    Attributes:
+        records (dict): The ImportRecord of every imported module.
+        side_effects (list): The (module, kind, detail) side effects made at module level.
+    '''
+    def __init__(self):
+        self.records = {}
+        self.side_effects = []
+        self.stack = []
+        self.original_open = builtins.open
+        self.finder = ProfilingFinder(self)
+
+    def start(self):
+        '''
+        Installs the import hooks and the side effect hooks.
+        '''
+        sys.meta_path.insert(0, self.finder)
+        builtins.open = io.open = self.wrap(self.original_open, 'file open', lambda args, kwargs: str(args[0]) if args else '')
+        for module_name in SIDE_EFFECT_HOOKS:
+            if module_name in sys.modules:
+                self.install_hooks(module_name)
+
+    def stop(self):
+        '''
+        Removes the import hooks.
+        '''
+        if self.finder in sys.meta_path:
+            sys.meta_path.remove(self.finder)
+        builtins.open = io.open = self.original_open
+
+    def wrap(self, function, kind: str, describe = None):
+        '''
+        Wraps a function so that its calls made at module level are recorded as side effects.
+
+        Args:
+            function (function): The function to wrap.
+            kind (str): The kind of side effect.
+            describe (function): Builds the detail of a call from its arguments.
+
+        Returns:
+            function
+        '''
+        profiler = self
+        def wrapper(*args, **kwargs):
+            if profiler.stack:
+                detail = describe(args, kwargs) if describe else getattr(function, '__qualname__', str(function))
+                profiler.side_effects.append((profiler.stack[-1].name, kind, detail))
+            return function(*args, **kwargs)
+        wrapper.__wrapped__ = function
+        return wrapper
+
+    def install_hooks(self, module_name: str):
+        '''
+        Wraps the side effect functions of a module that has just been imported.
+        '''
+        module = sys.modules[module_name]
+        for attribute_path, kind in SIDE_EFFECT_HOOKS.get(module_name, []):
+            *owners, attribute = attribute_path.split('.')
+            owner = module
+            for name in owners:
+                owner = getattr(owner, name, None)
+            function = getattr(owner, attribute, None)
+            if function is None or hasattr(function, '__wrapped__'):
+                continue
+            if isinstance(owner, type) and isinstance(owner.__dict__.get(attribute), classmethod):
+                function = owner.__dict__[attribute].__func__
+                setattr(owner, attribute, classmethod(self.wrap(function, kind, lambda args, kwargs, name = attribute_path: name)))
+            else:
+                setattr(owner, attribute, self.wrap(function, kind, lambda args, kwargs, name = f"{module_name}.{attribute_path}": name))
+
+    def exec_module(self, name: str, exec_module, module):
+        '''
+        Runs the body of a module and measures it.
+        '''
+        record = self.records.setdefault(name, ImportRecord(name))
+        self.stack.append(record)
+        start_time = time.perf_counter()
+        try:
+            exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self.stack.pop()
+            record.cumulative += elapsed
+            if self.stack:
+                self.stack[-1].children += elapsed
+
+        if name in IMPORT_SIDE_EFFECTS:
+            self.side_effects.append((name,) + IMPORT_SIDE_EFFECTS[name])
+        if name in SIDE_EFFECT_HOOKS:
+            self.install_hooks(name)
+
+    def report(self, top: int = None) -> str:
+        '''
+        Builds the report, sorted by cumulative import time.
+
+        Args:
+            top (int): The number of modules listed. Defaults to STARTUP_PROFILE_TOP.
+
+        Returns:
+            string
+        '''
+        from .constant import STARTUP_PROFILE_TOP
+
+        top = top or STARTUP_PROFILE_TOP
+        records = sorted(self.records.values(), key = lambda record: record.cumulative, reverse = True)
+        lines = [
+            f"Imported {len(records)} modules",
+            "",
+            f"{'cumulative[ms]':>14}  {'self[ms]':>9}  module",
+        ]
+        for record in records[:top]:
+            lines.append(f"{record.cumulative * 1000:>14.1f}  {record.self_time * 1000:>9.1f}  {record.name}")
+
+        lines += ["", "Slowest modules by self time:"]
+        for record in sorted(records, key = lambda record: record.self_time, reverse = True)[:10]:
+            lines.append(f"{record.self_time * 1000:>14.1f}  {record.name}")
+
+        lines += ["", f"Module-level side effects ({len(self.side_effects)}):"]
+        for module_name, kind, detail in self.side_effects:
+            lines.append(f"  [{kind}] {module_name}: {detail}")
+        return "\n".join(lines)
+
+
+class ProfilingFinder:
+    '''
+    ProfilingFinder
+    A meta path finder that lets the other finders find the module, then measures the execution of its body.
+    '''
+    def __init__(self, profiler: StartupProfiler):
+        self.profiler = profiler
+
+    def find_spec(self, name: str, path = None, target = None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            loader = spec.loader
+            # Built-in and frozen modules share one loader class; they are cheap and left alone
+            if loader is not None and not isinstance(loader, type) and hasattr(loader, 'exec_module'):
+                exec_module = loader.exec_module
+                loader.exec_module = lambda module, name = name, exec_module = exec_module: self.profiler.exec_module(name, exec_module, module)
+            return spec
+        return None
+
+
+def profile_startup(module_names: list = None) -> StartupProfiler:
+    '''
+    Imports the package, then the given modules under the profiler and prints the report.
+
+    Args:
+        module_names (list): The modules to import, settings flags allowed. Defaults to every module of the src package except the example2 script.
+
+    Returns:
+        StartupProfiler
+    '''
+    profiler = StartupProfiler()
+    profiler.start()
+    start_time = time.perf_counter()
+    try:
+        # First the package, its constants and the settings layer, which run on every startup path
+        package = importlib.import_module(__name__.rsplit('.', 1)[0])
+        from .settings import strip_cli
+
+        module_names = strip_cli([""] + (module_names or []))[1:]
+        if not module_names:
+            module_names = [f"{package.__name__}.{info.name}" for info in pkgutil.iter_modules(package.__path__) if info.name != 'example2']
+        for module_name in module_names:
+            try:
+                importlib.import_module(module_name)
+            except Exception as e:
+                print(f"Failed to import {module_name}: {e!r}")
+    finally:
+        profiler.stop()
+
+    print(profiler.report())
+    print(f"\nTotal startup import time: {(time.perf_counter() - start_time) * 1000:.1f} ms")
+    return profiler
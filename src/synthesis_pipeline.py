@@ -0,0 +1,145 @@
+'''
+synthesis_pipeline.py
+
+This file fetches the synthesized voice in pipelined stages: the STEN POST, the download of the MP3
+and its decoding each run on their own worker, and every stage starts as soon as the previous one is done.
+The decoded samples stay in memory, ready to be queued on the audio device.
+'''
+
+import numpy as np
+import requests
+import time
+
+from concurrent.futures import ThreadPoolExecutor, Future
+from io import BytesIO
+from pydub import AudioSegment
+
+from .constant import WAVE_OUTPUT_FILENAME, SYNTHESIZED_OUTPUT_FILENAME, STEN_LANGUAGES, SYNTHESIS_TEXTS
+from .voice_change import call_sten_api
+from .audio_file import open_wav
+from .metrics import get_metrics
+
+
+class SynthesisJob:
+    '''
+    SynthesisJob
+    The futures of the stages of one synthesis.
+
+    Attributes:
+        audio_path (Future): The URL of the synthesized MP3, from the POST stage.
+        content (Future): The MP3 bytes, from the download stage.
+        samples (Future): The decoded (samples, sample rate), from the decode stage.
+    '''
+    def __init__(self):
+        self.audio_path = Future()
+        self.content = Future()
+        self.samples = Future()
+
+    def result(self, timeout: float = None) -> tuple:
+        '''
+        Waits until the synthesized audio is resident in memory.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds. Defaults to no limit.
+
+        Returns:
+            tuple: The samples and the sample rate.
+        '''
+        return self.samples.result(timeout)
+
+
+class SynthesisPipeline:
+    '''
+    SynthesisPipeline
+    Runs the POST, download and decode stages on separate workers.
+    '''
+    def __init__(self):
+        self.post_executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "sten-post")
+        self.download_executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "sten-download")
+        self.decode_executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "sten-decode")
+        self.session = requests.Session()
+
+    def submit(self, source_filename: str = WAVE_OUTPUT_FILENAME, language: str = "jp") -> SynthesisJob:
+        '''
+        Starts synthesizing the demo sentence with the voice of the source recording.
+
+        Args:
+            source_filename (str): The path to the reference recording. Defaults to WAVE_OUTPUT_FILENAME.
+            language (str): The language of the sentence ("en" or "jp").
+
+        Returns:
+            SynthesisJob
+        '''
+        job = SynthesisJob()
+        job.audio_path.add_done_callback(lambda _: self.chain(job.audio_path, job.content, self.download_executor, self.download))
+        job.content.add_done_callback(lambda _: self.chain(job.content, job.samples, self.decode_executor, self.decode))
+        self.post_executor.submit(self.run_stage, job.audio_path, self.post, source_filename, language)
+        return job
+
+    def run_stage(self, future: Future, function, *args):
+        '''
+        Runs a stage function and stores its outcome in the stage future.
+        The duration of the stage is reported to the metrics registry as tts_<stage>.
+        '''
+        if not future.set_running_or_notify_cancel():
+            return
+        start_time = time.perf_counter()
+        try:
+            future.set_result(function(*args))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            get_metrics().record(f"tts_{function.__name__}", time.perf_counter() - start_time)
+
+    def chain(self, previous: Future, future: Future, executor: ThreadPoolExecutor, function):
+        '''
+        Starts a stage with the result of the previous one, or propagates its failure.
+        '''
+        if previous.exception() is not None:
+            future.set_exception(previous.exception())
+            return
+        executor.submit(self.run_stage, future, function, previous.result())
+
+    '''
+    Stages
+    '''
+    def post(self, source_filename: str, language: str) -> str:
+        '''
+        Calls the STEN API and returns the URL of the synthesized MP3.
+        '''
+        code_lang = STEN_LANGUAGES.get(language, "japanese")
+        return call_sten_api(SYNTHESIS_TEXTS[code_lang], code_lang, open_wav(source_filename).raw)
+
+    def download(self, url: str) -> bytes:
+        '''
+        Downloads the synthesized MP3 and keeps a copy in SYNTHESIZED_OUTPUT_FILENAME.
+        '''
+        response = self.session.get(url)
+        if response.status_code != 200:
+            raise Exception("Failed to fetch synthesized audio.")
+        with open(SYNTHESIZED_OUTPUT_FILENAME, "wb") as f:
+            f.write(response.content)
+        return response.content
+
+    def decode(self, content: bytes) -> tuple:
+        '''
+        Decodes the MP3 into samples for the audio device.
+        '''
+        segment = AudioSegment.from_file(BytesIO(content), format = 'mp3')
+        samples = np.array(segment.get_array_of_samples()).reshape(-1, segment.channels)
+        return samples, segment.frame_rate
+
+
+synthesis_pipeline = None
+
+def get_synthesis_pipeline() -> SynthesisPipeline:
+    '''
+    Returns the shared synthesis pipeline.
+
+    Returns:
+        SynthesisPipeline
+    '''
+    global synthesis_pipeline
+    if synthesis_pipeline is None:
+        synthesis_pipeline = SynthesisPipeline()
+    return synthesis_pipeline
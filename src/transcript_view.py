@@ -0,0 +1,292 @@
+'''
+transcript_view.py
+
+This file contains the transcript overlay of the window.
+The text is split into words (every character is a word in Japanese, which has no spaces), wrapped and
+fitted to the box with the largest font size between TRANSCRIPT_MIN_FONT_PX and TRANSCRIPT_MAX_FONT_PX.
+The layout is computed once per text and size with cached QFontMetrics, and rendered once into a pixmap;
+painting only copies the revealed part of the pixmap, so revealing the words one by one costs no layout
+and no text rendering. The reveal takes at most TRANSCRIPT_REVEAL_MAX_MS, so that a long text (every
+character of a Japanese one) is fully shown well before the overlay is hidden.
+'''
+
+import re
+
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QFont, QFontMetrics, QPainter, QPixmap, QColor
+from PyQt5.QtCore import Qt, QRect
+
+from .constant import *
+
+# A CJK character or a run of other non-space characters, with the spaces before it
+WORD_PATTERN = re.compile(r"\s*(?:[\u3000-\u30ff\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]|[^\s\u3000-\u30ff\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]+)")
+
+# Punctuation that never starts a line: it sticks to the word before it
+CLOSING_PUNCTUATION = set("、。，．・：；？！ー）」』】〉》”’)]}.,!?:;")
+
+# Number of layouts kept, for the texts shown again (and the partial results of a streamed transcript)
+LAYOUT_CACHE_SIZE = 16
+
+
+def split_words(text: str) -> list:
+    '''
+    Splits a text into the words the lines may break between.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        list: The words, each with the spaces before it.
+    '''
+    words = []
+    for word in WORD_PATTERN.findall(text):
+        if words and word in CLOSING_PUNCTUATION:
+            words[-1] += word
+        else:
+            words.append(word)
+    return words
+
+
+class TranscriptLayout:
+    '''
+    TranscriptLayout
+    The position of every word of a text fitted in a box.
+
+    Attributes:
+        font_size (int): The font size in pixels.
+        lines (list): The (x, y, words) of every line, words being the (index, x, width) of its words.
+        line_height (int): The height of a line in pixels.
+        count (int): The number of words.
+    '''
+    def __init__(self, font_size: int, lines: list, line_height: int, count: int):
+        self.font_size = font_size
+        self.lines = lines
+        self.line_height = line_height
+        self.count = count
+
+
+class TranscriptOverlay(QWidget):
+    '''
+    TranscriptOverlay
+    Shows the transcript at the bottom of the video, fitted to its box and revealed word by word.
+
+    Attributes:
+        resources (ResourceManager): The resource manager of the window, which owns the reveal timer.
+        text (str): The text shown.
+        revealed (int): The number of words shown so far.
+    '''
+    def __init__(self, text: str, parent, resources):
+        '''
+        Constructor
+
+        Args:
+            text (str): The initial text.
+            parent (QWidget): The widget to draw on.
+            resources (ResourceManager): The resource manager of the window.
+        '''
+        super().__init__(parent)
+        self.resources = resources
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.base_font = QFont(self.font())
+        self.base_font.setBold(True)
+
+        self.metrics = {} # font size -> (QFont, QFontMetrics)
+        self.widths = {} # font size -> {word: width}
+        self.layouts = {} # (text, width, height) -> TranscriptLayout
+        self.layout = None
+        self.pixmap = None
+
+        self.text = ""
+        self.words = []
+        self.revealed = 0
+        self.set_text(text, reveal = False)
+
+    def set_text(self, text: str, reveal: bool = True):
+        '''
+        Sets the text. When the new text continues the current one (a partial result of a streamed transcript),
+        the words already shown stay and only the new ones are revealed.
+
+        Args:
+            text (str): The text.
+            reveal (bool): Whether to reveal the words one by one, or show them all at once.
+        '''
+        continued = text.startswith(self.text) and self.text != ""
+        self.text = text
+        self.words = split_words(text)
+        self.revealed = min(self.revealed, len(self.words)) if continued else 0
+        self.layout = None
+        self.pixmap = None
+
+        timer = self.resources.timer("transcript_reveal", self.reveal_next)
+        if not reveal or TRANSCRIPT_REVEAL_MS <= 0:
+            self.revealed = len(self.words)
+        elif self.revealed < len(self.words):
+            timer.start(self.reveal_interval(len(self.words) - self.revealed))
+        self.update()
+
+    def reveal_interval(self, count: int) -> int:
+        '''
+        Returns the time between two words, so that revealing the given number of words takes at most TRANSCRIPT_REVEAL_MAX_MS.
+
+        Args:
+            count (int): The number of words to reveal.
+
+        Returns:
+            int: The interval in milliseconds.
+        '''
+        return max(1, min(TRANSCRIPT_REVEAL_MS, TRANSCRIPT_REVEAL_MAX_MS // max(1, count)))
+
+    def reveal_next(self):
+        '''
+        Shows one more word.
+        '''
+        self.revealed += 1
+        if self.revealed >= len(self.words):
+            self.revealed = len(self.words)
+            self.resources.timer("transcript_reveal", self.reveal_next).stop()
+        self.update()
+
+    def restart_reveal(self):
+        '''
+        Hides the words and reveals them again from the first one.
+        '''
+        self.revealed = 0
+        if TRANSCRIPT_REVEAL_MS <= 0:
+            self.revealed = len(self.words)
+        elif self.words:
+            self.resources.timer("transcript_reveal", self.reveal_next).start(self.reveal_interval(len(self.words)))
+        self.update()
+
+    def font_metrics(self, size: int) -> tuple:
+        '''
+        Returns the font and the font metrics of a size, created once.
+        '''
+        if size not in self.metrics:
+            font = QFont(self.base_font)
+            font.setPixelSize(size)
+            self.metrics[size] = (font, QFontMetrics(font))
+            self.widths[size] = {}
+        return self.metrics[size]
+
+    def word_width(self, size: int, word: str) -> int:
+        '''
+        Returns the width of a word at a font size, measured once.
+        '''
+        widths = self.widths[size]
+        if word not in widths:
+            widths[word] = self.metrics[size][1].horizontalAdvance(word)
+        return widths[word]
+
+    def wrap(self, size: int, width: int) -> list:
+        '''
+        Breaks the words into lines at a font size.
+
+        Returns:
+            list: The lines, each a list of the (index, width) of its words, the spaces starting a line removed.
+        '''
+        self.font_metrics(size)
+        lines = [[]]
+        line_width = 0
+        for index, word in enumerate(self.words):
+            word_width = self.word_width(size, word)
+            if lines[-1] and line_width + word_width > width:
+                word_width = self.word_width(size, word.lstrip())
+                lines.append([])
+                line_width = 0
+            elif not lines[-1]:
+                word_width = self.word_width(size, word.lstrip())
+            lines[-1].append((index, word_width))
+            line_width += word_width
+        return lines
+
+    def fit(self, width: int, height: int) -> TranscriptLayout:
+        '''
+        Lays the text out with the largest font size whose lines fit in the box.
+        When even the smallest size does not fit, the last lines are kept, as they hold the latest words.
+
+        Args:
+            width (int): The width of the box in pixels.
+            height (int): The height of the box in pixels.
+
+        Returns:
+            TranscriptLayout
+        '''
+        key = (self.text, width, height)
+        if key in self.layouts:
+            return self.layouts[key]
+
+        def line_count_fits(size):
+            return len(self.wrap(size, width)) * self.font_metrics(size)[1].lineSpacing() <= height
+
+        # The height of the wrapped text grows with the font size: search the largest size that fits
+        low, high = TRANSCRIPT_MIN_FONT_PX, TRANSCRIPT_MAX_FONT_PX
+        while low < high:
+            middle = (low + high + 1) // 2
+            if line_count_fits(middle):
+                low = middle
+            else:
+                high = middle - 1
+        size = low
+        line_height = self.font_metrics(size)[1].lineSpacing()
+        wrapped = self.wrap(size, width)
+        wrapped = wrapped[-max(1, height // line_height):]
+
+        lines = []
+        top = (height - len(wrapped) * line_height) // 2
+        for number, line in enumerate(wrapped):
+            x = (width - sum(word_width for _, word_width in line)) // 2
+            words = []
+            for index, word_width in line:
+                words.append((index, x, word_width))
+                x += word_width
+            lines.append((words[0][1] if words else 0, top + number * line_height, words))
+
+        layout = TranscriptLayout(size, lines, line_height, len(self.words))
+        if len(self.layouts) >= LAYOUT_CACHE_SIZE:
+            self.layouts.pop(next(iter(self.layouts)))
+        self.layouts[key] = layout
+        return layout
+
+    def render(self) -> QPixmap:
+        '''
+        Renders the whole text once into a pixmap of the size of the widget.
+        '''
+        ratio = self.devicePixelRatioF()
+        width, height = self.width() - 2 * TRANSCRIPT_PADDING, self.height() - 2 * TRANSCRIPT_PADDING
+        self.layout = self.fit(max(1, width), max(1, height))
+
+        pixmap = QPixmap(int(self.width() * ratio), int(self.height() * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(QColor("black"))
+        painter = QPainter(pixmap)
+        painter.setFont(self.font_metrics(self.layout.font_size)[0])
+        painter.setPen(QColor("white"))
+        ascent = self.font_metrics(self.layout.font_size)[1].ascent()
+        for x, y, words in self.layout.lines:
+            for index, word_x, _ in words:
+                word = self.words[index].lstrip() if word_x == x else self.words[index]
+                painter.drawText(TRANSCRIPT_PADDING + word_x, TRANSCRIPT_PADDING + y + ascent, word)
+        painter.end()
+        return pixmap
+
+    def paintEvent(self, event):
+        if self.pixmap is None or self.pixmap.size() != self.size() * self.devicePixelRatioF():
+            self.pixmap = self.render()
+
+        # Copy the background and the revealed words from the pixmap
+        ratio = self.devicePixelRatioF()
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("black"))
+        for x, y, words in self.layout.lines:
+            shown = [word_x + word_width for index, word_x, word_width in words if index < self.revealed]
+            if not shown:
+                break
+            area = QRect(TRANSCRIPT_PADDING + x, TRANSCRIPT_PADDING + y, shown[-1] - x, self.layout.line_height)
+            source = QRect(int(area.x() * ratio), int(area.y() * ratio), int(area.width() * ratio), int(area.height() * ratio))
+            painter.drawPixmap(area, self.pixmap, source)
+        painter.end()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.pixmap = None
@@ -0,0 +1,316 @@
+'''
+tts_backend.py
+
+This file contains the text-to-speech backends and the deadline router choosing between them.
+Every backend turns the demo sentence into samples in memory. The router starts the first backend
+(the STEN API, which mimics the voice of the visitor) and switches to the next one (a local ESPnet
+model running on the CPU) when the first one fails or has not answered within TTS_DEADLINE, so that
+the visitor always hears something within a bounded time.
+'''
+
+import os
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from .constant import *
+from .metrics import get_metrics
+
+
+class TTSBackend(ABC):
+    '''
+    TTSBackend
+    The interface of a text-to-speech backend.
+
+    Attributes:
+        name (str): The name of the backend in TTS_BACKEND_ORDER.
+    '''
+    name = ""
+
+    @abstractmethod
+    def submit(self, source_filename: str, language: str) -> Future:
+        '''
+        Starts synthesizing the demo sentence.
+
+        Args:
+            source_filename (str): The path to the recording of the visitor, for the backends that mimic the voice.
+            language (str): The language of the sentence ("en" or "jp").
+
+        Returns:
+            Future: The samples and the sample rate. Backends that synthesize remotely set its audio_path attribute to the URL of the result.
+        '''
+
+    def preload(self):
+        '''
+        Prepares the backend in the background, so that its first synthesis is fast.
+        '''
+        pass
+
+
+class StenBackend(TTSBackend):
+    '''
+    StenBackend
+    Synthesizes with the voice of the visitor through the STEN API and the synthesis pipeline.
+    '''
+    name = "sten"
+
+    def submit(self, source_filename: str, language: str) -> Future:
+        from .synthesis_pipeline import get_synthesis_pipeline
+        job = get_synthesis_pipeline().submit(source_filename, language)
+        # The URL is known before the samples, so it is set by the time they are done
+        job.audio_path.add_done_callback(lambda future: setattr(job.samples, "audio_path", None if future.exception() else future.result()))
+        return job.samples
+
+
+class LocalBackend(TTSBackend):
+    '''
+    LocalBackend
+    Synthesizes with a pretrained ESPnet model on the CPU, in the default voice of the model.
+    The models are built from their pinned stores only: this backend is used when the network is down.
+
+    Attributes:
+        models (dict): The loaded Text2Speech model of every language.
+    '''
+    name = "local"
+
+    def __init__(self, model_tags: dict = TTS_LOCAL_MODELS, store_dir: str = TTS_LOCAL_MODEL_STORE):
+        '''
+        Constructor
+
+        Args:
+            model_tags (dict): The ESPnet model zoo tag of every language. Defaults to TTS_LOCAL_MODELS.
+            store_dir (str): The directory of the stores of the models. Defaults to TTS_LOCAL_MODEL_STORE.
+        '''
+        self.model_tags = model_tags
+        self.store_dir = store_dir
+        self.models = {}
+        self.model_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "tts-local")
+
+    def model_store(self, code_lang: str) -> str:
+        '''
+        Returns the directory of the store of the model of a language.
+        '''
+        return os.path.join(self.store_dir, code_lang)
+
+    def get_model(self, code_lang: str):
+        '''
+        Returns the model of a language, loading it from its store on first use.
+        '''
+        with self.model_lock:
+            if code_lang not in self.models:
+                from espnet2.bin.tts_inference import Text2Speech
+                from .model_store import verify_model
+
+                # The thread count of torch is process-wide and set for the ASR model (ASR_NUM_THREADS):
+                # the local model runs with it rather than change it under a running transcription
+                start_time = time.perf_counter()
+                paths = verify_model(self.model_store(code_lang), TTS_LOCAL_MODEL_VERIFY)
+                self.models[code_lang] = Text2Speech(**paths, device = "cpu")
+                print(f"Local TTS model for {code_lang} loaded in {time.perf_counter() - start_time:.2f} s")
+            return self.models[code_lang]
+
+    def synthesize(self, text: str, code_lang: str) -> tuple:
+        '''
+        Synthesizes a text.
+
+        Args:
+            text (str): The text to synthesize.
+            code_lang (str): The language of the text ("english" or "japanese").
+
+        Returns:
+            tuple: The samples (float32, one column) and the sample rate.
+        '''
+        import torch
+
+        model = self.get_model(code_lang)
+        start_time = time.perf_counter()
+        with torch.no_grad():
+            wav = model(text)["wav"]
+        get_metrics().record("tts_local", time.perf_counter() - start_time)
+        return wav.cpu().numpy().astype('float32').reshape(-1, 1), model.fs
+
+    def submit(self, source_filename: str, language: str) -> Future:
+        code_lang = STEN_LANGUAGES.get(language, "japanese")
+        return self.executor.submit(self.synthesize, SYNTHESIS_TEXTS[code_lang], code_lang)
+
+    def preload(self):
+        for code_lang in self.model_tags:
+            future = self.executor.submit(self.get_model, code_lang)
+            future.add_done_callback(lambda future, code_lang = code_lang: self.report_load(code_lang, future))
+
+    def report_load(self, code_lang: str, future: Future):
+        '''
+        Reports a missing or broken store at startup rather than in the middle of a cycle.
+        '''
+        if future.exception() is not None:
+            print(f"LOCAL TTS MODEL {code_lang} FAILED TO LOAD: {future.exception()!r}")
+
+
+def pin_local_models(model_tags: dict = TTS_LOCAL_MODELS, store_dir: str = TTS_LOCAL_MODEL_STORE):
+    '''
+    Pins the local TTS models into their stores, then synthesizes once from the pinned files, so that the
+    frontends fetch the data they download at first use (the dictionary of pyopenjtalk, the NLTK data of g2p_en)
+    while there is network. Needs network.
+
+    Args:
+        model_tags (dict): The ESPnet model zoo tag of every language. Defaults to TTS_LOCAL_MODELS.
+        store_dir (str): The directory of the stores of the models. Defaults to TTS_LOCAL_MODEL_STORE.
+
+    Returns:
+        None
+    '''
+    from .model_store import pin_model
+
+    backend = LocalBackend(model_tags, store_dir)
+    for code_lang, tag in model_tags.items():
+        pin_model(tag, backend.model_store(code_lang))
+        samples, sample_rate = backend.synthesize(SYNTHESIS_TEXTS[code_lang], code_lang)
+        print(f"Synthesized {len(samples) / sample_rate:.1f} s of {code_lang} from the pinned model.")
+
+
+# Name -> backend class, in the names used by TTS_BACKEND_ORDER
+TTS_BACKENDS = {
+    StenBackend.name: StenBackend,
+    LocalBackend.name: LocalBackend,
+}
+
+
+class RoutedSynthesis:
+    '''
+    RoutedSynthesis
+    One synthesis handled by the router.
+
+    Attributes:
+        samples (Future): The samples and the sample rate, from the first backend that succeeded.
+        backend (str): The name of the backend that produced the samples, or of the one currently tried.
+        audio_path (str): The URL of the result given by the backend, if any.
+        errors (list): The (backend, exception) of the backends that failed or missed the deadline.
+    '''
+    def __init__(self):
+        self.samples = Future()
+        self.samples.set_running_or_notify_cancel()
+        self.backend = ""
+        self.audio_path = None
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def result(self, timeout: float = None) -> tuple:
+        '''
+        Waits until the synthesized audio is resident in memory.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds. Defaults to no limit.
+
+        Returns:
+            tuple: The samples and the sample rate.
+        '''
+        return self.samples.result(timeout)
+
+
+class TTSRouter:
+    '''
+    TTSRouter
+    Tries the backends in order, moving to the next one on failure or when the deadline is missed.
+    The late answer of a backend that missed its deadline is still used if it comes before the next one.
+
+    Attributes:
+        backends (list): The backends, in order of preference.
+        deadline (float): The time in seconds given to every backend before the next one is started.
+    '''
+    def __init__(self, backend_names: list = TTS_BACKEND_ORDER, deadline: float = TTS_DEADLINE):
+        '''
+        Constructor
+
+        Args:
+            backend_names (list): The names of the backends, in order of preference. Defaults to TTS_BACKEND_ORDER.
+            deadline (float): The deadline of every backend in seconds. Defaults to TTS_DEADLINE.
+        '''
+        self.backends = [TTS_BACKENDS[name]() for name in backend_names]
+        self.deadline = deadline
+
+    def preload(self):
+        '''
+        Prepares the fallback backends in the background.
+        '''
+        for backend in self.backends[1:]:
+            backend.preload()
+
+    def submit(self, source_filename: str = WAVE_OUTPUT_FILENAME, language: str = "jp") -> RoutedSynthesis:
+        '''
+        Starts synthesizing the demo sentence.
+
+        Args:
+            source_filename (str): The path to the recording of the visitor. Defaults to WAVE_OUTPUT_FILENAME.
+            language (str): The language of the sentence ("en" or "jp").
+
+        Returns:
+            RoutedSynthesis
+        '''
+        synthesis = RoutedSynthesis()
+        self.start(synthesis, 0, source_filename, language)
+        return synthesis
+
+    def start(self, synthesis: RoutedSynthesis, index: int, source_filename: str, language: str):
+        '''
+        Starts the backend at the given index and arms its deadline.
+        '''
+        backend = self.backends[index]
+        synthesis.backend = backend.name
+        try:
+            future = backend.submit(source_filename, language)
+        except Exception as e:
+            self.give_up(synthesis, index, backend, e, source_filename, language)
+            return
+
+        timer = threading.Timer(self.deadline, self.give_up, (synthesis, index, backend, TimeoutError(f"No answer within {self.deadline} s"), source_filename, language))
+        timer.daemon = True
+        future.add_done_callback(lambda future: self.finish(synthesis, index, backend, future, timer, source_filename, language))
+        timer.start()
+
+    def finish(self, synthesis: RoutedSynthesis, index: int, backend: TTSBackend, future: Future, timer: threading.Timer, source_filename: str, language: str):
+        '''
+        Called when a backend is done: keeps its samples if none were kept yet, or moves to the next backend.
+        '''
+        timer.cancel()
+        if future.exception() is not None:
+            self.give_up(synthesis, index, backend, future.exception(), source_filename, language)
+            return
+        with synthesis.lock:
+            if synthesis.samples.done():
+                return
+            synthesis.backend = backend.name
+            synthesis.audio_path = getattr(future, "audio_path", None)
+            synthesis.samples.set_result(future.result())
+
+    def give_up(self, synthesis: RoutedSynthesis, index: int, backend: TTSBackend, error: Exception, source_filename: str, language: str):
+        '''
+        Records the failure of a backend and starts the next one, or fails the synthesis after the last one.
+        '''
+        with synthesis.lock:
+            if synthesis.samples.done() or any(failed is backend for failed, _ in synthesis.errors):
+                return
+            synthesis.errors.append((backend, error))
+            print(f"TTS BACKEND {backend.name} FAILED: {error!r}")
+            if index + 1 >= len(self.backends):
+                # The last backend is out too: fail now rather than keep the visitor waiting
+                synthesis.samples.set_exception(error)
+                return
+        self.start(synthesis, index + 1, source_filename, language)
+
+
+tts_router = None
+
+def get_tts_router() -> TTSRouter:
+    '''
+    Returns the shared TTS router.
+
+    Returns:
+        TTSRouter
+    '''
+    global tts_router
+    if tts_router is None:
+        tts_router = TTSRouter()
+    return tts_router
@@ -0,0 +1,348 @@
+'''
+tts_endpoints.py
+
+This file manages the pool of STEN TTS endpoints.
+Requests go to the endpoint with the lowest latency (exponentially weighted moving average). When it has
+not answered within the p90 latency, the same request is sent to a second endpoint (a hedged request) and
+the first answer wins. A background health check takes unreachable endpoints out of the rotation.
+The same background thread warms the endpoints up at start and while idle with a tiny synthesis request,
+so that the connections are open before the first visitor. The warm-up latencies are kept apart, so that
+synthetic traffic never moves the routing and the hedge delay.
+'''
+
+import base64
+import collections
+import io
+import json
+import os
+import threading
+import time
+import wave
+import requests
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+from .constant import *
+
+
+class Endpoint:
+    '''
+    Endpoint
+    One STEN TTS server and its latency statistics.
+
+    Attributes:
+        url (str): The URL of the API.
+        ewma (float): The moving average of the latency in seconds, or None before the first request.
+        latencies (collections.deque): The most recent latencies in seconds.
+        healthy (bool): Whether the last health check or request succeeded.
+        warm_up_latency (float): The latency of the last warm-up request in seconds, or None.
+    '''
+    def __init__(self, url: str):
+        self.url = url
+        self.ewma = None
+        self.latencies = collections.deque(maxlen = STEN_LATENCY_WINDOW)
+        self.healthy = True
+        self.warm_up_latency = None
+        self.requests = 0
+        self.failures = 0
+
+    def record(self, latency: float):
+        '''
+        Records the latency of a successful request.
+        '''
+        self.latencies.append(latency)
+        self.ewma = latency if self.ewma is None else STEN_EWMA_ALPHA * latency + (1 - STEN_EWMA_ALPHA) * self.ewma
+        self.healthy = True
+
+    def score(self) -> float:
+        '''
+        Returns the routing score: the lower, the better. Unknown endpoints are tried early.
+        '''
+        if not self.healthy:
+            return float('inf')
+        return self.ewma if self.ewma is not None else 0.0
+
+
+class EndpointPool:
+    '''
+    EndpointPool
+    Routes and hedges requests across the STEN TTS endpoints.
+
+    Attributes:
+        endpoints (list): The endpoints of the pool.
+        session (requests.Session): The HTTP session shared by every request, keeping connections alive.
+    '''
+    def __init__(self, urls: list = STEN_URLS):
+        '''
+        Constructor
+
+        Args:
+            urls (list): The URLs of the endpoints. Defaults to STEN_URLS.
+        '''
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = len(urls), pool_maxsize = STEN_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers = 2 * STEN_POOL_SIZE, thread_name_prefix = "sten-request")
+        self.in_flight = 0
+        self.health_thread = None
+        self.last_activity = 0.0
+        self.warm_up_body = None
+
+    def ranked(self) -> list:
+        '''
+        Returns the endpoints, best first.
+        '''
+        with self.lock:
+            return sorted(self.endpoints, key = lambda endpoint: endpoint.score())
+
+    def hedge_delay(self, endpoint: Endpoint) -> float:
+        '''
+        Returns the time to wait for an endpoint before hedging: its p90 latency.
+
+        Args:
+            endpoint (Endpoint): The endpoint of the first request.
+
+        Returns:
+            float
+        '''
+        with self.lock:
+            latencies = sorted(endpoint.latencies)
+        if len(latencies) < STEN_HEDGE_MIN_SAMPLES:
+            return STEN_HEDGE_DEFAULT_DELAY
+        return latencies[min(len(latencies) - 1, int(0.9 * len(latencies)))]
+
+    def send(self, endpoint: Endpoint, data, headers: dict, timeout: float, record: bool = True, superseded: threading.Event = None) -> requests.Response:
+        '''
+        Sends one request to one endpoint and records its latency. Only a connection error or a server error (5xx)
+        of a request still awaited marks the endpoint unhealthy: the slow losing leg of a hedge says nothing of its health.
+
+        Args:
+            record (bool): Whether the latency counts for the routing and the hedge delay. Defaults to True.
+            superseded (threading.Event): Set once another attempt of the same request has answered.
+        '''
+        start_time = time.perf_counter()
+        with self.lock:
+            endpoint.requests += 1
+            self.in_flight += 1
+        try:
+            response = self.session.post(endpoint.url, data = data() if callable(data) else data, headers = headers, timeout = timeout)
+            response.raise_for_status()
+        except Exception as e:
+            server_error = isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code >= 500
+            with self.lock:
+                endpoint.failures += 1
+                if (isinstance(e, requests.ConnectionError) or server_error) and not (superseded is not None and superseded.is_set()):
+                    endpoint.healthy = False
+            raise
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        with self.lock:
+            if record:
+                endpoint.record(time.perf_counter() - start_time)
+            else:
+                endpoint.warm_up_latency = time.perf_counter() - start_time
+                endpoint.healthy = True
+        return response
+
+    def post(self, data, headers: dict, timeout: float = STEN_TIMEOUT) -> requests.Response:
+        '''
+        Sends a request to the best endpoint, hedged on the second best one.
+
+        Args:
+            data (str | bytes | function): The request body, or a function returning a new body for every attempt.
+            headers (dict): The request headers.
+            timeout (float): The timeout of each attempt in seconds. Defaults to STEN_TIMEOUT.
+
+        Returns:
+            requests.Response: The first successful response.
+        '''
+        self.last_activity = time.monotonic()
+        ranked = self.ranked()
+        superseded = threading.Event()
+        pending = {self.executor.submit(self.send, ranked[0], data, headers, timeout, True, superseded)}
+        done, pending = wait(pending, timeout = self.hedge_delay(ranked[0]))
+
+        if not done and len(ranked) > 1:
+            print(f"HEDGING TO {ranked[1].url}")
+            pending.add(self.executor.submit(self.send, ranked[1], data, headers, timeout, True, superseded))
+        elif done and next(iter(done)).exception() is not None and len(ranked) > 1:
+            # The first endpoint failed fast: retry at once on the next one
+            pending = {self.executor.submit(self.send, ranked[1], data, headers, timeout, True, superseded)}
+
+        last_error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    superseded.set()
+                    return future.result()
+                last_error = future.exception()
+            if not pending:
+                raise last_error
+            done, pending = wait(pending, return_when = FIRST_COMPLETED)
+
+    '''
+    Health checks
+    '''
+    def check_health(self):
+        '''
+        Checks that every endpoint answers. Any HTTP answer counts as healthy.
+        '''
+        for endpoint in self.endpoints:
+            parts = urlsplit(endpoint.url)
+            try:
+                self.session.get(f"{parts.scheme}://{parts.netloc}/", timeout = STEN_HEALTH_TIMEOUT)
+                healthy = True
+            except requests.RequestException:
+                healthy = False
+            with self.lock:
+                endpoint.healthy = healthy
+
+    def start_health_checks(self, interval: float = STEN_HEALTH_INTERVAL):
+        '''
+        Warms the endpoints up, then checks their health periodically in a background thread.
+        The endpoints are warmed up again when no request was made for STEN_KEEPALIVE_IDLE seconds.
+
+        Args:
+            interval (float): The time between two checks in seconds. Defaults to STEN_HEALTH_INTERVAL.
+        '''
+        if self.health_thread is not None:
+            return
+        def run():
+            self.warm_up()
+            while True:
+                time.sleep(interval)
+                self.check_health()
+                if time.monotonic() - self.last_activity >= STEN_KEEPALIVE_IDLE:
+                    self.warm_up()
+        self.health_thread = threading.Thread(target = run, daemon = True)
+        self.health_thread.start()
+
+    '''
+    Warm-up
+    '''
+    def build_warm_up_body(self) -> str:
+        '''
+        Builds the warm-up request: STEN_WARMUP_TEXT with the first second of STEN_WARMUP_REFERENCE
+        as the reference voice, or one second of silence when the file is missing.
+        '''
+        if os.path.exists(STEN_WARMUP_REFERENCE):
+            with wave.open(STEN_WARMUP_REFERENCE, 'rb') as f:
+                params = f.getparams()
+                frames = f.readframes(f.getframerate())
+        else:
+            params = (CHANNELS, 2, RATE, 0, 'NONE', 'not compressed')
+            frames = bytes(2 * CHANNELS * RATE)
+
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as f:
+            f.setparams(params)
+            f.writeframes(frames)
+        return json.dumps({
+            'text': STEN_WARMUP_TEXT,
+            'speed': 1.0,
+            'voice': 'multilingual_diff_14',
+            'full_mp3': 1,
+            'language': 'english',
+            'energy': 1.0,
+            'pitch': 1.0,
+            'reference': base64.b64encode(buffer.getvalue()).decode('utf-8'),
+            'speaker_id': ''
+        })
+
+    def warm_up(self) -> dict:
+        '''
+        Sends the warm-up request to every endpoint at the same time. The latencies are not recorded
+        in the routing statistics.
+
+        Returns:
+            dict: The latency in seconds of every endpoint, or None for the endpoints that failed.
+        '''
+        if self.warm_up_body is None:
+            self.warm_up_body = self.build_warm_up_body()
+        headers = {'Content-type': 'application/json'}
+        futures = {}
+        for endpoint in self.endpoints:
+            futures[endpoint.url] = (time.perf_counter(), self.executor.submit(self.send, endpoint, self.warm_up_body, headers, STEN_TIMEOUT, False))
+
+        latencies = {}
+        for url, (start_time, future) in futures.items():
+            try:
+                future.result()
+                latencies[url] = time.perf_counter() - start_time
+            except Exception as e:
+                print(f"WARM-UP OF {url} FAILED: {e!r}")
+                latencies[url] = None
+        # The connections are fresh again: the next warm-up is due after STEN_KEEPALIVE_IDLE
+        self.last_activity = time.monotonic()
+        return latencies
+
+    def status(self) -> str:
+        '''
+        Returns the state of the pool for the UI: "ok", "slow" when the best endpoint is slower than
+        STEN_DEGRADED_LATENCY, or "offline" when no endpoint is healthy.
+
+        Returns:
+            string
+        '''
+        best = self.ranked()[0]
+        if not best.healthy:
+            return "offline"
+        if best.ewma is not None and best.ewma > STEN_DEGRADED_LATENCY:
+            return "slow"
+        return "ok"
+
+    def connection_stats(self) -> dict:
+        '''
+        Returns the state of the HTTP connection pools of the session.
+
+        Returns:
+            dict: The number of host pools, open connections, idle connections and requests in flight.
+        '''
+        container = self.session.get_adapter("http://").poolmanager.pools
+        pools = [pool for pool in (container.get(key) for key in container.keys()) if pool is not None]
+        return {
+            'pools': len(pools),
+            'opened': sum(pool.num_connections for pool in pools),
+            # The queue of a pool is padded with None up to its size; only the real connections are idle
+            'idle': sum(connection is not None for pool in pools if pool.pool is not None for connection in list(pool.pool.queue)),
+            'in_flight': self.in_flight,
+        }
+
+    def stats(self) -> list:
+        '''
+        Returns the statistics of every endpoint.
+
+        Returns:
+            list: One dict per endpoint.
+        '''
+        with self.lock:
+            return [{
+                'url': endpoint.url,
+                'healthy': endpoint.healthy,
+                'ewma': endpoint.ewma,
+                'warm_up_latency': endpoint.warm_up_latency,
+                'requests': endpoint.requests,
+                'failures': endpoint.failures,
+            } for endpoint in self.endpoints]
+
+
+endpoint_pool = None
+
+def get_endpoint_pool() -> EndpointPool:
+    '''
+    Returns the shared endpoint pool, starting its warm-up and health checks on first use.
+
+    Returns:
+        EndpointPool
+    '''
+    global endpoint_pool
+    if endpoint_pool is None:
+        endpoint_pool = EndpointPool()
+        endpoint_pool.start_health_checks()
+    return endpoint_pool
@@ -2,6 +2,7 @@
 ui.py
 
 This module contains the User Interface class, which is responsible for showing the user the current state of the application.
+The steps, clips and backends of the demo come from a scenario profile (see scenario.py).
 '''
 
 import os
@@ -14,10 +15,33 @@ from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
 from PyQt5.QtMultimediaWidgets import QVideoWidget
 from PyQt5.QtCore import Qt, QUrl, QTimer
 
-from .asr import recognize_speech
+from .asr import recognize_speech, preload_model
 from .constant import *
 from .voice_change import record, exec_voice_change
 from .ui_background import *
+from .lifecycle import ResourceManager
+from .audio_device import get_audio_device, load_clip
+from .scenario import load_scenario
+from .tts_backend import get_tts_router
+from .tts_endpoints import get_endpoint_pool
+from .metrics import get_metrics
+from .hud import DebugHud
+from .stall_watchdog import StallWatchdog
+from .transcript_view import TranscriptOverlay
+from .video_transcode import select_video_paths
+from .video_monitor import VideoMonitor
+from .session_archive import get_session_archive
+from .audio_file import open_wav
+
+# The stage shown by the debug HUD for every action of the action queue
+ACTION_STAGES = {
+    1: "initial talk",
+    2: "recording",
+    3: "second talk",
+    4: "transcript",
+    5: "final talk",
+    6: "recording animation",
+}
 
 def merge_task():
     print("All tasks have been completed")
@@ -27,10 +51,14 @@ class AppMainWindow(QMainWindow):
     AppMainWindow
     This class is the main window of the application. It contains the widgets (especially the video widget) to run the program.
     '''
-    def __init__(self, language = ""):
+    def __init__(self, language = "", scenario: str = DEFAULT_SCENARIO):
         '''
         Constructor
         This method initializes the application.
+
+        Parameters:
+        - language (str): The language of the prompt clips. Defaults to the language of the scenario.
+        - scenario (str): The name of the scenario profile. Defaults to DEFAULT_SCENARIO.
         '''
         super().__init__()
 
@@ -38,25 +66,55 @@ class AppMainWindow(QMainWindow):
         self.audio_queue = []
         self.action_queue = []
         self.tasks_completed = 0
+        self.recording_decision = "proceed"
+        self.recording_retries = 0
 
         self.recognized_text = ""
         self.result_url = ""
+        self.synthesis_job = None
+
+        # Reusable timers and threads
+        self.resources = ResourceManager(self)
+
+        # Open the audio stream once, so that recording never waits for the device
+        get_audio_device()
 
-        # Set the video paths
-        idle_path = os.path.abspath(IDLE_VIDEO_PATH)
-        talk_path = os.path.abspath(TALK_VIDEO_PATH)
-        self.video_paths = [idle_path, talk_path]
+        # Load the ASR model while the visitor listens to the first prompts
+        preload_model()
+
+        # Set the video paths of the decode path, before the players are created
+        self.video_paths = select_video_paths()
         
-        # Initialize the used language
+        # Load the scenario and initialize the used language
+        self.scenario = load_scenario(scenario)
         self.language = language
         if self.language == "":
-            # self.language = "en"
-            self.language = "en"
+            self.language = self.scenario.language
         self.audio_folder = os.path.abspath(f"{AUDIO_FOLDER}/{self.language}")
 
+        # Load the fallback TTS model, so that it is ready if the STEN API does not answer in time
+        if self.scenario.synthesis and TTS_LOCAL_PRELOAD:
+            get_tts_router().preload()
+
         # Initialize the UI
         self.init_UI()
 
+        # Measure the decoding of the videos
+        self.video_monitor = VideoMonitor(self.resources, {"idle": self.video_player_idle, "talk": self.video_player_talk})
+        self.video_monitor.start()
+
+        # Watch the event loop for blocking calls on the UI thread
+        self.watchdog = None
+        if WATCHDOG:
+            self.watchdog = StallWatchdog(self.resources)
+            self.watchdog.start()
+
+        # Warm the STEN endpoints up now rather than on the first visitor, and show when they are degraded
+        if self.scenario.synthesis:
+            get_endpoint_pool()
+            self.tts_status_timer = self.resources.timer("tts_status", self.update_tts_status)
+            self.tts_status_timer.start(STEN_STATUS_MS)
+
     def init_UI(self):
         '''
         UI Constructor
@@ -136,20 +194,21 @@ class AppMainWindow(QMainWindow):
         self.overlay_timer_container.hide()
 
         # Overlay transcription_text
-        self.transcription_text_overlay = QLabel("Initial Transcription Text", self.video_widget_idle)
-        self.transcription_text_overlay.setStyleSheet("""
-            color: white;
-            background-color: black;
-            font-size: 24px;
-            font-weight: bold;
-            padding: 4px;
-        """)
-        self.transcription_text_overlay.setAlignment(Qt.AlignmentFlag.AlignCenter | Qt.AlignmentFlag.AlignVCenter)
-        self.transcription_text_overlay.setFixedWidth(self.width())
-        self.transcription_text_overlay.setFixedHeight(50)
-        self.transcription_text_overlay.move(0,self.height() - self.transcription_text_overlay.height())  # Move to bottom
+        self.transcription_text_overlay = TranscriptOverlay("Initial Transcription Text", self.video_widget_idle, self.resources)
+        self.transcription_text_overlay.setGeometry(0, self.height() - TRANSCRIPT_MIN_HEIGHT, self.width(), TRANSCRIPT_MIN_HEIGHT)  # Move to bottom
         self.transcription_text_overlay.hide()
 
+        # Debug HUD, toggled with the H key
+        self.hud = DebugHud(self, self.resources)
+
+        # Degraded mode indicator of the STEN endpoints
+        self.tts_status_indicator = QLabel("", self)
+        self.tts_status_indicator.setStyleSheet("color: orange; font-size: 14px; background: transparent; padding: 4px;")
+        self.tts_status_indicator.setAttribute(Qt.WA_TranslucentBackground)
+        self.tts_status_indicator.setFixedWidth(200)
+        self.tts_status_indicator.move(0, 0)
+        self.tts_status_indicator.hide()
+
         # Self media state changed
         self.video_player_idle.stateChanged.connect(self.handle_event_video_idle_stopped)
         self.video_player_talk.stateChanged.connect(self.handle_event_video_talk_stopped)
@@ -188,57 +247,61 @@ class AppMainWindow(QMainWindow):
     def resizeEvent(self, event):
         super().resizeEvent(event)
         self.overlay_timer_container.move(self.video_widget_idle.width() - self.overlay_timer_container.width(), self.video_widget_idle.height() // 2 - self.overlay_timer_container.height() // 2)
-        self.transcription_text_overlay.setFixedWidth(self.width())
-        self.transcription_text_overlay.move(0,self.video_widget_idle.height() - self.transcription_text_overlay.height() - self.video_widget_idle.height() // 2 - self.video_widget_idle.height() // 8)  # Move to bottom
+        video_height = self.video_widget_idle.height()
+        overlay_height = max(TRANSCRIPT_MIN_HEIGHT, int(self.height() * TRANSCRIPT_HEIGHT_RATIO))
+        bottom = video_height - video_height // 2 - video_height // 8
+        self.transcription_text_overlay.setGeometry(0, bottom - overlay_height, self.width(), overlay_height)
 
-    def exec_recording(self):
+    def exec_recording(self, retry: bool = False):
         '''
         Records audio and saves the recorded audio
-        '''
-        # Initialize job thread
-        self.background_task1 = TaskRecordAudio()
-        self.background_thread1 = QThread()
-        self.background_task1.moveToThread(self.background_thread1)
 
-        self.background_thread1.started.connect(self.background_task1.run)
-        self.background_task1.signal.connect(self.recording_manager)
-        self.background_task1.signal.connect(self.background_thread1.quit)
+        Parameters:
+        - retry (bool): Whether the previous take was rejected by the quality gate; only "Go ahead" is played again.
+        '''
+        device = get_audio_device()
+        if COUNTDOWN_OVERLAP or retry:
+            # Play the countdown through the audio stream, so that its echo is removed from the recording,
+            # and let the recording start with "Go ahead" instead of after it
+            clips = ["8_4"] if retry else ["8_1", "8_2", "8_3", "8_4"]
+            countdown = [load_clip(self.clip_path(clip)) for clip in clips]
+            for samples, sample_rate in countdown:
+                device.play(samples, sample_rate)
+            countdown_seconds = sum(len(samples) / sample_rate for samples, sample_rate in countdown[:-1])
+            talk_seconds = countdown_seconds + len(countdown[-1][0]) / countdown[-1][1]
+            if not COUNTDOWN_OVERLAP:
+                # Without echo cancellation, the recording starts after "Go ahead"
+                countdown_seconds = talk_seconds
+            mark = device.mark(time.monotonic() + countdown_seconds)
+
+            self.show_talking_animation()
+            QTimer.singleShot(int(talk_seconds * 1000), self.show_idle_animation)
+            QTimer.singleShot(int(countdown_seconds * 1000), self.show_recording_animation)
+        else:
+            # Mark the start of the recording now, so that the thread startup does not shorten it
+            mark = device.mark()
+            self.show_recording_animation()
 
+        # Run the job on the reusable recording thread
         print("RECORDING...") 
-        self.background_thread1.start()
-        self.show_recording_animation()
+        get_metrics().start("record")
+        self.resources.run_worker("record", TaskRecordAudio(mark = mark), self.recording_manager)
 
     def do_tts_and_asr(self):
         '''
         Executes voice change and speech recognition
         Saves the modifed audio
         '''
-        # Initialize job thread for synthesizing audio
-        self.background_task2 = TaskFetchSynthesizedAudio(task_num = 1)
-        self.background_thread2 = QThread()
-        self.background_task2.moveToThread(self.background_thread2)
-
-        self.background_thread2.started.connect(self.background_task2.run)
-        self.background_task2.signal.connect(self.ai_process_manager)
-        self.background_task2.signal.connect(self.background_thread2.quit)
-
-        # fetch_synthesized_audio()
-
-        # Initialize job thread for transcription
-        self.background_task3 = TaskGenerateAudioTranscription(task_num = 2)
-        self.background_thread3 = QThread()
-        self.background_task3.moveToThread(self.background_thread3)
-
-        self.background_thread3.started.connect(self.background_task3.run)
-        self.background_task3.signal.connect(self.ai_process_manager)
-        self.background_task3.signal.connect(self.background_thread3.quit)
-
-        # Executing all jobs at the same time
+        # Run the synthesis and the transcription at the same time on the reusable threads
         print("TRANSCRIPTING AND GENERATING SPEECH...")
-        self.background_thread2.start()
-        self.background_thread3.start()
-
-        audio_file = os.path.abspath(f"{self.audio_folder}/4.mp3")
+        get_metrics().set_stage("processing")
+        get_metrics().start("playback_start")
+        if self.scenario.synthesis:
+            self.synthesis_job = get_tts_router().submit(WAVE_OUTPUT_FILENAME, "jp")
+            self.resources.run_worker("synthesis", TaskFetchSynthesizedAudio(self.synthesis_job, task_num = 1), self.ai_process_manager)
+        self.resources.run_worker("transcription", TaskGenerateAudioTranscription(task_num = 2), self.ai_process_manager)
+
+        audio_file = self.clip_path(self.scenario.processing_clip)
         self.audio_player_2.setMedia(QMediaContent(QUrl.fromLocalFile(audio_file)))
         self.audio_player_2.play()
         self.show_talking_animation()
@@ -250,13 +313,24 @@ class AppMainWindow(QMainWindow):
 
     def play_modified_audio(self):
         '''
-        Play the saved modified audio
+        Play the modified audio, which is already decoded in memory
         '''
-        # Call the API to fetch the MP3 file and play the audio
         print("PLAYING...")
-        # self.play_mp3_media(self.result_url)
-        self.play_mp3_media_2()
+        job = self.synthesis_job
+        if job is None or not job.samples.done() or job.samples.exception() is not None:
+            # Nothing to play, continue with the next action
+            self.handle_event_audio_stopped(QMediaPlayer.State.StoppedState)
+            return
+
+        samples, sample_rate = job.result()
+        get_audio_device().play(samples, sample_rate)
+        get_metrics().stop("playback_start")
+        get_metrics().set_stage("playback")
         self.show_talking_animation()
+
+        # The audio device does not report the end of a clip to Qt, so wait for its duration
+        self.result_timer = self.resources.timer("result_playback", lambda: self.handle_event_audio_stopped(QMediaPlayer.State.StoppedState), single_shot = True)
+        self.result_timer.start(int(len(samples) / sample_rate * 1000))
         print(self.recognized_text)
         print()
 
@@ -268,6 +342,7 @@ class AppMainWindow(QMainWindow):
         if len(self.action_queue) == 0:
             return
         next_action = self.action_queue[0]
+        get_metrics().set_stage(ACTION_STAGES.get(next_action, str(next_action)))
 
         if next_action == 1:
             self.do_initial_talk()
@@ -299,19 +374,24 @@ class AppMainWindow(QMainWindow):
         Returns:
             None
         '''
+        if event.key() == Qt.Key.Key_D:
+            self.resources.dump_diagnostics()
+            print(self.video_monitor.report())
+            if self.watchdog is not None:
+                print(self.watchdog.report())
+            return
+        if event.key() == Qt.Key.Key_H:
+            self.hud.toggle()
+            return
         if len(self.action_queue) > 0:
             return
-        if event.key() == Qt.Key.Key_1:
-            self.action_queue = [1, 2, 3, 4, 5]
-            print("CALL 1")
-            self.control_next_action()
-        elif event.key() == Qt.Key.Key_2:
-            self.action_queue = [3, 5]
-            print("CALL 2")
-            self.control_next_action()
-        elif event.key() == Qt.Key.Key_3:
-            self.action_queue = [6]
-            print("CALL 3")
+        sequence = self.scenario.key_sequences.get(event.text())
+        if sequence:
+            self.resources.begin_cycle()
+            get_metrics().begin_cycle()
+            get_audio_device().arm()
+            self.action_queue = list(sequence)
+            print(f"CALL {event.text()}")
             self.control_next_action()
     
     def handle_event_video_idle_stopped(self, state: QMediaPlayer.State):
@@ -366,6 +446,9 @@ class AppMainWindow(QMainWindow):
                     self.control_next_action()
                 else:
                     self.action_queue = []
+                    self.resources.end_cycle()
+                    get_metrics().set_stage("idle")
+                    get_audio_device().disarm()
 
     def handle_event_audio_stopped_2(self, state):
         '''
@@ -393,6 +476,19 @@ class AppMainWindow(QMainWindow):
             self.control_next_action()
         else:
             self.action_queue = []
+            self.resources.end_cycle()
+            get_metrics().set_stage("idle")
+            get_audio_device().disarm()
+
+    def closeEvent(self, event):
+        '''
+        Release the timers and the worker threads when the window is closed.
+        '''
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        self.resources.shutdown()
+        get_audio_device().stop()
+        super().closeEvent(event)
 
     '''
     Utility functions
@@ -411,19 +507,29 @@ class AppMainWindow(QMainWindow):
         self.timer_label.setText(f"00:0{self.timer_counter}")
         self.overlay_timer_container.show()
         self.recording_indicator.setVisible(True)
-        self.recording_timer = QTimer(self)
-        self.recording_timer.timeout.connect(self.fadeIn)
+        self.recording_timer = self.resources.timer("recording", self.fadeIn)
         self.recording_timer.start(10)  # Adjust the interval to control the speed of the fade-in
 
+    def update_tts_status(self):
+        '''
+        Shows the degraded mode indicator when the STEN endpoints are slow or offline
+        '''
+        status = get_endpoint_pool().status()
+        if status == "ok":
+            self.tts_status_indicator.hide()
+            return
+        self.tts_status_indicator.setText("TTS SLOW" if status == "slow" else "TTS OFFLINE")
+        self.tts_status_indicator.show()
+        self.tts_status_indicator.raise_()
+
     def show_transcription_text(self):
         '''
         Show the transcription text overlay
         '''
+        self.transcription_text_overlay.restart_reveal()
         self.transcription_text_overlay.show()
-        self.transcription_timer = QTimer(self)
-        self.transcription_timer.setSingleShot(True)
-        self.transcription_timer.timeout.connect(self.handle_transcription_timer_timeout)
-        self.transcription_timer.start(3000)
+        self.transcription_timer = self.resources.timer("transcription", self.handle_transcription_timer_timeout, single_shot = True)
+        self.transcription_timer.start(TRANSCRIPT_DISPLAY_MS)
 
     def fadeIn(self):
         '''
@@ -442,8 +548,8 @@ class AppMainWindow(QMainWindow):
         '''
         self.timer_counter = 0
         self.blink_counter = 0
+        self.recording_timer = self.resources.timer("recording", self.blink)
         self.recording_timer.start(BLINK_MS)
-        self.recording_timer.timeout.connect(self.blink)
 
     def blink(self):
         '''
@@ -460,7 +566,6 @@ class AppMainWindow(QMainWindow):
             self.recording_indicator.setVisible(self.recording_indicator.isVisible)
         else:
             self.recording_timer.stop()
-            self.recording_timer.timeout.connect(self.fadeIn)
             self.overlay_timer_container.hide()
             self.recording_manager(True, "Successful recording animation", 0)
 
@@ -468,15 +573,10 @@ class AppMainWindow(QMainWindow):
         '''
         Perform initial talk by setting up audio and action queues and calling the talk method.
         '''
-        self.audio_queue = [
-            os.path.abspath(f"{self.audio_folder}/1.mp3"),
-            os.path.abspath(f"{self.audio_folder}/2.mp3"),
-            os.path.abspath(f"{self.audio_folder}/3.mp3"),
-            os.path.abspath(f"{self.audio_folder}/8_1.mp3"),
-            os.path.abspath(f"{self.audio_folder}/8_2.mp3"),
-            os.path.abspath(f"{self.audio_folder}/8_3.mp3"),
-            os.path.abspath(f"{self.audio_folder}/8_4.mp3"),
-        ]
+        self.audio_queue = [self.clip_path(clip) for clip in self.scenario.initial_talk]
+        if not COUNTDOWN_OVERLAP:
+            # Otherwise the countdown is played together with the recording
+            self.audio_queue += [self.clip_path(clip) for clip in ["8_1", "8_2", "8_3", "8_4"]]
         print(self.audio_queue)
         self.talk()
 
@@ -484,23 +584,58 @@ class AppMainWindow(QMainWindow):
         '''
         Perform second talk by setting up audio and action queues and calling the talk method.
         '''
-        self.audio_queue = [
-            os.path.abspath(f"{self.audio_folder}/6.mp3"),
-            os.path.abspath(f"{self.audio_folder}/7.mp3"),
-        ]
-        time.sleep(0.5)
-        self.talk()
+        self.audio_queue = [self.clip_path(clip) for clip in self.scenario.second_talk]
+        # Pause before talking without blocking the event loop
+        self.second_talk_timer = self.resources.timer("second_talk", self.talk, single_shot = True)
+        self.second_talk_timer.start(500)
 
     def do_final_talk(self):
         '''
         Perform final talk by setting up audio and action queues and calling the talk method.
         '''
-        self.audio_queue = [
-            os.path.abspath(f"{self.audio_folder}/9.mp3"),
-            os.path.abspath(f"{self.audio_folder}/10.mp3"),
-        ]
+        self.audio_queue = [self.clip_path(clip) for clip in self.scenario.final_talk]
         self.talk()
 
+    def archive_session(self):
+        '''
+        Queues the recording, the transcript and the synthesized voice of the cycle to the session archive
+        '''
+        try:
+            wav = open_wav(WAVE_OUTPUT_FILENAME)
+            recording = (wav.samples.copy(), wav.samplerate)
+        except (OSError, ValueError) as e:
+            print(f"NO RECORDING TO ARCHIVE: {e!r}")
+            recording = None
+
+        job = self.synthesis_job
+        synthesis = None
+        if job is not None and job.samples.done() and job.samples.exception() is None:
+            synthesis = job.result()
+
+        timings = get_metrics().snapshot()['current']
+        get_session_archive().submit(recording, synthesis, {
+            'language': self.language,
+            'scenario': self.scenario.name,
+            'transcript': self.recognized_text,
+            'audio_path': job.audio_path if job is not None else None,
+            'backend': job.backend if synthesis is not None else None,
+            'quality': self.recording_decision,
+            'latency': timings.get('playback_start'),
+            'timings': timings,
+        })
+
+    def clip_path(self, clip: str) -> str:
+        '''
+        Returns the path of a prompt clip in the current language.
+
+        Parameters:
+        - clip (str): The name of the clip, without extension.
+
+        Returns:
+        str
+        '''
+        return os.path.abspath(f"{self.audio_folder}/{clip}.mp3")
+
     def play_mp3_media(self, url: str):
         '''
         Downloads an MP3 file from the given URL and plays it using an audio player.
@@ -547,6 +682,7 @@ class AppMainWindow(QMainWindow):
         Returns:
         None
         '''
+        self.video_monitor.mark_loop("idle" if video_player is self.video_player_idle else "talk")
         video_player.setPosition(0)
         video_player.play()
     
@@ -570,9 +706,19 @@ class AppMainWindow(QMainWindow):
         '''
         Manages when the recording task is finished
         '''
+        if task_num == 1:
+            self.recording_decision = message if success else "proceed"
+            get_metrics().stop("record")
         self.tasks_completed += 1
         if self.tasks_completed == 2: # Both the recording and the UI animation
             self.tasks_completed = 0
+            if self.recording_decision == "retry" and self.recording_retries < QUALITY_MAX_RETRIES:
+                # Silent or clipped take: ask again rather than spend the backends on it
+                self.recording_retries += 1
+                print("RETRYING RECORDING...")
+                self.exec_recording(retry = True)
+                return
+            self.recording_retries = 0
             self.do_tts_and_asr()
 
     def ai_process_manager(self, success: bool, message: str, task_num: int = 0):
@@ -580,17 +726,34 @@ class AppMainWindow(QMainWindow):
         Manages when the process task is finished
         '''
         if not success:
-            raise Exception("Unimplmented case when there is failure when synthesis and transcription")
-
-        if task_num == 2:
+            # Keep the demo going: a failed synthesis is skipped and a failed transcription shows no text
+            print(f"TASK {task_num} FAILED: {message}")
+            if task_num == 2:
+                self.recognized_text = ""
+                self.transcription_text_overlay.set_text(self.recognized_text)
+        elif task_num == 2:
             self.recognized_text = message
-            self.transcription_text_overlay.setText(self.recognized_text)
+            self.transcription_text_overlay.set_text(self.recognized_text)
             print(self.recognized_text)
 
+            # Show the text while the synthesized audio is still on its way
+            if self.synthesis_job is not None and not self.synthesis_job.samples.done():
+                self.transcription_text_overlay.show()
+
         self.tasks_completed += 1
-        if self.tasks_completed == 3: # Synthesis, transcription and the UI recording
+        expected_tasks = 3 if self.scenario.synthesis else 2 # Synthesis, transcription and the UI recording
+        if self.tasks_completed == expected_tasks:
             self.tasks_completed = 0
-            self.play_modified_audio()
+            if self.scenario.synthesis:
+                self.transcription_text_overlay.hide()
+                self.play_modified_audio()
+            else:
+                self.action_queue.pop(0)
+                print("CALL NEXT")
+                self.control_next_action()
+            # After the playback has started, so that its latency is recorded
+            if SESSION_ARCHIVE:
+                self.archive_session()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -4,31 +4,24 @@ ui_background.py
 This file manages the background threads for the UI.
 '''
 
-from PyQt5.QtCore import QThread, pyqtSignal as Signal, QObject
-
-import requests
+from PyQt5.QtCore import QThread, pyqtSignal as Signal, pyqtSlot as Slot, QObject
 
 from .asr import recognize_speech
 from .constant import WAVE_OUTPUT_FILENAME
 from .voice_change import record, exec_voice_change
 
 
-def fetch_synthesized_audio():
+def fetch_synthesized_audio(job) -> str:
     '''
     Mimic the voice of the user.
+    Waits until the TTS router has the synthesized audio decoded in memory.
+    Raises the error of the last backend when every backend failed.
+
+    Args:
+        job (RoutedSynthesis): The synthesis started by the TTS router.
     '''
-    try:
-        url = exec_voice_change(language = "jp")
-        print(url)
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(WAVE_OUTPUT_FILENAME, "wb") as f:
-                f.write(response.content)
-        else:
-            raise Exception("Failed to fetch synthesized audio.")
-    except Exception as e:
-        print(e)
-        print("FAILED TO CALL API")
+    samples, sample_rate = job.result()
+    return f"Synthesized audio ready from {job.backend} ({len(samples) / sample_rate:.1f} s)"
 
 
 class BackgroundWorker(QObject):
@@ -54,6 +47,7 @@ class BackgroundWorker(QObject):
         self.args = args
         self.task_num = task_num
 
+    @Slot()
     def run(self):
         '''
         Runs the function in the background thread.
@@ -62,7 +56,7 @@ class BackgroundWorker(QObject):
             response = self.function(*self.args)
             self.signal.emit(True, response, self.task_num)
         except Exception as e:
-            self.signal.emit(False, e, self.task_num)
+            self.signal.emit(False, repr(e), self.task_num)
 
 
 class TaskRecordAudio(BackgroundWorker):
@@ -73,16 +67,16 @@ class TaskRecordAudio(BackgroundWorker):
         function (function): The function to run in the background thread.
         args (list): The arguments to pass to the function.
     '''
-    def __init__(self, task_num = 1):
+    def __init__(self, task_num = 1, mark: int = None):
         '''
         Initializes the BackgroundThreadWithArgs class.
 
         Args:
-            function (function): The function to run in the background thread.
-            args (list): The arguments to pass to the function.
+            task_num (int): The number of the task.
+            mark (int): The frame index at which the recording starts.
         '''
         function = record
-        args = []
+        args = [WAVE_OUTPUT_FILENAME, mark]
         super().__init__(function, args, task_num)
 
 class TaskFetchSynthesizedAudio(BackgroundWorker):
@@ -93,16 +87,16 @@ class TaskFetchSynthesizedAudio(BackgroundWorker):
         function (function): The function to run in the background thread.
         args (list): The arguments to pass to the function.
     '''
-    def __init__(self, task_num = 1):
+    def __init__(self, job, task_num = 1):
         '''
         Initializes the BackgroundThreadWithArgs class.
 
         Args:
-            function (function): The function to run in the background thread.
-            args (list): The arguments to pass to the function.
+            job (RoutedSynthesis): The synthesis to wait for.
+            task_num (int): The number of the task.
         '''
         function = fetch_synthesized_audio
-        args = []
+        args = [job]
         super().__init__(function, args, task_num)
 
 
@@ -0,0 +1,188 @@
+'''
+video_monitor.py
+
+This file contains the decode metrics of the avatar videos.
+A QVideoProbe on every player sees each decoded frame: the frames counted every VIDEO_STATS_MS give the
+decode FPS, the gaps in the presentation times of the frames give the dropped frames, and the time from
+the seek to zero of a loop to the first frame after it gives the loop latency. The CPU of the media threads
+(the GStreamer demuxers, queues and decoders, found by thread name in /proc) is measured alongside; it is
+the total of every media thread, so it includes the audio pipelines (the Qt audio sink) as well.
+The metrics go to the metrics registry, where the debug HUD shows them.
+'''
+
+import os
+import re
+import time
+
+from PyQt5.QtMultimedia import QVideoProbe
+
+from .constant import VIDEO_DECODE, VIDEO_STATS_MS
+from .metrics import get_metrics
+
+# The names of the threads GStreamer creates for its elements
+MEDIA_THREAD_PATTERN = re.compile(r"dec|demux|queue|typefind|gst|:src|:sink")
+
+
+def media_threads_cpu_time() -> float:
+    '''
+    Returns the CPU time used so far by the media threads of the process.
+
+    Returns:
+        float: The CPU time in seconds, or None without /proc (macOS).
+    '''
+    ticks = 0
+    try:
+        tasks = os.listdir("/proc/self/task")
+    except OSError:
+        return None
+    for task in tasks:
+        try:
+            with open(f"/proc/self/task/{task}/comm") as f:
+                name = f.read().strip()
+            if not MEDIA_THREAD_PATTERN.search(name):
+                continue
+            with open(f"/proc/self/task/{task}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            ticks += int(fields[11]) + int(fields[12]) # utime and stime
+        except (OSError, IndexError, ValueError):
+            continue # The thread ended meanwhile
+    return ticks / os.sysconf('SC_CLK_TCK')
+
+
+class StreamStats:
+    '''
+    StreamStats
+    The decode metrics of one video player.
+
+    Attributes:
+        name (str): The name of the stream.
+        available (bool): Whether the backend of the player supports probing.
+        fps (float): The decode FPS over the last period.
+        dropped (int): The number of frames dropped so far.
+        loop_latency (float): The time from the last seek to zero to the first frame after it, in seconds.
+    '''
+    def __init__(self, name: str, player):
+        '''
+        Constructor
+
+        Args:
+            name (str): The name of the stream.
+            player (QMediaPlayer): The player to probe.
+        '''
+        self.name = name
+        self.probe = QVideoProbe()
+        self.probe.videoFrameProbed.connect(self.on_frame)
+        self.available = self.probe.setSource(player)
+
+        self.fps = 0.0
+        self.frames = 0
+        self.dropped = 0
+        self.interval = None
+        self.last_start = None
+        self.loop_requested_at = None
+        self.loop_latency = None
+
+    def on_frame(self, frame):
+        '''
+        Counts a decoded frame, and the frames missing before it.
+        '''
+        self.frames += 1
+        start = frame.startTime() # microseconds, -1 when unknown
+        if self.loop_requested_at is not None:
+            self.loop_latency = time.perf_counter() - self.loop_requested_at
+            self.loop_requested_at = None
+        if start < 0:
+            return
+        if self.last_start is not None and start > self.last_start:
+            gap = start - self.last_start
+            # The smallest gap seen is the frame interval of the (constant rate) asset
+            self.interval = gap if self.interval is None else min(self.interval, gap)
+            if gap > 1.5 * self.interval:
+                self.dropped += round(gap / self.interval) - 1
+        self.last_start = start
+
+    def mark_loop(self):
+        '''
+        Records the seek to zero of a loop.
+        '''
+        self.loop_requested_at = time.perf_counter()
+        self.last_start = None
+
+    def sample(self, elapsed: float):
+        '''
+        Computes the decode FPS of the period that just ended.
+
+        Args:
+            elapsed (float): The length of the period in seconds.
+        '''
+        self.fps = self.frames / elapsed if elapsed > 0 else 0.0
+        self.frames = 0
+
+    def describe(self) -> str:
+        if not self.available:
+            return "no probe on this backend"
+        nominal = f" of {1e6 / self.interval:.0f}" if self.interval else ""
+        loop = "-" if self.loop_latency is None else f"{self.loop_latency * 1000:.0f} ms"
+        return f"{self.fps:.1f}{nominal} fps, {self.dropped} dropped, loop {loop}"
+
+
+class VideoMonitor:
+    '''
+    VideoMonitor
+    Samples the decode metrics of the video players every VIDEO_STATS_MS.
+
+    Attributes:
+        streams (dict): The StreamStats of every player, by name.
+        cpu_percent (float): The CPU usage of the media threads over the last period (100% being one core busy).
+    '''
+    def __init__(self, resources, players: dict):
+        '''
+        Constructor
+
+        Args:
+            resources (ResourceManager): The resource manager of the window, which owns the sampling timer.
+            players (dict): The QMediaPlayer of every stream, by name.
+        '''
+        self.resources = resources
+        self.streams = {name: StreamStats(name, player) for name, player in players.items()}
+        self.cpu_percent = None
+        self.last_sample = (time.perf_counter(), media_threads_cpu_time())
+
+    def start(self):
+        '''
+        Starts sampling.
+        '''
+        self.resources.timer("video_stats", self.sample).start(VIDEO_STATS_MS)
+
+    def mark_loop(self, name: str):
+        '''
+        Records the seek to zero of a loop of a stream.
+        '''
+        self.streams[name].mark_loop()
+
+    def sample(self):
+        '''
+        Computes the metrics of the period that just ended and reports them.
+        '''
+        now, cpu = time.perf_counter(), media_threads_cpu_time()
+        last_now, last_cpu = self.last_sample
+        self.last_sample = (now, cpu)
+        if cpu is not None and last_cpu is not None and now > last_now:
+            self.cpu_percent = 100 * (cpu - last_cpu) / (now - last_now)
+
+        metrics = get_metrics()
+        for stats in self.streams.values():
+            stats.sample(now - last_now)
+            metrics.gauge(f"video_{stats.name}", stats.describe())
+        metrics.gauge("media_cpu", f"{'-' if self.cpu_percent is None else f'{self.cpu_percent:.0f} %'} all media threads ({VIDEO_DECODE} decode)")
+
+    def report(self) -> str:
+        '''
+        Describes the metrics of every stream.
+
+        Returns:
+            string
+        '''
+        lines = [f"Video decode: {VIDEO_DECODE}, CPU of all media threads {'-' if self.cpu_percent is None else f'{self.cpu_percent:.0f} %'}"]
+        lines += [f"  {name:<6}{stats.describe()}" for name, stats in self.streams.items()]
+        return "\n".join(lines)
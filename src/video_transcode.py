@@ -0,0 +1,109 @@
+'''
+video_transcode.py
+
+This file prepares the videos of the avatar for the decode path chosen by VIDEO_DECODE.
+The "software" path plays copies of the assets transcoded by ffmpeg for cheap CPU decoding: H.264 with
+intra-only frames (every frame is a keyframe, so the seek to zero done at every loop costs no decoding
+of earlier frames), no B-frames, the fastdecode tuning (no CABAC, no deblocking), scaled down to
+VIDEO_TRANSCODE_WIDTH and without audio. When every copy is there, the hardware decoders of GStreamer are
+ranked out, so that the playback does not depend on a GPU. The "platform" path plays the original assets
+with whatever decoder Qt picks.
+'''
+
+import os
+import subprocess
+
+from .constant import *
+
+
+def transcoded_path(path: str) -> str:
+    '''
+    Returns the path of the transcoded copy of a video.
+
+    Args:
+        path (str): The path of the original video.
+
+    Returns:
+        string
+    '''
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(VIDEO_TRANSCODED_FOLDER, f"{name}.mp4")
+
+def transcode_command(source: str, destination: str) -> list:
+    '''
+    Builds the ffmpeg command transcoding a video for the software path.
+
+    Args:
+        source (str): The path of the original video.
+        destination (str): The path of the transcoded video.
+
+    Returns:
+        list: The command line.
+    '''
+    return [
+        "ffmpeg", "-y", "-loglevel", "error", "-i", source,
+        "-an",
+        "-vf", f"scale='min({VIDEO_TRANSCODE_WIDTH},iw)':-2",
+        "-c:v", "libx264", "-preset", "slow", "-tune", "fastdecode", "-crf", str(VIDEO_TRANSCODE_CRF),
+        "-g", "1", "-keyint_min", "1", "-bf", "0",
+        "-pix_fmt", "yuv420p",
+        "-movflags", "+faststart",
+        destination,
+    ]
+
+def transcode_videos(paths: list = None, force: bool = False):
+    '''
+    Transcodes the missing and stale copies of the videos.
+
+    Args:
+        paths (list): The original videos. Defaults to IDLE_VIDEO_PATH and TALK_VIDEO_PATH.
+        force (bool): Whether to transcode every video again.
+
+    Returns:
+        None
+    '''
+    paths = paths or [IDLE_VIDEO_PATH, TALK_VIDEO_PATH]
+    os.makedirs(VIDEO_TRANSCODED_FOLDER, exist_ok = True)
+    for path in paths:
+        destination = transcoded_path(path)
+        if not force and os.path.exists(destination) and os.path.getmtime(destination) >= os.path.getmtime(path):
+            print(f"UP TO DATE {destination}")
+            continue
+
+        # Write next to the destination first, so that the player never opens a partial file
+        temp_path = f"{os.path.splitext(destination)[0]}.tmp.mp4"
+        subprocess.run(transcode_command(path, temp_path), check = True)
+        os.replace(temp_path, destination)
+        print(f"TRANSCODED {path} -> {destination} ({os.path.getsize(path) >> 10} KiB -> {os.path.getsize(destination) >> 10} KiB)")
+
+def select_video_paths(mode: str = VIDEO_DECODE) -> list:
+    '''
+    Chooses the decode path of the videos. Must be called before the first QMediaPlayer is created,
+    as GStreamer reads the decoder ranks when it starts.
+
+    Args:
+        mode (str): "software" or "platform". Defaults to VIDEO_DECODE.
+
+    Returns:
+        list: The absolute paths of the idle and the talking videos.
+    '''
+    paths = [IDLE_VIDEO_PATH, TALK_VIDEO_PATH]
+    if mode == "platform":
+        return [os.path.abspath(path) for path in paths]
+    if mode != "software":
+        raise ValueError(f"Invalid VIDEO_DECODE {mode!r}, expected \"software\" or \"platform\"")
+
+    selected = []
+    for path in paths:
+        if os.path.exists(transcoded_path(path)):
+            selected.append(transcoded_path(path))
+        else:
+            print(f"No transcoded copy of {path}, run \"python main.py transcode-videos\"")
+            selected.append(path)
+
+    # Software decoding pays off for the intra-only copies only: the original long-GOP assets keep the hardware decoders
+    if all(os.path.exists(transcoded_path(path)) for path in paths):
+        # A rank of NONE keeps GStreamer from choosing the hardware decoders
+        ranks = [rank for rank in os.environ.get("GST_PLUGIN_FEATURE_RANK", "").split(",") if rank]
+        os.environ["GST_PLUGIN_FEATURE_RANK"] = ",".join(ranks + [f"{decoder}:NONE" for decoder in VIDEO_HARDWARE_DECODERS])
+    return [os.path.abspath(path) for path in selected]
@@ -7,45 +7,60 @@ This file uses the STEN TTS API to convert text to speech using recorded audio a
 import ast
 import base64
 import json
-import pyaudio
 import requests
-import wave
-import sounddevice as sd
 import numpy as np
 import time
 
 from pydub import AudioSegment
-from pydub.playback import play
 from io import BytesIO
-from scipy.io.wavfile import write
 from .constant import *
+from .audio_device import get_audio_device
+from .audio_file import open_wav, write_wav
+from .tts_endpoints import get_endpoint_pool
+from .request_body import stream_json_body
+from .audio_quality import assess_recording
 
-def record(filename: str = WAVE_OUTPUT_FILENAME):
+def record(filename: str = WAVE_OUTPUT_FILENAME, mark: int = None):
     '''
     Records audio from the default input device and saves it to a WAV file.
+    The recording starts at the mark and includes PRE_ROLL_SECONDS of audio captured before it.
+    It goes through the quality gate first: long silences at both ends are trimmed.
 
     Args:
         filename (str): The name of the WAV file to save the recorded audio. Defaults to WAVE_OUTPUT_FILENAME.
+        mark (int): The frame index at which the recording starts, from AudioDevice.mark(). Defaults to now.
 
     Returns:
-        None
+        string: The decision of the quality gate ("proceed", "trim" or "retry").
     '''
-    # Define the duration of the recording in seconds and the sample rate
-    duration = 5  # seconds
-    sample_rate = 22050  # Hz
+    # Define the duration of the recording in seconds
+    duration = RECORD_SECONDS
 
-    # Record audio
+    # Record audio from the persistent stream
     print("Recording...")
-    audio = sd.rec(int(duration * sample_rate), samplerate=sample_rate, channels=1, dtype='float32')
-    sd.wait()  # Wait until recording is finished
+    device = get_audio_device()
+    device.arm()
+    if mark is None:
+        mark = device.mark()
+    sample_rate = device.samplerate
+    audio = device.recording(mark, duration)
     print("Recording finished.")
 
-    # Normalize to 16-bit range
-    # audio_normalized = np.int16(audio / np.max(np.abs(audio)) * 32767)
+    # Check the take before any backend time is spent on it
+    decision = "proceed"
+    if QUALITY_GATE:
+        report = assess_recording(audio, sample_rate)
+        print(report)
+        decision = report.decision
+        if decision == "trim":
+            audio = audio[report.start:report.end]
+
+    # No normalization here: the capture is already denoised and leveled in the audio callback (see noise_suppress.py)
 
-    # Save the recording into a WAV file
-    write(filename, sample_rate, audio)
+    # Save the recording into a WAV file, replacing the previous one so that its readers keep a valid map
+    write_wav(filename, sample_rate, audio)
     print(f"File saved as {filename}.")
+    return decision
 
 def play_audio(filename: str = WAVE_OUTPUT_FILENAME):
     '''
@@ -57,48 +72,27 @@ def play_audio(filename: str = WAVE_OUTPUT_FILENAME):
     Returns:
         None
     '''
-    # Play the recorded audio
-    wave_file = wave.open(filename, 'rb')
-
-    audio = pyaudio.PyAudio()
-
-    stream = audio.open(format=audio.get_format_from_width(wave_file.getsampwidth()),
-                        channels=wave_file.getnchannels(),
-                        rate=wave_file.getframerate(),
-                        output=True)
+    # Play the recorded audio through the persistent stream, straight from the mapped file
+    wav = open_wav(filename)
 
     print("Playing recorded audio...")
-
-    data = wave_file.readframes(CHUNK)
-
-    while data:
-        stream.write(data)
-        data = wave_file.readframes(CHUNK)
-
+    get_audio_device().play(wav.samples, wav.samplerate).wait()
     print("Playback finished.")
 
-    # Stop playing
-    stream.stop_stream()
-    stream.close()
-    audio.terminate()
-
-def exec_voice_change(source_filename: str = WAVE_OUTPUT_FILENAME, target_filename: str = WAVE_OUTPUT_FILENAME, language: str = "en") -> str:
+def call_sten_api(text: str, code_lang: str, reference) -> str:
     '''
-    Perform text-to-speech using the STEN TTS API.
+    Synthesize a text with the voice of the reference audio using the STEN TTS API.
+    The request goes through the endpoint pool, which routes and hedges it across the STEN servers.
+    A binary reference is base64-encoded while the request is sent (see request_body.py).
 
     Args:
-        source_filename (str): The path to the source file name
-        target_filename (str): The path to the result file name
-    '''
-    audio_binary = open(source_filename, 'rb') #open binary file in read mode
-    audio_binary_base64 = base64.b64encode(audio_binary.read())
-    # text = "This speech was generated using STEN T.T.S. from H.A.I. Lab."
-    text = "このデモはHAI研究室の音声合成技術を使用しています。"
-
-    code_lang = "english" if language == "en" else "japanese"
-    if code_lang == "english":
-        text = "This speech was generated using STEN T.T.S. from H.A.I. Lab."
+        text (str): The text to synthesize.
+        code_lang (str): The STEN language name (e.g. "english", "japanese").
+        reference (str | bytes-like): The base64-encoded reference audio, or the reference WAV file itself.
 
+    Returns:
+        string: The URL of the synthesized MP3 file.
+    '''
     data = {
         'text': text,
         'speed': 1.0,
@@ -107,7 +101,7 @@ def exec_voice_change(source_filename: str = WAVE_OUTPUT_FILENAME, target_filena
         'language': code_lang,
         'energy': 1.0,
         'pitch': 1.0,
-        'reference': audio_binary_base64.decode('utf-8'),
+        'reference': reference,
         'speaker_id': ''
     }
 
@@ -115,7 +109,15 @@ def exec_voice_change(source_filename: str = WAVE_OUTPUT_FILENAME, target_filena
         'Content-type': 'application/json',
     }
 
-    response = requests.post(STEN_URL, data=json.dumps(data), headers=headers)
+    if isinstance(reference, str):
+        body = json.dumps(data)
+    elif STEN_STREAM_BODY:
+        # A new generator for every attempt of the pool
+        body = lambda fields = data: stream_json_body(fields, 'reference', reference)
+    else:
+        body = json.dumps({**data, 'reference': base64.b64encode(reference).decode('ascii')})
+
+    response = get_endpoint_pool().post(body, headers)
     print(response)
     data = response.content
     data = ast.literal_eval(data.decode("utf-8"))
@@ -123,6 +125,24 @@ def exec_voice_change(source_filename: str = WAVE_OUTPUT_FILENAME, target_filena
 
     return url_output
 
+def exec_voice_change(source_filename: str = WAVE_OUTPUT_FILENAME, target_filename: str = WAVE_OUTPUT_FILENAME, language: str = "en") -> str:
+    '''
+    Perform text-to-speech using the STEN TTS API.
+
+    Args:
+        source_filename (str): The path to the source file name
+        target_filename (str): The path to the result file name
+    '''
+    audio_binary = open_wav(source_filename).raw # streamed straight from the mapped file
+    # text = "This speech was generated using STEN T.T.S. from H.A.I. Lab."
+    text = "このデモはHAI研究室の音声合成技術を使用しています。"
+
+    code_lang = "english" if language == "en" else "japanese"
+    if code_lang == "english":
+        text = "This speech was generated using STEN T.T.S. from H.A.I. Lab."
+
+    return call_sten_api(text, code_lang, audio_binary)
+
 def exec_voice_change2(source_filename: str = WAVE_OUTPUT_FILENAME, target_filename: str = WAVE_OUTPUT_FILENAME, language: str = "en") -> str:
     '''
     Perform text-to-speech using the STEN TTS API.
@@ -131,8 +151,7 @@ def exec_voice_change2(source_filename: str = WAVE_OUTPUT_FILENAME, target_filen
         source_filename (str): The path to the source file name
         target_filename (str): The path to the result file name
     '''
-    audio_binary = open(source_filename, 'rb') #open binary file in read mode
-    audio_binary_base64 = base64.b64encode(audio_binary.read())
+    audio_binary_base64 = base64.b64encode(open_wav(source_filename).raw) # encode straight from the mapped file
     # text = "This speech was generated using STEN T.T.S. from H.A.I. Lab."
     text = "このデモはHAI研究室の音声合成技術を使用しています。"
 
@@ -179,7 +198,8 @@ def play_mp3_from_url(url: str):
     if response.status_code == 200:
         audio_data = BytesIO(response.content)
         audio = AudioSegment.from_file(audio_data, format='mp3')
+        samples = np.array(audio.get_array_of_samples()).reshape(-1, audio.channels)
 
-        play(audio)
+        get_audio_device().play(samples, audio.frame_rate).wait()
     else:
         print("Faild to get audio data from URL.")
\ No newline at end of file
@@ -0,0 +1,10 @@
+'''
+conftest.py
+
+Makes the src package importable from the tests, run from the root of the repository with "python -m pytest".
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
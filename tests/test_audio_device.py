@@ -0,0 +1,50 @@
+'''
+Tests of the ring buffer of the duplex audio stream.
+'''
+
+import numpy as np
+import pytest
+
+try:
+    from src.audio_device import RingBuffer
+except (ImportError, OSError) as e:
+    # sounddevice raises OSError when PortAudio is missing
+    pytest.skip(f"audio_device cannot be imported: {e}", allow_module_level = True)
+
+
+def frames(start: int, count: int) -> np.ndarray:
+    '''
+    Returns frames whose value is their absolute index.
+    '''
+    return np.arange(start, start + count, dtype = 'float32').reshape(-1, 1)
+
+def test_latest_returns_the_last_frames_written():
+    buffer = RingBuffer(8, channels = 1)
+    buffer.write(frames(0, 5))
+    assert buffer.written == 5
+    np.testing.assert_array_equal(buffer.latest(3), frames(2, 3))
+    # Never more than what was written
+    np.testing.assert_array_equal(buffer.latest(10), frames(0, 5))
+
+def test_a_window_across_the_wrap_is_one_contiguous_view():
+    buffer = RingBuffer(8, channels = 1)
+    for start in range(0, 20, 3):
+        buffer.write(frames(start, 3))
+    window = buffer.view(buffer.written - 8, 8)
+    np.testing.assert_array_equal(window, frames(buffer.written - 8, 8))
+    assert window.base is not None and np.shares_memory(window, buffer.data)
+
+def test_overwritten_and_future_frames_are_refused():
+    buffer = RingBuffer(8, channels = 1)
+    buffer.write(frames(0, 12))
+    with pytest.raises(ValueError):
+        buffer.view(3, 2)
+    with pytest.raises(ValueError):
+        buffer.view(10, 4)
+    np.testing.assert_array_equal(buffer.view(4, 8), frames(4, 8))
+
+def test_a_block_larger_than_the_buffer_keeps_its_end():
+    buffer = RingBuffer(4, channels = 1)
+    buffer.write(frames(0, 10))
+    assert buffer.written == 10
+    np.testing.assert_array_equal(buffer.latest(4), frames(6, 4))
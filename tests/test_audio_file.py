@@ -0,0 +1,92 @@
+'''
+Tests of the memory-mapped WAV files.
+'''
+
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from src.audio_file import MappedWav, open_wav, write_wav
+
+
+def wav_bytes(samples: np.ndarray, samplerate: int, format_tag: int = 1, extensible: bool = False, extra_chunks: bytes = b"", data_size: int = None) -> bytes:
+    '''
+    Builds a WAV file by hand, so that the unusual layouts can be tested.
+    '''
+    channels = samples.shape[1]
+    sample_size = samples.dtype.itemsize
+    block_align = channels * sample_size
+    data = samples.tobytes()
+    if extensible:
+        fmt = struct.pack('<HHIIHHHHIH14s', 0xFFFE, channels, samplerate, samplerate * block_align, block_align, 8 * sample_size, 22, 8 * sample_size, 0, format_tag, b"\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71")
+    else:
+        fmt = struct.pack('<HHIIHH', format_tag, channels, samplerate, samplerate * block_align, block_align, 8 * sample_size)
+    body = b"WAVE" + b"fmt " + struct.pack('<I', len(fmt)) + fmt + extra_chunks
+    body += b"data" + struct.pack('<I', len(data) if data_size is None else data_size) + data
+    return b"RIFF" + struct.pack('<I', len(body)) + body
+
+def write(path, content: bytes) -> str:
+    with open(path, "wb") as f:
+        f.write(content)
+    return str(path)
+
+def test_pcm16_samples_are_a_view_of_the_file(tmp_path):
+    samples = (np.arange(-50, 50, dtype = '<i2') * 300).reshape(-1, 2)
+    wav = MappedWav(write(tmp_path / "a.wav", wav_bytes(samples, 22050)))
+    assert (wav.samplerate, wav.channels) == (22050, 2)
+    np.testing.assert_array_equal(wav.samples, samples)
+    assert not wav.samples.flags.writeable
+    assert wav.duration == pytest.approx(50 / 22050)
+    np.testing.assert_allclose(wav.as_float(), samples / 32767, rtol = 1e-6)
+
+def test_float_files_are_returned_without_conversion(tmp_path):
+    samples = np.linspace(-1, 1, 64, dtype = '<f4').reshape(-1, 1)
+    wav = MappedWav(write(tmp_path / "f.wav", wav_bytes(samples, 16000, format_tag = 3)))
+    assert wav.as_float() is wav.samples
+    np.testing.assert_array_equal(wav.samples, samples)
+
+def test_chunks_before_the_data_are_skipped(tmp_path):
+    samples = np.arange(10, dtype = '<i2').reshape(-1, 1)
+    # An odd-sized chunk is followed by a pad byte
+    extra = b"LIST" + struct.pack('<I', 5) + b"abcde\x00"
+    wav = MappedWav(write(tmp_path / "l.wav", wav_bytes(samples, 8000, extra_chunks = extra)))
+    np.testing.assert_array_equal(wav.samples, samples)
+
+def test_the_extensible_format_uses_its_sub_format(tmp_path):
+    samples = np.arange(8, dtype = '<i2').reshape(-1, 1)
+    wav = MappedWav(write(tmp_path / "e.wav", wav_bytes(samples, 8000, extensible = True)))
+    np.testing.assert_array_equal(wav.samples, samples)
+
+def test_a_data_chunk_longer_than_the_file_is_cut_to_the_file(tmp_path):
+    samples = np.arange(10, dtype = '<i2').reshape(-1, 1)
+    wav = MappedWav(write(tmp_path / "t.wav", wav_bytes(samples, 8000, data_size = 0xFFFFFFF0)))
+    np.testing.assert_array_equal(wav.samples, samples)
+
+@pytest.mark.parametrize("content", [
+    b"not a wav file at all",
+    b"RIFF" + struct.pack('<I', 4) + b"WAVE",
+])
+def test_invalid_files_are_refused(tmp_path, content):
+    with pytest.raises(ValueError):
+        MappedWav(write(tmp_path / "bad.wav", content))
+
+def test_an_unsupported_sample_format_is_refused(tmp_path):
+    samples = np.zeros((4, 1), dtype = '<i2')
+    with pytest.raises(ValueError):
+        MappedWav(write(tmp_path / "alaw.wav", wav_bytes(samples, 8000, format_tag = 6)))
+
+def test_open_wav_reuses_the_map_until_the_file_is_replaced(tmp_path):
+    path = str(tmp_path / "r.wav")
+    write_wav(path, 8000, np.zeros(16, dtype = 'int16'))
+    first = open_wav(path)
+    assert open_wav(path) is first
+
+    write_wav(path, 8000, np.ones(32, dtype = 'int16'))
+    second = open_wav(path)
+    assert second is not first
+    assert len(second.samples) == 32
+    # The old map stays valid for the consumers that still hold it
+    assert len(first.samples) == 16 and not np.any(first.samples)
+    assert not os.path.exists(f"{path}.tmp")
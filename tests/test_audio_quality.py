@@ -0,0 +1,55 @@
+'''
+Tests of the quality gate of the recordings.
+'''
+
+import numpy as np
+
+from src.audio_quality import assess_recording
+
+RATE = 16000
+
+
+def take(seconds: float, noise: float = 1e-3, voice: tuple = None, amplitude: float = 0.3, seed: int = 0) -> np.ndarray:
+    '''
+    Returns a take of background noise, with a voiced tone between the given times (in seconds).
+    '''
+    rng = np.random.default_rng(seed)
+    audio = rng.normal(0, noise, int(seconds * RATE)).astype('float32')
+    if voice is not None:
+        start, end = (int(t * RATE) for t in voice)
+        audio[start:end] += amplitude * np.sin(2 * np.pi * 220 * np.arange(end - start) / RATE)
+    return audio
+
+def test_speech_from_start_to_end_proceeds():
+    report = assess_recording(take(3.0, voice = (0.0, 3.0)), RATE)
+    assert report.decision == "proceed"
+    assert report.speech_fraction > 0.9
+    assert (report.start, report.end) == (0, 3 * RATE)
+
+def test_long_silences_at_both_ends_are_trimmed():
+    report = assess_recording(take(5.0, voice = (2.0, 3.0)), RATE)
+    assert report.decision == "trim"
+    margin = 0.25 * RATE
+    assert abs(report.start - (2.0 * RATE - margin)) <= 0.02 * RATE
+    assert abs(report.end - (3.0 * RATE + margin)) <= 0.02 * RATE
+
+def test_a_silent_take_is_retried():
+    report = assess_recording(take(3.0), RATE)
+    assert (report.decision, report.reason) == ("retry", "no speech")
+
+def test_a_clipped_take_is_retried():
+    audio = np.clip(take(3.0, voice = (0.0, 3.0), amplitude = 3.0), -1, 1)
+    report = assess_recording(audio, RATE)
+    assert (report.decision, report.reason) == ("retry", "clipped")
+    assert report.peak == 1.0
+
+def test_an_empty_take_is_retried():
+    report = assess_recording(np.zeros(0, dtype = 'float32'), RATE)
+    assert (report.decision, report.reason) == ("retry", "empty")
+
+def test_integer_takes_are_scaled_to_full_scale():
+    audio = take(3.0, voice = (0.0, 3.0))
+    report_float = assess_recording(audio, RATE)
+    report_int = assess_recording((audio * 32767).astype('int16').reshape(-1, 1), RATE)
+    assert report_int.decision == report_float.decision
+    assert abs(report_int.rms_dbfs - report_float.rms_dbfs) < 0.1
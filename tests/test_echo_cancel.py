@@ -0,0 +1,82 @@
+'''
+Tests of the echo canceller, on a synthetic echo path.
+'''
+
+import numpy as np
+
+from src.echo_cancel import EchoCanceller
+
+BLOCK = 256
+
+
+def echo_path(seed: int = 0) -> np.ndarray:
+    '''
+    Returns a short decaying room response, quiet enough for the double-talk detector to let the filter adapt.
+    '''
+    rng = np.random.default_rng(seed)
+    return (rng.normal(0, 1, 64) * np.exp(-np.arange(64) / 10) * 0.05).astype('float32')
+
+def run(canceller: EchoCanceller, microphone: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    return np.concatenate([canceller.process(microphone[i:i + BLOCK], reference[i:i + BLOCK]) for i in range(0, len(reference), BLOCK)])
+
+def erle(microphone: np.ndarray, output: np.ndarray, blocks: slice) -> float:
+    '''
+    Returns the echo return loss enhancement over a range of blocks, in dB.
+    '''
+    span = slice(blocks.start * BLOCK, blocks.stop * BLOCK)
+    return 10 * np.log10(np.sum(microphone[span] ** 2) / np.sum(output[span] ** 2))
+
+def test_the_echo_is_removed_once_the_filter_has_converged():
+    rng = np.random.default_rng(1)
+    reference = rng.normal(0, 0.3, BLOCK * 200).astype('float32')
+    microphone = np.convolve(reference, echo_path())[:len(reference)].astype('float32')
+    output = run(EchoCanceller(BLOCK, 4, 0.5), microphone, reference)
+    assert erle(microphone, output, slice(150, 200)) > 30
+
+def test_adaptation_resumes_after_a_silent_reference():
+    rng = np.random.default_rng(2)
+    reference = rng.normal(0, 0.3, BLOCK * 400).astype('float32')
+    reference[BLOCK * 150:BLOCK * 300] = 0
+    microphone = np.convolve(reference, echo_path())[:len(reference)].astype('float32')
+    output = run(EchoCanceller(BLOCK, 4, 0.5), microphone, reference)
+    assert np.all(np.isfinite(output))
+    # The first blocks after the silence must not diverge
+    assert erle(microphone, output, slice(300, 320)) > 30
+
+def test_the_microphone_passes_through_without_reference():
+    rng = np.random.default_rng(3)
+    microphone = rng.normal(0, 0.1, BLOCK * 20).astype('float32')
+    canceller = EchoCanceller(BLOCK, 4, 0.5)
+    output = run(canceller, microphone, np.zeros_like(microphone))
+    np.testing.assert_allclose(output, microphone, atol = 1e-6)
+    assert not np.any(canceller.weights)
+
+def test_the_filter_does_not_adapt_to_the_visitor_voice():
+    rng = np.random.default_rng(4)
+    reference = rng.normal(0, 0.01, BLOCK * 20).astype('float32')
+    # Double talk: the voice is far louder than the playback
+    microphone = rng.normal(0, 0.3, BLOCK * 20).astype('float32')
+    canceller = EchoCanceller(BLOCK, 4, 0.5)
+    run(canceller, microphone, reference)
+    assert not np.any(canceller.weights)
+
+def test_reset_forgets_the_filter():
+    rng = np.random.default_rng(5)
+    reference = rng.normal(0, 0.3, BLOCK * 50).astype('float32')
+    microphone = np.convolve(reference, echo_path())[:len(reference)].astype('float32')
+    canceller = EchoCanceller(BLOCK, 4, 0.5)
+    run(canceller, microphone, reference)
+    assert np.any(canceller.weights)
+    canceller.reset()
+    assert not np.any(canceller.weights) and canceller.power is None
+
+def test_the_reference_power_holds_through_a_silence():
+    rng = np.random.default_rng(6)
+    canceller = EchoCanceller(BLOCK, 4, 0.5)
+    for _ in range(30):
+        canceller.process(np.zeros(BLOCK, dtype = 'float32'), rng.normal(0, 0.3, BLOCK).astype('float32'))
+    power = canceller.power.copy()
+    for _ in range(100):
+        canceller.process(np.zeros(BLOCK, dtype = 'float32'), np.zeros(BLOCK, dtype = 'float32'))
+    # A power decayed through the silence would make the first steps after it far too large
+    np.testing.assert_array_equal(canceller.power, power)
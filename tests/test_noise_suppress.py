@@ -0,0 +1,76 @@
+'''
+Tests of the noise suppressor and the automatic gain control of the microphone stream.
+'''
+
+import numpy as np
+
+from src.constant import AGC_PEAK, AGC_TARGET_DBFS
+from src.noise_suppress import NoiseSuppressor, AutomaticGainControl
+
+BLOCK = 512
+RATE = 16000
+
+
+def blocks(signal: np.ndarray) -> list:
+    return [signal[i:i + BLOCK] for i in range(0, len(signal), BLOCK)]
+
+def tone(count: int, amplitude: float, frequency: float = 440.0) -> np.ndarray:
+    return (amplitude * np.sin(2 * np.pi * frequency * np.arange(count * BLOCK) / RATE)).astype('float32')
+
+def dbfs(signal: np.ndarray) -> float:
+    return 10 * np.log10(np.mean(signal ** 2) + 1e-20)
+
+def test_stationary_noise_is_attenuated():
+    noise = np.random.default_rng(0).normal(0, 0.01, BLOCK * 200).astype('float32')
+    suppressor = NoiseSuppressor(BLOCK, RATE)
+    output = np.concatenate([suppressor.process(block) for block in blocks(noise)])
+    assert dbfs(output[-BLOCK * 50:]) < dbfs(noise[-BLOCK * 50:]) - 10
+
+def test_a_clean_signal_comes_out_one_block_late():
+    signal = np.concatenate((np.zeros(BLOCK, dtype = 'float32'), tone(30, 0.3)))
+    suppressor = NoiseSuppressor(BLOCK, RATE)
+    output = np.concatenate([suppressor.process(block) for block in blocks(signal)])
+    np.testing.assert_allclose(output[BLOCK:], signal[:-BLOCK], atol = 0.01)
+
+def test_speech_over_noise_keeps_its_level():
+    rng = np.random.default_rng(1)
+    noise = rng.normal(0, 0.005, BLOCK * 150).astype('float32')
+    voice = np.zeros_like(noise)
+    voice[BLOCK * 100:] = tone(50, 0.2)
+    suppressor = NoiseSuppressor(BLOCK, RATE)
+    output = np.concatenate([suppressor.process(block) for block in blocks(noise + voice)])
+    assert abs(dbfs(output[BLOCK * 110:]) - dbfs(voice[BLOCK * 109:-BLOCK])) < 1.0
+
+def test_quiet_speech_is_raised_towards_the_target():
+    agc = AutomaticGainControl()
+    # -37 dBFS, just above the gate
+    signal = tone(150, 0.02)
+    output = np.concatenate([agc.process(block) for block in blocks(signal)])
+    assert agc.gain > 1.0
+    assert dbfs(output[-BLOCK * 10:]) > dbfs(signal) + 10
+    assert dbfs(output[-BLOCK * 10:]) <= AGC_TARGET_DBFS + 0.5
+
+def test_loud_speech_is_never_attenuated():
+    agc = AutomaticGainControl()
+    signal = tone(30, 0.5)
+    output = np.concatenate([agc.process(block) for block in blocks(signal)])
+    np.testing.assert_array_equal(output, signal)
+
+def test_peaks_are_kept_under_the_limit():
+    # Sparse clicks: a low level, so a high gain is wanted, but high peaks
+    signal = np.zeros(BLOCK * 40, dtype = 'float32')
+    signal[::64] = 0.6
+    agc = AutomaticGainControl()
+    output = np.concatenate([agc.process(block) for block in blocks(signal)])
+    assert np.abs(output).max() <= max(AGC_PEAK, 0.6) + 1e-6
+
+def test_pauses_are_left_at_unity_gain():
+    agc = AutomaticGainControl()
+    for block in blocks(tone(100, 0.02)):
+        agc.process(block)
+    learned = agc.speech_gain
+    pause = np.random.default_rng(2).normal(0, 1e-4, 2 * BLOCK).astype('float32')
+    agc.process(pause[:BLOCK])
+    np.testing.assert_array_equal(agc.process(pause[BLOCK:]), pause[BLOCK:])
+    # The gain learned on the speech is kept for when it resumes
+    assert agc.speech_gain == learned
@@ -0,0 +1,37 @@
+'''
+Tests of the streamed JSON request bodies.
+'''
+
+import base64
+import json
+
+import pytest
+
+from src.request_body import base64_chunks, stream_json_body
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 1000, 4099])
+@pytest.mark.parametrize("chunk_size", [1, 3, 10, 48 * 1024])
+def test_the_chunks_concatenate_into_the_base64_of_the_data(size, chunk_size):
+    data = bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+    assert b"".join(base64_chunks(data, chunk_size)) == base64.b64encode(data)
+
+def test_the_body_round_trips_through_json_loads():
+    data = bytes(range(256)) * 40
+    fields = {'text': 'こんにちは "quoted"\n', 'speed': 1.0, 'reference': None, 'speaker_id': ''}
+    body = b"".join(stream_json_body(fields, 'reference', data, chunk_size = 100))
+
+    decoded = json.loads(body)
+    assert base64.b64decode(decoded['reference']) == data
+    assert decoded == {**fields, 'reference': base64.b64encode(data).decode('ascii')}
+    # The binary field keeps its place among the other fields
+    assert list(decoded) == list(fields)
+
+def test_a_memoryview_is_encoded_without_copy_by_the_caller():
+    data = bytearray(b"\x00\xff" * 500)
+    body = b"".join(stream_json_body({'text': 'x'}, 'reference', memoryview(data)))
+    assert base64.b64decode(json.loads(body)['reference']) == bytes(data)
+
+def test_an_empty_payload_gives_an_empty_string():
+    body = b"".join(stream_json_body({'text': 'x'}, 'reference', b""))
+    assert json.loads(body) == {'text': 'x', 'reference': ''}
@@ -0,0 +1,109 @@
+'''
+Tests of the session archive: writes to the segments and the index, queries and exports.
+'''
+
+import io
+import os
+
+import numpy as np
+import pytest
+
+sf = pytest.importorskip("soundfile")
+
+from src.session_archive import SessionArchive, query_sessions, export_session, read_blob, segment_path, encode_audio
+
+
+def voice(seconds: float, sample_rate: int) -> np.ndarray:
+    time = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (0.3 * np.sin(2 * np.pi * 220 * time) * 32767).astype('int16')
+
+def details(started_at: str, language: str = "en", latency: float = 1.0) -> dict:
+    return {
+        'started_at': started_at,
+        'language': language,
+        'scenario': "default",
+        'transcript': "hello",
+        'backend': "sten",
+        'latency': latency,
+        'timings': {'asr': 0.2},
+    }
+
+def archive_sessions(folder, codec: str = "flac", segment_bytes: int = 1 << 20) -> list:
+    archive = SessionArchive(folder = str(folder), segment_bytes = segment_bytes, codec = codec)
+    ids = [
+        archive.submit((voice(0.5, 16000), 16000), (voice(0.5, 22050), 22050), details("2026-10-01T10:00:00", "en", 0.8)).result(),
+        archive.submit((voice(0.5, 16000), 16000), None, details("2026-10-02T11:00:00", "jp", 2.5)).result(),
+        archive.submit((voice(0.5, 16000), 16000), (voice(0.5, 22050), 22050), details("2026-10-03T23:59:59", "en", 1.5)).result(),
+    ]
+    archive.executor.shutdown()
+    return ids
+
+def test_sessions_are_indexed(tmp_path):
+    ids = archive_sessions(tmp_path)
+    assert None not in ids
+    rows = query_sessions(folder = str(tmp_path))
+    assert [row['id'] for row in rows] == ids
+    assert rows[0]['recording_seconds'] == pytest.approx(0.5)
+    assert rows[1]['synthesis_segment'] is None
+
+def test_query_by_date_includes_the_last_day(tmp_path):
+    ids = archive_sessions(tmp_path)
+    rows = query_sessions(date_from = "2026-10-02", date_to = "2026-10-03", folder = str(tmp_path))
+    assert [row['id'] for row in rows] == ids[1:]
+
+def test_query_by_language_and_latency(tmp_path):
+    ids = archive_sessions(tmp_path)
+    assert [row['id'] for row in query_sessions(language = "en", folder = str(tmp_path))] == [ids[0], ids[2]]
+    assert [row['id'] for row in query_sessions(min_latency = 1.0, max_latency = 2.0, folder = str(tmp_path))] == [ids[2]]
+    assert query_sessions(language = "jp", max_latency = 1.0, folder = str(tmp_path)) == []
+
+def test_blobs_decode_to_the_archived_audio(tmp_path):
+    archive_sessions(tmp_path)
+    row = query_sessions(folder = str(tmp_path))[0]
+    blob = read_blob(row['synthesis_segment'], row['synthesis_offset'], row['synthesis_length'], str(tmp_path))
+    samples, sample_rate = sf.read(io.BytesIO(blob), dtype = 'int16')
+    assert sample_rate == 22050
+    np.testing.assert_array_equal(samples, voice(0.5, 22050))
+
+def test_segments_roll_over(tmp_path):
+    size = len(encode_audio(voice(0.5, 16000), 16000, "flac"))
+    archive_sessions(tmp_path, segment_bytes = 2 * size)
+    rows = query_sessions(folder = str(tmp_path))
+    segments = {row['recording_segment'] for row in rows} | {row['synthesis_segment'] for row in rows if row['synthesis_segment']}
+    assert len(segments) > 1
+    for number in segments:
+        # Every blob is smaller than the limit, so no segment goes over it
+        assert os.path.getsize(segment_path(number, str(tmp_path))) <= 2 * size
+    # A new archive on the same folder goes on appending to the last segment
+    archive = SessionArchive(folder = str(tmp_path), segment_bytes = 2 * size, codec = "flac")
+    session_id = archive.submit((voice(0.1, 16000), 16000), None, details("2026-10-04T09:00:00")).result()
+    archive.executor.shutdown()
+    assert query_sessions(date_from = "2026-10-04", folder = str(tmp_path))[0]['id'] == session_id
+    assert query_sessions(date_from = "2026-10-04", folder = str(tmp_path))[0]['recording_segment'] >= max(segments)
+
+def test_export_flac(tmp_path):
+    ids = archive_sessions(tmp_path / "archive")
+    paths = export_session(ids[0], str(tmp_path / "export"), folder = str(tmp_path / "archive"))
+    assert [os.path.basename(path) for path in paths] == [f"session-{ids[0]}-recording.flac", f"session-{ids[0]}-synthesis.flac"]
+    assert sf.info(paths[0]).samplerate == 16000
+
+def test_export_opus(tmp_path):
+    if "OPUS" not in sf.available_subtypes("OGG"):
+        pytest.skip("libsndfile without Opus")
+    ids = archive_sessions(tmp_path / "archive", codec = "opus")
+    paths = export_session(ids[0], str(tmp_path / "export"), folder = str(tmp_path / "archive"))
+    assert [os.path.splitext(path)[1] for path in paths] == [".opus", ".opus"]
+    # 22050 Hz is not an Opus rate: the synthesis is resampled
+    assert sf.info(paths[1]).samplerate in (24000, 48000)
+    assert sf.info(paths[1]).duration == pytest.approx(0.5, abs = 0.05)
+
+def test_export_of_an_unknown_session(tmp_path):
+    archive_sessions(tmp_path / "archive")
+    with pytest.raises(KeyError):
+        export_session(99, str(tmp_path / "export"), folder = str(tmp_path / "archive"))
+
+def test_invalid_codec_is_not_archived(tmp_path):
+    archive = SessionArchive(folder = str(tmp_path), codec = "mp3")
+    assert archive.submit((voice(0.1, 16000), 16000), None, details("2026-10-01T10:00:00")).result() is None
+    archive.executor.shutdown()
+    assert query_sessions(folder = str(tmp_path)) == []
@@ -0,0 +1,136 @@
+'''
+Tests of the layered settings: defaults, settings file, environment and command line.
+'''
+
+import json
+
+import pytest
+
+from src import settings
+from src.settings import apply_settings, parse_cli, strip_cli, fingerprint, describe
+
+
+@pytest.fixture
+def namespace(tmp_path):
+    settings.sources.clear()
+    return {
+        'RATE': 16000,
+        'PROMPT_SAMPLE_RATE': 16000,
+        'VOLUME': 0.5,
+        'LANGUAGE': "en",
+        'ECHO_CANCELLATION': True,
+        'COUNTDOWN_OVERLAP': True,
+        'LANGUAGES': ["en", "fr"],
+        'SETTINGS_FILE': str(tmp_path / "settings.json"),
+        'lowercase': 1,
+    }
+
+def write_settings(path, values: dict):
+    with open(path, 'w', encoding = 'utf-8') as f:
+        json.dump(values, f)
+
+def test_defaults_are_kept_without_overrides(namespace):
+    apply_settings(namespace, argv = ["main.py"], environ = {})
+    assert namespace['RATE'] == 16000
+    assert settings.sources['RATE'] == "default"
+    assert 'lowercase' not in settings.sources
+
+def test_file_beats_default(namespace):
+    write_settings(namespace['SETTINGS_FILE'], {'LANGUAGE': "ja"})
+    apply_settings(namespace, argv = ["main.py"], environ = {})
+    assert namespace['LANGUAGE'] == "ja"
+    assert settings.sources['LANGUAGE'] == "file"
+
+def test_env_beats_file(namespace):
+    write_settings(namespace['SETTINGS_FILE'], {'LANGUAGE': "ja"})
+    apply_settings(namespace, argv = ["main.py"], environ = {'OPENCAMPUS_LANGUAGE': "fr"})
+    assert namespace['LANGUAGE'] == "fr"
+    assert settings.sources['LANGUAGE'] == "env"
+
+def test_cli_beats_env(namespace):
+    write_settings(namespace['SETTINGS_FILE'], {'LANGUAGE': "ja"})
+    argv = ["main.py", "--set", "LANGUAGE=de"]
+    apply_settings(namespace, argv = argv, environ = {'OPENCAMPUS_LANGUAGE': "fr"})
+    assert namespace['LANGUAGE'] == "de"
+    assert settings.sources['LANGUAGE'] == "cli"
+
+def test_settings_flag_replaces_the_settings_file(namespace, tmp_path):
+    write_settings(namespace['SETTINGS_FILE'], {'VOLUME': 0.1})
+    other = tmp_path / "other.json"
+    write_settings(other, {'VOLUME': 0.9})
+    apply_settings(namespace, argv = ["main.py", "--settings", str(other)], environ = {})
+    assert namespace['VOLUME'] == 0.9
+
+def test_values_are_parsed_to_the_type_of_the_default(namespace):
+    environ = {'OPENCAMPUS_RATE': "22050", 'OPENCAMPUS_ECHO_CANCELLATION': "off", 'OPENCAMPUS_LANGUAGES': '["ja"]', 'OPENCAMPUS_VOLUME': "1"}
+    apply_settings(namespace, argv = ["main.py"], environ = environ)
+    assert namespace['RATE'] == 22050
+    assert namespace['ECHO_CANCELLATION'] is False
+    assert namespace['LANGUAGES'] == ["ja"]
+    assert namespace['VOLUME'] == 1.0 and isinstance(namespace['VOLUME'], float)
+
+@pytest.mark.parametrize("environ", [
+    {'OPENCAMPUS_RATE': "fast"},
+    {'OPENCAMPUS_RATE': "1.5"},
+    {'OPENCAMPUS_ECHO_CANCELLATION': "maybe"},
+    {'OPENCAMPUS_LANGUAGES': '"en"'},
+])
+def test_values_of_the_wrong_type_are_rejected(namespace, environ):
+    with pytest.raises(ValueError):
+        apply_settings(namespace, argv = ["main.py"], environ = environ)
+
+def test_file_values_of_the_wrong_type_are_rejected(namespace):
+    write_settings(namespace['SETTINGS_FILE'], {'RATE': "16000"})
+    with pytest.raises(ValueError):
+        apply_settings(namespace, argv = ["main.py"], environ = {})
+
+def test_unknown_settings_are_rejected(namespace):
+    with pytest.raises(KeyError):
+        apply_settings(namespace, argv = ["main.py", "--set", "RAET=16000"], environ = {})
+
+def test_set_without_a_value_is_rejected(namespace):
+    with pytest.raises(ValueError):
+        apply_settings(namespace, argv = ["main.py", "--set", "RATE"], environ = {})
+
+def test_a_missing_default_settings_file_is_ignored(namespace):
+    apply_settings(namespace, argv = ["main.py"], environ = {})
+
+def test_a_missing_explicit_settings_file_is_an_error(namespace, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        apply_settings(namespace, argv = ["main.py", "--settings", str(tmp_path / "missing.json")], environ = {})
+    with pytest.raises(FileNotFoundError):
+        apply_settings(namespace, argv = ["main.py"], environ = {'OPENCAMPUS_SETTINGS_FILE': str(tmp_path / "missing.json")})
+
+def test_derived_settings_follow_their_base(namespace):
+    apply_settings(namespace, argv = ["main.py", "--set", "RATE=22050", "--set", "ECHO_CANCELLATION=false"], environ = {})
+    assert namespace['PROMPT_SAMPLE_RATE'] == 22050
+    assert settings.sources['PROMPT_SAMPLE_RATE'] == "derived"
+    assert namespace['COUNTDOWN_OVERLAP'] is False
+
+def test_overridden_derived_settings_keep_their_value(namespace):
+    argv = ["main.py", "--set", "RATE=22050", "--set", "PROMPT_SAMPLE_RATE=48000"]
+    apply_settings(namespace, argv = argv, environ = {})
+    assert namespace['PROMPT_SAMPLE_RATE'] == 48000
+    assert settings.sources['PROMPT_SAMPLE_RATE'] == "cli"
+
+def test_describe_lists_the_sources(namespace):
+    apply_settings(namespace, argv = ["main.py", "--set", "RATE=22050"], environ = {})
+    lines = describe(namespace).splitlines()
+    assert "RATE = 22050  [cli]" in lines
+    assert "PROMPT_SAMPLE_RATE = 22050  [derived]" in lines
+
+def test_parse_cli_and_strip_cli():
+    argv = ["main.py", "--set", "RATE=22050", "shell", "--settings", "a.json", "--set", "VOLUME=1", "--adopt"]
+    assert parse_cli(argv) == ("a.json", ["RATE=22050", "VOLUME=1"])
+    assert strip_cli(argv) == ["main.py", "shell", "--adopt"]
+    # A dangling flag is not a settings flag
+    assert strip_cli(["main.py", "--set"]) == ["main.py", "--set"]
+
+def test_fingerprint_follows_the_file_and_the_environment(tmp_path):
+    path = tmp_path / "settings.json"
+    write_settings(path, {'RATE': 16000})
+    base = fingerprint(str(path), {'HOME': "/root"})
+    assert fingerprint(str(path), {'HOME': "/tmp"}) == base
+    assert fingerprint(str(path), {'OPENCAMPUS_RATE': "22050"}) != base
+    write_settings(path, {'RATE': 22050})
+    assert fingerprint(str(path), {'HOME': "/root"}) != base
@@ -0,0 +1,120 @@
+'''
+Tests of the routing, hedging and failover of the STEN endpoint pool, against the local mock servers.
+'''
+
+import time
+
+import pytest
+import requests
+
+from src.constant import STEN_HEDGE_DEFAULT_DELAY, STEN_HEDGE_MIN_SAMPLES
+from src.mock_sten import start_mock_server
+from src.tts_endpoints import EndpointPool
+
+HEADERS = {'Content-type': 'application/json'}
+
+
+@pytest.fixture
+def servers():
+    started = []
+    def start(delay: float = 0.0, fail: bool = False):
+        server = start_mock_server(delay = delay, fail = fail)
+        started.append(server)
+        return server
+    yield start
+    for server in started:
+        server.shutdown()
+
+def make_pool(*servers, hedge_delay: float = None) -> EndpointPool:
+    pool = EndpointPool([server.url for server in servers])
+    if hedge_delay is not None:
+        pool.hedge_delay = lambda endpoint: hedge_delay
+    return pool
+
+def test_requests_go_to_the_fastest_endpoint(servers):
+    slow, fast = servers(), servers()
+    pool = make_pool(slow, fast)
+    pool.endpoints[0].record(2.0)
+    pool.endpoints[1].record(0.5)
+
+    response = pool.post("{}", HEADERS)
+    assert response.json()['body']['audio_path'].startswith(f"http://127.0.0.1:{fast.server_port}/")
+    assert (slow.posts, fast.posts) == (0, 1)
+    assert pool.in_flight == 0
+
+def test_a_slow_request_is_hedged_on_the_next_endpoint(servers):
+    slow, fast = servers(delay = 1.0), servers()
+    pool = make_pool(slow, fast, hedge_delay = 0.1)
+
+    start_time = time.perf_counter()
+    response = pool.post("{}", HEADERS)
+    assert time.perf_counter() - start_time < 0.9
+    assert response.json()['body']['audio_path'].startswith(f"http://127.0.0.1:{fast.server_port}/")
+
+def test_a_fast_failure_fails_over_at_once(servers):
+    broken, working = servers(fail = True), servers()
+    pool = make_pool(broken, working, hedge_delay = 5.0)
+
+    start_time = time.perf_counter()
+    pool.post("{}", HEADERS)
+    assert time.perf_counter() - start_time < 2.0
+    assert working.posts == 1
+    assert not pool.endpoints[0].healthy and pool.endpoints[0].failures == 1
+    # The unhealthy endpoint is ranked last until it answers again
+    assert pool.ranked()[0] is pool.endpoints[1]
+
+def test_the_losing_leg_of_a_hedge_keeps_its_endpoint_healthy(servers):
+    slow, fast = servers(delay = 0.5, fail = True), servers()
+    pool = make_pool(slow, fast, hedge_delay = 0.1)
+
+    pool.post("{}", HEADERS)
+    # Let the losing leg fail after the hedge has answered
+    time.sleep(0.8)
+    assert pool.endpoints[0].failures == 1
+    assert pool.endpoints[0].healthy
+
+def test_the_last_error_is_raised_when_every_endpoint_fails(servers):
+    pool = make_pool(servers(fail = True), servers(fail = True), hedge_delay = 5.0)
+    with pytest.raises(requests.HTTPError):
+        pool.post("{}", HEADERS)
+    assert pool.status() == "offline"
+
+def test_an_unreachable_endpoint_is_marked_unhealthy(servers):
+    closed = servers()
+    closed.shutdown()
+    closed.server_close()
+    pool = make_pool(closed, servers(), hedge_delay = 5.0)
+    pool.post("{}", HEADERS)
+    assert not pool.endpoints[0].healthy
+
+def test_the_hedge_delay_is_the_p90_latency():
+    pool = EndpointPool(["http://127.0.0.1:9/"])
+    endpoint = pool.endpoints[0]
+    assert pool.hedge_delay(endpoint) == STEN_HEDGE_DEFAULT_DELAY
+    for latency in range(1, max(STEN_HEDGE_MIN_SAMPLES, 10) + 1):
+        endpoint.record(float(latency))
+    assert pool.hedge_delay(endpoint) == float(int(0.9 * len(endpoint.latencies)) + 1)
+
+def test_the_body_function_builds_a_new_body_for_every_attempt(servers):
+    broken, working = servers(fail = True), servers()
+    pool = make_pool(broken, working, hedge_delay = 5.0)
+    bodies = []
+    def body():
+        bodies.append(len(bodies))
+        return '{"attempt": %d}' % bodies[-1]
+
+    pool.post(body, HEADERS)
+    assert bodies == [0, 1]
+    assert working.last_body == b'{"attempt": 1}'
+
+def test_the_warm_up_stays_out_of_the_routing_statistics(servers):
+    working, broken = servers(), servers(fail = True)
+    pool = make_pool(working, broken)
+
+    latencies = pool.warm_up()
+    assert latencies[working.url] is not None and latencies[broken.url] is None
+    assert pool.endpoints[0].warm_up_latency is not None
+    assert pool.endpoints[0].ewma is None and len(pool.endpoints[0].latencies) == 0
+    assert pool.hedge_delay(pool.endpoints[0]) == STEN_HEDGE_DEFAULT_DELAY
+    # Idleness is counted from the warm-up
+    assert time.monotonic() - pool.last_activity < 1.0